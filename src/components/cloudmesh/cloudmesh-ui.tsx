@@ -7,6 +7,9 @@ import { useCloudmeshProgram, useCloudmeshJob } from './cloudmesh-data-access'
 import { toast } from 'sonner'
 import Editor from '@monaco-editor/react'
 
+// The title is a seed of the job's PDA (seeds = [b"job", owner, title]) and a seed holds at most 32 bytes
+const MAX_TITLE_BYTES = 32
+
 const CODE_SNIPPETS = {
   hello_world: {
     name: 'Hello World',
@@ -152,7 +155,8 @@ def lambda_handler(event, context):
 `)
   const [uploading, setUploading] = useState(false)
 
-  const isFormValid = title.trim() !== '' && codeCid.trim() !== ''
+  const titleBytes = new TextEncoder().encode(title).length
+  const isFormValid = title.trim() !== '' && codeCid.trim() !== '' && titleBytes <= MAX_TITLE_BYTES
 
   const uploadToPinata = async (code: string, filename: string): Promise<string> => {
     const PINATA_JWT = import.meta.env.VITE_PINATA_JWT || ''
@@ -336,6 +340,11 @@ if __name__ == "__main__":
                 onChange={(e) => setTitle(e.target.value)}
                 className="w-full px-4 py-3 bg-white border-2 border-blue-500/40 rounded-lg text-black text-base font-semibold placeholder-gray-500 focus:outline-none focus:border-blue-600 focus:ring-2 focus:ring-blue-500/20 transition-all shadow-sm"
               />
+              {titleBytes > MAX_TITLE_BYTES && (
+                <p className="text-xs font-semibold text-red-600">
+                  Title uses {titleBytes} of {MAX_TITLE_BYTES} bytes
+                </p>
+              )}
             </div>
 
             {/* Code Snippets */}
@@ -0,0 +1,125 @@
+import base64
+import codecs
+import json
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cid import b58encode
+
+CHUNK_SIZE = 64 * 1024
+# Response head up to the value of "result" or "error" ({"jsonrpc":"2.0","result":[...],"id":1})
+_HEAD = re.compile(r'\s*\{\s*(?:"(?:jsonrpc|id)"\s*:\s*(?:"[^"]*"|\d+|null)\s*,\s*)*"(result|error)"\s*:\s*')
+_SEPARATOR = re.compile(r'\s*([,\]])\s*')
+_WHITESPACE = re.compile(r'\s*')
+
+
+class RpcStreamError(Exception):
+    """The node answered the streamed request with a JSON-RPC error"""
+
+    def __init__(self, error: Dict):
+        super().__init__(f"{error.get('code')}: {error.get('message')}")
+        self.error = error
+
+
+def keyspace_slices(offset: int, prefix_bytes: int) -> List[Optional[Dict]]:
+    """memcmp filters splitting accounts by the `prefix_bytes` bytes at `offset` (256 ** n slices).
+
+    With the owner's offset, each slice holds the jobs of the owners whose
+    key starts with one prefix. [None] (no slicing) when `prefix_bytes` is 0.
+    """
+    if prefix_bytes <= 0:
+        return [None]
+    return [{"memcmp": {"offset": offset, "bytes": b58encode(value.to_bytes(prefix_bytes, "big"))}}
+            for value in range(256 ** prefix_bytes)]
+
+
+def iter_result_items(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """Parse a JSON-RPC response whose result is an array, yielding one element at a time.
+
+    Only the element being parsed and the unparsed rest of the current chunk
+    are held in memory, never the whole response. An element cut off by a
+    chunk boundary is retried once the buffer has at least doubled, so a large
+    element costs a few partial parses rather than one per chunk.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    ended = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, ended
+        for chunk in chunks:
+            if chunk:
+                buffer = buffer[pos:] + text_decoder.decode(chunk)
+                pos = 0
+                return True
+        if not ended:
+            ended = True
+            buffer = buffer[pos:] + text_decoder.decode(b"", final=True)
+            pos = 0
+        return False
+
+    while True:
+        head = _HEAD.match(buffer)
+        if head and head.end() < len(buffer):
+            break
+        if not more():
+            raise ValueError("response ended before its result")
+    pos = head.end()
+    if head.group(1) == "error":
+        while more():
+            pass
+        error, _ = decoder.raw_decode(buffer, pos)
+        raise RpcStreamError(error)
+    if buffer[pos] != "[":
+        raise ValueError("result is not an array")
+    pos += 1
+
+    first = True
+    need = 0
+    while True:
+        if (len(buffer) - pos < need or pos >= len(buffer)) and more():
+            continue
+        # Whitespace after "[" or a separator may arrive with the next chunk
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos >= len(buffer) and more():
+            continue
+        if first and buffer.startswith("]", pos):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            separator = _SEPARATOR.match(buffer, end)
+            if separator is None:
+                raise ValueError("separator cut off")
+        except ValueError:
+            if ended:
+                raise ValueError("malformed or truncated result")
+            need = max(CHUNK_SIZE, 2 * (len(buffer) - pos))
+            more()
+            continue
+        need = 0
+        first = False
+        yield item
+        pos = separator.end()
+        if separator.group(1) == "]":
+            return
+
+
+def stream_program_accounts(session, url: str, program_id: str, filters: Optional[List[Dict]] = None,
+                            data_slice: Optional[Dict] = None, commitment: Optional[str] = None,
+                            timeout: Optional[float] = None) -> Iterator[Tuple[str, bytes]]:
+    """getProgramAccounts over an httpx.Client, yielding (address, data) as the response arrives"""
+    config: Dict = {"encoding": "base64"}
+    if filters:
+        config["filters"] = filters
+    if data_slice:
+        config["dataSlice"] = data_slice
+    if commitment:
+        config["commitment"] = commitment
+    request = {"jsonrpc": "2.0", "id": 1, "method": "getProgramAccounts", "params": [program_id, config]}
+    with session.stream("POST", url, json=request, timeout=timeout) as response:
+        response.raise_for_status()
+        for item in iter_result_items(response.iter_bytes(CHUNK_SIZE)):
+            yield item["pubkey"], base64.b64decode(item["account"]["data"][0])
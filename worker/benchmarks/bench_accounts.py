@@ -0,0 +1,100 @@
+"""Peak memory of a full getProgramAccounts sweep, whole response vs streamed.
+
+Starts the fakes from benchmarks/fakes.py with ACCOUNTS job accounts, then
+runs each sweep in a fresh process and reports its time, pending jobs found,
+peak RSS and how far the peak rose above the process's RSS before the sweep:
+
+  response   solana-py get_program_accounts, the whole result decoded at once
+  stream     account_stream.stream_program_accounts, one account at a time
+  sliced     the same, one request per owner prefix (--slice-bytes, default 1)
+
+Usage: python3 benchmarks/bench_accounts.py [ACCOUNTS ...] [--pending-ratio F] [--slice-bytes N]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.dirname(HERE)
+SWEEPS = ("response", "stream", "sliced")
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_sweep(config: Dict):
+    """One sweep in this (fresh) process, printed as JSON"""
+    sys.path.insert(0, WORKER_DIR)
+    import httpx
+    from solana.rpc.api import Client
+    from solders.pubkey import Pubkey
+
+    from account_stream import keyspace_slices, stream_program_accounts
+    from job_decoder import OWNER_OFFSET, JobStatus, decode_job
+
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    pending = 0
+    if config["sweep"] == "response":
+        response = Client(config["rpc"], timeout=120).get_program_accounts(
+            Pubkey.from_string(config["program_id"]), encoding="base64")
+        for account_info in response.value or []:
+            job = decode_job(bytes(account_info.account.data))
+            pending += bool(job and job["status"] == JobStatus.PENDING)
+    else:
+        prefix_bytes = config["slice_bytes"] if config["sweep"] == "sliced" else 0
+        with httpx.Client() as session:
+            for keyspace in keyspace_slices(OWNER_OFFSET, prefix_bytes):
+                for _, data in stream_program_accounts(session, config["rpc"], config["program_id"],
+                                                       [keyspace] if keyspace else None, timeout=120):
+                    job = decode_job(data)
+                    pending += bool(job and job["status"] == JobStatus.PENDING)
+    elapsed = time.perf_counter() - start
+    peak = max_rss_mb()
+    print(json.dumps({"seconds": elapsed, "pending": pending, "peak_mb": peak, "growth_mb": peak - baseline}))
+
+
+def bench(accounts: int, args):
+    fakes = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fakes.py"), str(accounts), str(args.pending_ratio)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        urls = json.loads(fakes.stdout.readline())
+        print(f"{accounts} accounts ({urls['pending']} pending)")
+        for sweep in SWEEPS:
+            config = {"sweep": sweep, "rpc": urls["rpc"], "program_id": urls["program_id"],
+                      "slice_bytes": args.slice_bytes}
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--sweep", json.dumps(config)],
+                                 stdout=subprocess.PIPE, text=True, check=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            label = sweep if sweep != "sliced" else f"sliced ({256 ** args.slice_bytes} requests)"
+            ok = "" if result["pending"] == urls["pending"] else f"  (found {result['pending']})"
+            print(f"  {label:<24} {result['seconds']:7.2f} s   peak RSS {result['peak_mb']:7.1f} MB"
+                  f"   +{result['growth_mb']:7.1f} MB during the sweep{ok}")
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("accounts", type=int, nargs="*", default=[100_000])
+    parser.add_argument("--pending-ratio", type=float, default=0.1)
+    parser.add_argument("--slice-bytes", type=int, default=1)
+    parser.add_argument("--sweep", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.sweep:
+        run_sweep(json.loads(args.sweep))
+        return
+    for accounts in args.accounts:
+        bench(accounts, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Compare the eager deserialize_job with the lazy job_decoder paths.
+
+Usage: python3 benchmarks/bench_decoder.py [ACCOUNTS] [PENDING_RATIO]
+"""
+import sys
+import time
+
+from fixtures import make_accounts
+
+import main
+from job_decoder import JobStatus, decode_job, pending_jobs
+
+
+def timed(label: str, count: int, fn):
+    start = time.perf_counter()
+    found = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<38} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} accounts/s  ({found} pending)")
+    return elapsed
+
+
+def run(count: int = 100_000, pending_ratio: float = 0.1):
+    accounts = make_accounts(count, pending_ratio)
+    blobs = [data for _, data in accounts]
+    buffer = b"".join(blobs)
+    print(f"{count:,} accounts, {pending_ratio:.0%} pending")
+
+    def eager():
+        return sum(1 for data in blobs
+                   if (job := main.deserialize_job(data)) and job["status"] == JobStatus.PENDING)
+
+    def lazy():
+        return sum(1 for data in blobs
+                   if (job := decode_job(data)) and job.status == JobStatus.PENDING)
+
+    def lazy_materialized():
+        return len([job.to_dict() for data in blobs
+                    if (job := decode_job(data)) and job.status == JobStatus.PENDING])
+
+    def batch():
+        return len(pending_jobs(buffer))
+
+    base = timed("deserialize_job (eager dicts)", count, eager)
+    for label, fn in (("decode_job (status only)", lazy),
+                      ("decode_job + to_dict for pending", lazy_materialized),
+                      ("pending_jobs (one buffer)", batch)):
+        elapsed = timed(label, count, fn)
+        print(f"  {'':<38} {base / elapsed:9.1f}x vs eager")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.1)
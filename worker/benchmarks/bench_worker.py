@@ -0,0 +1,281 @@
+"""End-to-end worker throughput against local fakes (no network, no AWS).
+
+Each run starts the fakes from benchmarks/fakes.py in one process and the
+worker (main.main, or process_job one job at a time with --serial) in
+another, waits until every pending job is completed on the fake chain and
+reports jobs/s, p50/p99 per-stage queue wait and run time (from the
+worker's TRACE_FILE) and the worker's peak RSS.
+
+With --workers N, N worker processes split the accounts into shards
+(SHARD_INDEX per worker, or leased from a shared file with --leases);
+--kill-after S kills the first one mid-run so the others must take over.
+
+With --rpc-nodes N the chain is served from N RPC URLs, pooled by the
+worker; --slow-rpc-ms slows the first one down and --rpc-rate-limit makes
+every node answer 429 above that many requests per second.
+
+--result-cache-ttl S turns on result memoization (one cache file shared by
+the workers); the fixtures reuse a handful of code blobs, so most jobs are
+answered from it.
+
+--pinata-down-s S makes Pinata fail every request for the first S seconds,
+so results wait in the worker's pin spool and jobs complete once pinned.
+
+Usage: python3 benchmarks/bench_worker.py [BACKLOG ...] [--pending-ratio F] [--latency-ms N]
+       [--jitter-ms N] [--fail-rate F] [--lambda-ms N] [--executor lambda|local] [--serial]
+       [--workers N] [--shards N] [--leases] [--lease-ttl S] [--kill-after S]
+       [--rpc-nodes N] [--slow-rpc-ms N] [--rpc-rate-limit N] [--result-cache-ttl S]
+       [--pinata-down-s S]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.dirname(HERE)
+STAGES = ("fetch", "execute", "upload", "complete")
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rpc_stats(url: str) -> Dict:
+    response = requests.post(url, json={"jsonrpc": "2.0", "id": 1, "method": "benchStats"}, timeout=10)
+    return response.json()["result"]
+
+
+def run_worker(config: Dict):
+    """Worker side of one run (a fresh process: main keeps per-process state)"""
+    sys.path.insert(0, WORKER_DIR)
+    sys.path.insert(0, HERE)
+    from solders.keypair import Keypair
+
+    import main
+    from executors import ExecutorRouter, LambdaExecutor, LocalPoolExecutor
+    from fakes import Faults, FakeLambda
+
+    keypair_path = os.path.join(config["tmp"], "keypair.json")
+    with open(keypair_path, "w") as f:
+        json.dump(list(bytes(Keypair())), f)
+
+    if config["executor"] == "local":
+        def build_executor():
+            return ExecutorRouter(LocalPoolExecutor(main.LAMBDA_CODE, workers=main.LOCAL_EXECUTOR_WORKERS), None)
+    else:
+        fake = FakeLambda(main.LAMBDA_CODE, Faults(config["lambda_ms"] / 1000, fail_rate=config["fail_rate"]),
+                          timeout=main.LAMBDA_SETTINGS["Timeout"])
+
+        class Clients:
+            lambda_client = fake
+
+        def build_executor():
+            return ExecutorRouter(None, LambdaExecutor(Clients(), "bench", compress=main.LAMBDA_COMPRESS,
+                                                       job_timeout=main.LAMBDA_JOB_TIMEOUT))
+    main.build_executor = build_executor
+
+    pending = rpc_stats(config["rpc"])["pending"]
+    deadline = time.time() + config["timeout"]
+    start = time.time()
+    if config["serial"]:
+        timings: Dict = {}
+
+        def timed(name, stage):
+            def run(ctx):
+                began = time.time()
+                try:
+                    return stage(ctx)
+                finally:
+                    timings[name] = {"wait": 0.0, "run": round(time.time() - began, 6)}
+            return run
+
+        main.PIPELINE_STAGES = [(name, timed(name, stage), n) for name, stage, n in main.PIPELINE_STAGES]
+        main.executor = build_executor()
+        worker = main.load_keypair(keypair_path)
+        with open(config["trace"], "a", encoding="utf-8") as traces:
+            for job in main.fetch_pending_jobs(config["program_id"]):
+                if time.time() > deadline:
+                    break
+                timings.clear()
+                began = time.time()
+                ok = main.process_job(job, config["program_id"], worker)
+                traces.write(json.dumps({"ok": ok, "total_s": time.time() - began, "stages": timings}) + "\n")
+        main.executor.close()
+        main.confirmations.stop()
+        main.blockhashes.stop()
+    else:
+        thread = threading.Thread(target=main.main, args=(config["program_id"], keypair_path, 1), daemon=True)
+        thread.start()
+        while time.time() < deadline and thread.is_alive():
+            if rpc_stats(config["rpc"])["completed"] >= pending:
+                break
+            time.sleep(0.1)
+        main.running = False
+        thread.join(timeout=90)
+
+    stats = rpc_stats(config["rpc"])
+    finished = stats["last_completion"] or time.time()
+    print(json.dumps({
+        "pending": pending,
+        "completed": stats["completed"],
+        "duplicates": stats["duplicates"],
+        "transactions": stats["transactions"],
+        "seconds": max(finished - start, 1e-9),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }), flush=True)
+
+
+def run_backlog(backlog: int, args) -> Dict:
+    """Start the fakes and the workers for one backlog size; returns the run summary"""
+    fakes_cmd = [
+        sys.executable, os.path.join(HERE, "fakes.py"), str(backlog), str(args.pending_ratio),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--fail-rate", str(args.fail_rate),
+        "--rpc-nodes", str(args.rpc_nodes), "--slow-rpc-ms", str(args.slow_rpc_ms),
+        "--rpc-rate-limit", str(args.rpc_rate_limit), "--pinata-down-s", str(args.pinata_down_s),
+    ]
+    fakes = subprocess.Popen(fakes_cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        urls = json.loads(fakes.stdout.readline())
+        with tempfile.TemporaryDirectory() as tmp:
+            workers = []
+            for index in range(args.workers):
+                directory = os.path.join(tmp, f"worker-{index}")
+                os.makedirs(directory)
+                config = {
+                    "rpc": urls["rpc"], "program_id": urls["program_id"], "tmp": directory,
+                    "trace": os.path.join(directory, "trace.jsonl"),
+                    "serial": args.serial, "executor": args.executor, "lambda_ms": args.lambda_ms,
+                    "fail_rate": args.fail_rate, "timeout": args.timeout,
+                }
+                env = dict(
+                    os.environ,
+                    SOLANA_RPC_URL=urls["rpc"], SOLANA_RPC_URLS=",".join(urls["rpc_urls"]),
+                    IPFS_GATEWAYS=urls["gateway"],
+                    PINATA_API_URL=urls["pinata"], PINATA_JWT="bench",
+                    AWS_ACCESS_KEY_ID="", AWS_SECRET_ACCESS_KEY="",
+                    DISCOVERY_SUBSCRIBE="0", METRICS_PORT="0", IPFS_CACHE_DIR="",
+                    LOG_LEVEL=args.log_level, TRACE_FILE=config["trace"],
+                    JOURNAL_PATH=os.path.join(directory, "journal.db"),
+                    CONFIRM_COMMITMENT="finalized",
+                    SHARD_COUNT=str(args.shards or args.workers), SHARD_INDEX=str(index),
+                    SHARD_LEASE_PATH=os.path.join(tmp, "leases.db") if args.leases else "",
+                    SHARD_LEASE_TTL=str(args.lease_ttl),
+                    RESULT_CACHE_TTL=str(args.result_cache_ttl),
+                    RESULT_CACHE_PATH=os.path.join(tmp, "results.db"),
+                    PIN_SPOOL_DIR=os.path.join(directory, "pin-spool"),
+                )
+                process = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+                    cwd=WORKER_DIR, env=env, stdout=subprocess.PIPE, text=True,
+                )
+                workers.append((process, config))
+            if args.kill_after:
+                time.sleep(args.kill_after)
+                workers[0][0].kill()
+            summaries, traces = [], []
+            for process, config in workers:
+                output = process.communicate()[0].strip().splitlines()
+                if process.returncode == 0 and output:
+                    summaries.append(json.loads(output[-1]))
+                if os.path.exists(config["trace"]):
+                    with open(config["trace"], encoding="utf-8") as f:
+                        traces.extend(json.loads(line) for line in f if line.strip())
+        stats = rpc_stats(urls["rpc"])
+        pinata = requests.get(urls["pinata"] + "/benchStats", timeout=10).json()
+    finally:
+        fakes.kill()
+        fakes.wait()
+    return {
+        "pending": stats["pending"],
+        "completed": stats["completed"],
+        "duplicates": stats["duplicates"],
+        "transactions": stats["transactions"],
+        "rate_limited": stats["rate_limited"],
+        "pinata": pinata,
+        "seconds": max(summary["seconds"] for summary in summaries),
+        "max_rss_kb": max(summary["max_rss_kb"] for summary in summaries),
+        "workers": len(summaries),
+        "traces": traces,
+    }
+
+
+def report(backlog: int, summary: Dict):
+    traces = summary["traces"]
+    completed = summary["completed"]
+    print(f"\n{backlog:,} accounts: {completed}/{summary['pending']} pending jobs completed "
+          f"in {summary['seconds']:.2f}s = {completed / summary['seconds']:,.1f} jobs/s, "
+          f"{summary['transactions']} transactions, peak RSS {summary['max_rss_kb'] / 1024:,.1f} MB"
+          + (f" (largest of {summary['workers']} workers)" if summary["workers"] > 1 else ""))
+    if summary["duplicates"]:
+        print(f"  ⚠ {summary['duplicates']} duplicate completions")
+    if summary["rate_limited"]:
+        print(f"  {summary['rate_limited']} RPC requests answered 429")
+    pinata = summary["pinata"]
+    print(f"  {pinata['files']} results pinned in {pinata['pins']} Pinata requests "
+          f"({pinata['requests'] - pinata['pins']} failed)")
+    cached = [t for t in traces if t.get("cached")]
+    if cached:
+        saved = sum(t["execution_ms"] or 0 for t in cached)
+        print(f"  {len(cached)} results reused from the result cache, {saved:,} ms of execution saved")
+    print(f"  {'stage':<10} {'wait p50':>10} {'wait p99':>10} {'run p50':>10} {'run p99':>10}   (ms)")
+    for stage in STAGES:
+        waits = [t["stages"][stage]["wait"] for t in traces if stage in t.get("stages", {})]
+        runs = [t["stages"][stage]["run"] for t in traces if stage in t.get("stages", {})]
+        print(f"  {stage:<10} {percentile(waits, 0.5) * 1000:10.1f} {percentile(waits, 0.99) * 1000:10.1f} "
+              f"{percentile(runs, 0.5) * 1000:10.1f} {percentile(runs, 0.99) * 1000:10.1f}")
+    totals = [t["total_s"] for t in traces]
+    print(f"  {'job':<10} {'':>10} {'':>10} {percentile(totals, 0.5) * 1000:10.1f} "
+          f"{percentile(totals, 0.99) * 1000:10.1f}   ({sum(1 for t in traces if not t['ok'])} failed)")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("backlogs", type=int, nargs="*", default=[10, 100, 1000, 10_000, 100_000])
+    parser.add_argument("--pending-ratio", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="per RPC, gateway and Pinata call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--lambda-ms", type=float, default=50.0, help="added to every Lambda invoke")
+    parser.add_argument("--executor", choices=("lambda", "local"), default="lambda")
+    parser.add_argument("--serial", action="store_true", help="process_job one job at a time instead of main()")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes sharing the job space")
+    parser.add_argument("--shards", type=int, default=0, help="SHARD_COUNT (default: one per worker)")
+    parser.add_argument("--leases", action="store_true", help="lease shards instead of pinning one per worker")
+    parser.add_argument("--lease-ttl", type=float, default=6.0)
+    parser.add_argument("--kill-after", type=float, default=0.0, help="SIGKILL the first worker after this long")
+    parser.add_argument("--rpc-nodes", type=int, default=1, help="RPC URLs the worker pools")
+    parser.add_argument("--slow-rpc-ms", type=float, default=0.0, help="extra latency of the first RPC node")
+    parser.add_argument("--rpc-rate-limit", type=float, default=0.0, help="requests/s per RPC node before 429")
+    parser.add_argument("--pinata-down-s", type=float, default=0.0, help="Pinata fails every request this long")
+    parser.add_argument("--result-cache-ttl", type=float, default=0.0, help="RESULT_CACHE_TTL (0 = off)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="per backlog, seconds")
+    parser.add_argument("--log-level", default="error")
+    args = parser.parse_args()
+
+    mode = "serial process_job" if args.serial else "pipelined main()"
+    if args.workers > 1:
+        mode += f" x{args.workers} workers" + (" (leased shards)" if args.leases else "")
+    print(f"{mode}, {args.executor} executor, {args.pending_ratio:.0%} pending, "
+          f"{args.latency_ms:g}±{args.jitter_ms:g} ms service latency, {args.fail_rate:.0%} failures")
+    for backlog in args.backlogs:
+        report(backlog, run_backlog(backlog, args))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        run_worker(json.loads(sys.argv[2]))
+    else:
+        run()
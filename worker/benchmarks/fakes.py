@@ -0,0 +1,604 @@
+"""Local stand-ins for the services the worker talks to, for offline benchmarks.
+
+FakeSolanaRPC serves Job accounts over JSON-RPC and applies complete_job
+instructions sent to it, and RPCNode serves the same chain from another URL
+(with its own latency and rate limit); FakeGateway serves code blobs by CID; FakePinata
+pins files (or JSON) and answers with their real CIDv0; FakeLambda runs LAMBDA_CODE
+in-process behind the boto3 invoke() interface. Each takes a latency (plus
+jitter) and a failure rate. FakeSolanaWS is the RPC websocket, pushing the
+account and log notifications a test asks it to.
+
+Run as a script to serve the HTTP fakes from a separate process:
+
+    python3 benchmarks/fakes.py ACCOUNTS [PENDING_RATIO] [--latency-ms N] [--fail-rate F]
+        [--rpc-nodes N] [--slow-rpc-ms N] [--rpc-rate-limit N] [--pinata-down-s S]
+
+It prints one JSON line with the URLs and serves until killed.
+"""
+import argparse
+import base64
+import email
+import hashlib
+import io
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from fixtures import make_accounts, make_job_account
+
+from solders.hash import Hash
+from solders.pubkey import Pubkey
+from solders.transaction import Transaction
+
+from cid import b58decode, cid_v0, directory_cid_v0
+from job_decoder import JOB_ACCOUNT_SIZE, JobStatus, decode_job
+
+COMPLETE_JOB_DISCRIMINATOR = hashlib.sha256(b"global:complete_job").digest()[:8]
+SLOT_TIME = 0.4
+
+
+class Faults:
+    """Latency (seconds, plus uniform jitter) and failure injection shared by the fakes"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+            time.sleep(self.latency + extra)
+
+    def fails(self) -> bool:
+        if not self.fail_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.fail_rate
+
+
+class RateLimit:
+    """Requests per second a fake node serves before answering 429 (0 = unlimited)"""
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = rate
+        self.rejected = 0
+        self._second = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.rate:
+            return True
+        with self._lock:
+            second = int(time.time())
+            if second != self._second:
+                self._second, self._count = second, 0
+            self._count += 1
+            if self._count <= self.rate:
+                return True
+            self.rejected += 1
+            return False
+
+
+def code_blobs(count: int = 20) -> Dict[str, bytes]:
+    """Small job programs keyed by their real CIDv0"""
+    blobs = {}
+    for i in range(count):
+        code = f"total = sum(range({1000 * (i + 1)}))\nprint('job program {i}:', total)\n".encode()
+        blobs[cid_v0(code)] = code
+    return blobs
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients killed mid-request by the benchmarks
+
+
+class _Server:
+    def __init__(self, handler, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = _QuietHTTPServer((host, port), handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _quiet_handler(base):
+    class Handler(base):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status: int, body: bytes, content_type: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+    return Handler
+
+
+class FakeSolanaRPC(_Server):
+    """JSON-RPC node holding one program's Job accounts.
+
+    Supports the calls the worker makes. A sent transaction lands
+    `confirm_delay` seconds later: its complete_job instructions are applied
+    (status COMPLETED, result CID and cost written into the account) and its
+    signature reports `finalized`. benchStats is an extra method for the harness.
+    """
+
+    def __init__(self, program_id: Pubkey, accounts, faults: Optional[Faults] = None,
+                 confirm_delay: float = 0.0, rate_limit: float = 0.0, **server):
+        self.program_id = program_id
+        self.faults = faults or Faults()
+        self.limit = RateLimit(rate_limit)
+        self.confirm_delay = confirm_delay
+        self.accounts: Dict[str, bytes] = {str(pubkey): data for pubkey, data in accounts}
+        self.pending = sum(1 for data in self.accounts.values() if decode_job(data).status == JobStatus.PENDING)
+        self.completed = 0
+        self.duplicates = 0
+        self.transactions = 0
+        self.first_completion: Optional[float] = None
+        self.last_completion: Optional[float] = None
+        self.signatures: Dict[str, float] = {}
+        self._landing: List = []  # (due, [(address, result_cid, cost)]) not yet applied
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.nodes: List["RPCNode"] = []
+        super().__init__(_rpc_handler(self, self.faults, self.limit), **server)
+
+    def slot(self) -> int:
+        return 1000 + int((time.time() - self.started) / SLOT_TIME)
+
+    def handle(self, request: Dict, faults: Optional[Faults] = None) -> Dict:
+        faults = faults or self.faults
+        faults.delay()
+        self._land()
+        method = request.get("method")
+        if method != "benchStats" and faults.fails():
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32000, "message": "injected failure"}}
+        try:
+            result = getattr(self, f"rpc_{method}")(*request.get("params", []))
+        except AttributeError:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32601, "message": f"method not found: {method}"}}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"),
+                    "error": {"code": -32603, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    def _context(self) -> Dict:
+        return {"slot": self.slot(), "apiVersion": "1.18.0"}
+
+    def _account(self, data: bytes, data_slice: Optional[Dict] = None) -> Dict:
+        if data_slice:
+            data = data[data_slice["offset"]:data_slice["offset"] + data_slice["length"]]
+        return {
+            "data": [base64.b64encode(data).decode(), "base64"],
+            "executable": False,
+            "lamports": 3_000_000,
+            "owner": str(self.program_id),
+            "rentEpoch": 0,
+            "space": JOB_ACCOUNT_SIZE,
+        }
+
+    @staticmethod
+    def _matches(data: bytes, filters: List[Dict]) -> bool:
+        for f in filters or []:
+            if "dataSize" in f and len(data) != f["dataSize"]:
+                return False
+            if "memcmp" in f:
+                memcmp = f["memcmp"]
+                raw = b58decode(memcmp["bytes"]) if memcmp.get("encoding", "base58") == "base58" \
+                    else base64.b64decode(memcmp["bytes"])
+                if data[memcmp["offset"]:memcmp["offset"] + len(raw)] != raw:
+                    return False
+        return True
+
+    def rpc_getVersion(self, *_):
+        return {"solana-core": "1.18.0", "feature-set": 0}
+
+    def rpc_getSlot(self, *_):
+        return self.slot()
+
+    def rpc_getBlockHeight(self, *_):
+        return self.slot()
+
+    def rpc_getLatestBlockhash(self, *_):
+        digest = hashlib.sha256(str(self.slot()).encode()).digest()
+        return {"context": self._context(),
+                "value": {"blockhash": str(Hash(digest)), "lastValidBlockHeight": self.slot() + 150}}
+
+    def rpc_getProgramAccounts(self, program, config=None):
+        config = config or {}
+        with self._lock:
+            items = list(self.accounts.items())
+        return [
+            {"pubkey": pubkey, "account": self._account(data, config.get("dataSlice"))}
+            for pubkey, data in items if self._matches(data, config.get("filters"))
+        ]
+
+    def rpc_getMultipleAccounts(self, pubkeys, config=None):
+        config = config or {}
+        with self._lock:
+            found = [self.accounts.get(pubkey) for pubkey in pubkeys]
+        return {"context": self._context(),
+                "value": [None if data is None else self._account(data, config.get("dataSlice"))
+                          for data in found]}
+
+    def rpc_getAccountInfo(self, pubkey, config=None):
+        with self._lock:
+            data = self.accounts.get(pubkey)
+        return {"context": self._context(), "value": None if data is None else self._account(data)}
+
+    def rpc_sendTransaction(self, encoded, config=None):
+        tx = Transaction.from_bytes(base64.b64decode(encoded))
+        keys = tx.message.account_keys
+        completions = []
+        for ix in tx.message.instructions:
+            data = bytes(ix.data)
+            if keys[ix.program_id_index] != self.program_id or not data.startswith(COMPLETE_JOB_DISCRIMINATOR):
+                continue
+            length = struct.unpack_from("<I", data, 8)[0]
+            result_cid = data[12:12 + length].decode()
+            cost = struct.unpack_from("<Q", data, 12 + length)[0]
+            completions.append((str(keys[ix.accounts[0]]), result_cid, cost))
+        signature = str(tx.signatures[0])
+        with self._lock:
+            self.transactions += 1
+            if signature not in self.signatures:
+                self.signatures[signature] = time.time()
+                self._landing.append((time.time() + self.confirm_delay, completions))
+        self._land()
+        return signature
+
+    def _land(self):
+        """Apply the complete_job instructions of transactions whose confirm delay has passed"""
+        now = time.time()
+        with self._lock:
+            due = [completions for at, completions in self._landing if at <= now]
+            self._landing = [(at, completions) for at, completions in self._landing if at > now]
+            for completions in due:
+                for address, result_cid, cost in completions:
+                    job = decode_job(self.accounts[address])
+                    if job.status != JobStatus.PENDING:
+                        self.duplicates += 1
+                        continue
+                    self.accounts[address] = make_job_account(
+                        owner=bytes(self.accounts[address][8:40]), title=job.title, code_cid=job.code_cid,
+                        result_cid=result_cid, start_time=job.start_time, end_time=int(now),
+                        status=JobStatus.COMPLETED, job_type=job.job_type, cost=cost, cost_paid=False,
+                        bump=job.bump,
+                    )
+                    self.completed += 1
+                    self.first_completion = self.first_completion or now
+                    self.last_completion = now
+
+    def rpc_getSignatureStatuses(self, signatures, config=None):
+        now = time.time()
+        with self._lock:
+            sent = [self.signatures.get(signature) for signature in signatures]
+        value = []
+        for sent_at in sent:
+            if sent_at is None or now - sent_at < self.confirm_delay:
+                value.append(None)
+            else:
+                value.append({"slot": self.slot(), "confirmations": None, "err": None,
+                              "status": {"Ok": None}, "confirmationStatus": "finalized"})
+        return {"context": self._context(), "value": value}
+
+    def rpc_benchStats(self, *_):
+        with self._lock:
+            return {"pending": self.pending, "completed": self.completed,
+                    "duplicates": self.duplicates, "transactions": self.transactions,
+                    "first_completion": self.first_completion, "last_completion": self.last_completion,
+                    "rate_limited": self.limit.rejected + sum(node.limit.rejected for node in self.nodes)}
+
+
+class RPCNode(_Server):
+    """Another RPC node in front of the same FakeSolanaRPC chain, with its own faults and rate limit"""
+
+    def __init__(self, chain: FakeSolanaRPC, faults: Optional[Faults] = None, rate_limit: float = 0.0, **server):
+        self.chain = chain
+        self.faults = faults or Faults()
+        self.limit = RateLimit(rate_limit)
+        chain.nodes.append(self)
+        super().__init__(_rpc_handler(chain, self.faults, self.limit), **server)
+
+
+def _rpc_handler(chain: FakeSolanaRPC, faults: Faults, limit: RateLimit):
+    class Handler(_quiet_handler(BaseHTTPRequestHandler)):
+        def do_POST(self):
+            request = json.loads(self.read_body())
+            if request.get("method") != "benchStats" and not limit.allow():
+                self.reply(429, b'{"error": "Too many requests"}', headers={"Retry-After": "1"})
+                return
+            self.reply(200, json.dumps(chain.handle(request, faults)).encode())
+    return Handler
+
+
+class FakeSolanaWS:
+    """RPC websocket stand-in for programSubscribe and logsSubscribe.
+
+    Acknowledges both subscriptions like a node does, then pushes the account
+    writes and program logs handed to push_account()/push_logs() to every
+    subscribed connection. drop() closes the open connections, as a node
+    restart would.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.url = ""
+        self.connections = 0
+        self.requests: List[Dict] = []
+        self._subscribed: Dict = {}  # websocket -> {method: subscription id}
+        self._ids = iter(range(1, 1 << 31))
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread:
+            self._thread.join(5)
+
+    def subscribed(self) -> int:
+        """Connections with both subscriptions live"""
+        return sum(1 for methods in list(self._subscribed.values()) if len(methods) == 2)
+
+    def push_account(self, pubkey: str, data: bytes, slot: int = 1):
+        self._push("programSubscribe", "programNotification", {
+            "context": {"slot": slot},
+            "value": {"pubkey": pubkey, "account": {
+                "data": [base64.b64encode(data).decode(), "base64"], "executable": False,
+                "lamports": 1_000_000, "owner": "", "rentEpoch": 0, "space": len(data)}},
+        })
+
+    def push_logs(self, logs: List[str], slot: int = 1, err=None, signature: str = "sig"):
+        self._push("logsSubscribe", "logsNotification", {
+            "context": {"slot": slot}, "value": {"signature": signature, "err": err, "logs": logs},
+        })
+
+    def drop(self):
+        for ws in list(self._subscribed):
+            self._loop.call_soon_threadsafe(lambda ws=ws: self._loop.create_task(ws.close()))
+
+    def _push(self, method: str, notification: str, result: Dict):
+        for ws, methods in list(self._subscribed.items()):
+            if method in methods:
+                message = json.dumps({"jsonrpc": "2.0", "method": notification,
+                                      "params": {"result": result, "subscription": methods[method]}})
+                self._loop.call_soon_threadsafe(lambda ws=ws, m=message: self._loop.create_task(ws.send(m)))
+
+    def _run(self):
+        import asyncio
+        import websockets
+
+        async def handler(ws):
+            self.connections += 1
+            methods = self._subscribed[ws] = {}
+            try:
+                async for message in ws:
+                    request = json.loads(message)
+                    self.requests.append(request)
+                    subscription = next(self._ids)
+                    methods[request["method"]] = subscription
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "result": subscription, "id": request["id"]}))
+            except websockets.ConnectionClosed:
+                pass
+            finally:
+                self._subscribed.pop(ws, None)
+
+        async def serve():
+            self._server = await websockets.serve(handler, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self.url = f"ws://{self.host}:{self.port}"
+            self._ready.set()
+            await self._server.wait_closed()
+
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(serve())
+        finally:
+            self._loop.close()
+
+
+class FakeGateway(_Server):
+    """IPFS gateway serving /ipfs/<cid> from a dict of blobs"""
+
+    def __init__(self, blobs: Dict[str, bytes], faults: Optional[Faults] = None, **server):
+        self.blobs = blobs
+        self.faults = faults or Faults()
+        self.requests = 0
+        gateway = self
+
+        class Handler(_quiet_handler(BaseHTTPRequestHandler)):
+            def do_GET(self):
+                gateway.requests += 1
+                gateway.faults.delay()
+                cid = self.path.rsplit("/", 1)[-1]
+                if gateway.faults.fails():
+                    self.reply(502, b"injected failure", "text/plain")
+                elif cid in gateway.blobs:
+                    self.reply(200, gateway.blobs[cid], "application/octet-stream")
+                else:
+                    self.reply(404, b"not found", "text/plain")
+
+        super().__init__(Handler, **server)
+
+    @property
+    def prefix(self) -> str:
+        return self.url + "/ipfs/"
+
+
+def multipart_files(content_type: str, body: bytes) -> List[Tuple[str, bytes]]:
+    """(filename, content) of the "file" parts of a multipart/form-data body"""
+    message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    files = [(part.get_filename() or "", part.get_payload(decode=True)) for part in message.get_payload()
+             if part.get_param("name", header="content-disposition") == "file"]
+    if not files:
+        raise ValueError("no file part")
+    return files
+
+
+class FakePinata(_Server):
+    """Pinata pinFileToIPFS and pinJSONToIPFS endpoints; answers with the real CIDv0 of what it pinned.
+
+    Several files under one folder ("results/a.json", ...) are pinned as a
+    directory, like Pinata does. Every request fails for the first `down_s`
+    seconds. GET /benchStats reports requests, pins and bytes.
+    """
+
+    def __init__(self, faults: Optional[Faults] = None, down_s: float = 0.0, **server):
+        self.faults = faults or Faults()
+        self.down_until = time.time() + down_s
+        self.requests = 0
+        self.pins = 0
+        self.files = 0
+        self.bytes = 0
+        self.pinned = set()
+        pinata = self
+
+        class Handler(_quiet_handler(BaseHTTPRequestHandler)):
+            def do_GET(self):
+                self.reply(200, json.dumps({
+                    "requests": pinata.requests, "pins": pinata.pins, "files": pinata.files,
+                    "bytes": pinata.bytes, "unique": len(pinata.pinned),
+                }).encode())
+
+            def do_POST(self):
+                body = self.read_body()
+                pinata.requests += 1
+                pinata.faults.delay()
+                if pinata.faults.fails() or time.time() < pinata.down_until:
+                    self.reply(500, b'{"error": "injected failure"}')
+                    return
+                if self.path.endswith("/pinFileToIPFS"):
+                    files = multipart_files(self.headers["Content-Type"], body)
+                else:
+                    files = [("", json.dumps(json.loads(body)["pinataContent"], sort_keys=True).encode())]
+                if len(files) == 1 and "/" not in files[0][0]:
+                    cid = cid_v0(files[0][1])
+                else:
+                    cid = directory_cid_v0([(name.split("/", 1)[-1], content) for name, content in files])
+                pinata.pins += 1
+                pinata.files += len(files)
+                pinata.bytes += sum(len(content) for _, content in files)
+                pinata.pinned.update(cid_v0(content) for _, content in files)
+                self.reply(200, json.dumps({
+                    "IpfsHash": cid, "PinSize": sum(len(content) for _, content in files),
+                    "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                }).encode())
+
+        super().__init__(Handler, **server)
+
+
+class FakeLambda:
+    """boto3 Lambda client stand-in that runs LAMBDA_CODE in this process.
+
+    The handler redirects the process-wide stdout while a job runs, so calls
+    into it are serialized; the injected latency is applied outside that lock
+    and overlaps between concurrent invokes, like separate containers.
+    """
+
+    def __init__(self, handler_source: str, faults: Optional[Faults] = None, timeout: float = 30.0):
+        namespace = {"__name__": "lambda_function"}
+        exec(compile(handler_source, "lambda_function.py", "exec"), namespace)
+        self.handler = namespace["lambda_handler"]
+        self.faults = faults or Faults()
+        self.timeout = timeout
+        self.invocations = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, FunctionName: str, InvocationType: str = "RequestResponse", Payload: str = "{}"):
+        self.faults.delay()
+        if self.faults.fails():
+            raise RuntimeError("injected Lambda failure")
+        deadline = time.time() + self.timeout
+
+        class Context:
+            @staticmethod
+            def get_remaining_time_in_millis():
+                return int((deadline - time.time()) * 1000)
+
+        with self._lock:
+            self.invocations += 1
+            response = self.handler(json.loads(Payload), Context())
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(response).encode())}
+
+
+def build_accounts(count: int, pending_ratio: float, blobs: Dict[str, bytes], seed: int = 7):
+    """Synthetic accounts whose code CIDs point at `blobs`"""
+    return make_accounts(count, pending_ratio, seed=seed, code_cids=sorted(blobs))
+
+
+def serve():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("accounts", type=int)
+    parser.add_argument("pending_ratio", type=float, nargs="?", default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every RPC, gateway and Pinata call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--confirm-ms", type=float, default=0.0, help="delay before a signature is finalized")
+    parser.add_argument("--rpc-nodes", type=int, default=1, help="RPC URLs serving the same chain")
+    parser.add_argument("--slow-rpc-ms", type=float, default=0.0, help="extra latency of the first RPC node")
+    parser.add_argument("--rpc-rate-limit", type=float, default=0.0, help="requests/s per RPC node, then 429")
+    parser.add_argument("--pinata-down-s", type=float, default=0.0, help="Pinata fails every request this long")
+    args = parser.parse_args()
+
+    def faults(seed):
+        return Faults(args.latency_ms / 1000, args.jitter_ms / 1000, args.fail_rate, seed)
+
+    blobs = code_blobs()
+    program_id = Pubkey.new_unique()
+    rpc = FakeSolanaRPC(program_id, build_accounts(args.accounts, args.pending_ratio, blobs),
+                        Faults((args.latency_ms + args.slow_rpc_ms) / 1000, args.jitter_ms / 1000, args.fail_rate, 1),
+                        confirm_delay=args.confirm_ms / 1000, rate_limit=args.rpc_rate_limit).start()
+    nodes = [RPCNode(rpc, faults(10 + i), args.rpc_rate_limit).start() for i in range(args.rpc_nodes - 1)]
+    gateway = FakeGateway(blobs, faults(2)).start()
+    pinata = FakePinata(faults(3), down_s=args.pinata_down_s).start()
+    print(json.dumps({"program_id": str(program_id), "rpc": rpc.url,
+                      "rpc_urls": [rpc.url] + [node.url for node in nodes], "gateway": gateway.prefix,
+                      "pinata": pinata.url, "pending": rpc.pending}), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    serve()
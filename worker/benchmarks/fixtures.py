@@ -0,0 +1,70 @@
+"""Synthetic Job accounts in the exact on-chain layout, for benchmarks and stand-ins"""
+import hashlib
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from solders.pubkey import Pubkey
+
+from job_decoder import JOB_ACCOUNT_SIZE, JobStatus, JobType
+
+JOB_DISCRIMINATOR = hashlib.sha256(b"account:Job").digest()[:8]
+
+
+def _string(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    return struct.pack("<I", len(raw)) + raw
+
+
+def make_job_account(owner: bytes = None, title: str = "job", code_cid: str = "",
+                     result_cid: str = "", start_time: int = 0, end_time: int = 0,
+                     status: int = JobStatus.PENDING, job_type: int = JobType.MANUAL,
+                     cost: int = 0, cost_paid: bool = False, bump: int = 255) -> bytes:
+    """Serialize a Job account the way Anchor lays it out (padded to the account size)"""
+    data = (
+        JOB_DISCRIMINATOR
+        + (owner or bytes(Pubkey.new_unique()))
+        + _string(title) + _string(code_cid) + _string(result_cid)
+        + struct.pack("<qqBBQBB", start_time, end_time, status, job_type, cost, int(cost_paid), bump)
+    )
+    return data.ljust(JOB_ACCOUNT_SIZE, b"\0")
+
+
+def fake_cid(seed: str) -> str:
+    """A well-formed CIDv0-looking string (not the hash of any content)"""
+    digest = hashlib.sha256(seed.encode()).digest()
+    alphabet = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+    return "Qm" + "".join(alphabet[b % 58] for b in digest + digest[:12])[:44]
+
+
+def make_accounts(count: int, pending_ratio: float = 0.1, owners: int = 50, seed: int = 7,
+                  code_cids=None):
+    """(pubkey, data) pairs with a realistic mix of pending and finished jobs.
+
+    With `code_cids`, jobs reference those CIDs (round robin) instead of fake ones.
+    """
+    rng = random.Random(seed)
+    # Random keys, so owners spread over the keyspace like real wallets do
+    owner_keys = [rng.randbytes(32) for _ in range(owners)]
+    accounts = []
+    for i in range(count):
+        pending = rng.random() < pending_ratio
+        status = JobStatus.PENDING if pending else rng.choice([JobStatus.COMPLETED, JobStatus.CANCELLED])
+        accounts.append((
+            Pubkey.new_unique(),
+            make_job_account(
+                owner=rng.choice(owner_keys),
+                title=f"job-{i}-" + "x" * rng.randint(0, 40),
+                code_cid=code_cids[i % len(code_cids)] if code_cids else fake_cid(f"code-{i}"),
+                result_cid="" if pending or status == JobStatus.CANCELLED else fake_cid(f"result-{i}"),
+                start_time=1_700_000_000 + i,
+                end_time=0 if pending else 1_700_000_100 + i,
+                status=status,
+                job_type=rng.choice([JobType.CRON, JobType.API, JobType.MANUAL]),
+                cost=0 if pending else 1_000_000 + i,
+            ),
+        ))
+    return accounts
@@ -0,0 +1,99 @@
+import threading
+import time
+from typing import Optional, Tuple
+
+from solders.hash import Hash
+
+from log import get_logger
+
+BLOCKHASH_VALIDITY = 150  # blocks a blockhash stays usable
+SLOT_TIME = 0.4  # seconds, nominal
+
+log = get_logger("blockhash")
+
+
+class BlockhashProvider:
+    """Keeps a recent blockhash ready so building a transaction needs no RPC call.
+
+    A background thread fetches the latest blockhash every `refresh_interval`
+    seconds, and earlier once the cached one is estimated to have fewer than
+    `min_remaining_blocks` blocks of validity left. The estimate assumes the
+    chain was at `last_valid_block_height - 150` when the hash was fetched and
+    advances one block per SLOT_TIME since, so it costs no extra calls.
+    """
+
+    def __init__(self, client, refresh_interval: float = 20.0, min_remaining_blocks: int = 75):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.min_remaining_blocks = min_remaining_blocks
+        self.stats = {"refreshes": 0, "served": 0, "blocking_fetches": 0, "errors": 0}
+        self._current: Optional[Tuple[Hash, int, float]] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="blockhash-provider", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def get(self) -> Tuple[Hash, int]:
+        """Return (blockhash, last valid block height), fetching only if nothing usable is cached"""
+        with self._lock:
+            current = self._current
+        if current is not None:
+            remaining = self._remaining(current)
+            if remaining > 0:
+                if remaining < self.min_remaining_blocks:
+                    self._wake.set()
+                with self._lock:
+                    self.stats["served"] += 1
+                return current[0], current[1]
+        with self._lock:
+            self.stats["blocking_fetches"] += 1
+        blockhash, last_valid, _ = self._refresh()
+        return blockhash, last_valid
+
+    def estimated_block_height(self) -> Optional[int]:
+        with self._lock:
+            current = self._current
+        if current is None:
+            return None
+        return current[1] - BLOCKHASH_VALIDITY + int((time.time() - current[2]) / SLOT_TIME)
+
+    def _remaining(self, current: Tuple[Hash, int, float]) -> int:
+        elapsed_blocks = int((time.time() - current[2]) / SLOT_TIME)
+        return BLOCKHASH_VALIDITY - elapsed_blocks
+
+    def _refresh(self) -> Tuple[Hash, int, float]:
+        value = self.client.get_latest_blockhash().value
+        current = (value.blockhash, value.last_valid_block_height, time.time())
+        with self._lock:
+            self._current = current
+            self.stats["refreshes"] += 1
+        return current
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                current = self._refresh()
+                wait = self.refresh_interval
+                # Also wake up early enough to replace the hash before it gets too old
+                until_stale = (BLOCKHASH_VALIDITY - self.min_remaining_blocks) * SLOT_TIME
+                wait = min(wait, max(1.0, until_stale - (time.time() - current[2])))
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                log.warning("✗ Blockhash refresh error", error=str(e))
+                wait = 1.0
+            self._wake.wait(wait)
+            self._wake.clear()
@@ -0,0 +1,186 @@
+import base64
+import hashlib
+from typing import List, Optional, Tuple
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+SHA2_256 = 0x12
+
+# go-ipfs / kubo defaults for `ipfs add` (and Pinata pinFileToIPFS)
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+
+
+def b58encode(data: bytes) -> str:
+    """Base58btc-encode raw bytes"""
+    num = int.from_bytes(data, 'big')
+    encoded = ""
+    while num > 0:
+        num, rem = divmod(num, 58)
+        encoded = B58_ALPHABET[rem] + encoded
+    pad = len(data) - len(data.lstrip(b'\0'))
+    return "1" * pad + encoded
+
+
+def b58decode(text: str) -> bytes:
+    """Decode a base58btc string"""
+    num = 0
+    for ch in text:
+        num = num * 58 + B58_ALPHABET.index(ch)
+    pad = len(text) - len(text.lstrip("1"))
+    body = num.to_bytes((num.bit_length() + 7) // 8, 'big') if num else b""
+    return b"\0" * pad + body
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    shift = 0
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(value)) + value
+
+
+def _multihash(data: bytes) -> bytes:
+    return bytes([SHA2_256, 32]) + hashlib.sha256(data).digest()
+
+
+def _unixfs_file(data: Optional[bytes], filesize: int, blocksizes: List[int]) -> bytes:
+    msg = _field(1, 0) + _varint(2)  # Type = File
+    if data:
+        msg += _bytes_field(2, data)
+    msg += _field(3, 0) + _varint(filesize)
+    for size in blocksizes:
+        msg += _field(4, 0) + _varint(size)
+    return msg
+
+
+def _pb_node(data: bytes, links: List[Tuple[bytes, int]], names: Optional[List[bytes]] = None) -> bytes:
+    # dag-pb canonical order: Links (field 2) before Data (field 1)
+    out = b""
+    for i, (cid_bytes, tsize) in enumerate(links):
+        name = names[i] if names else b""
+        link = _bytes_field(1, cid_bytes) + _bytes_field(2, name) + _field(3, 0) + _varint(tsize)
+        out += _bytes_field(2, link)
+    return out + _bytes_field(1, data)
+
+
+def _unixfs_root(data: bytes, raw_leaves: bool, cid_prefix: bytes) -> Tuple[bytes, int, int]:
+    """Build the balanced UnixFS file DAG `ipfs add` would; returns (root cid bytes, codec, DAG size)"""
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)] or [b""]
+
+    # (cid bytes, file size, cumulative tsize)
+    level = []
+    for chunk in chunks:
+        if raw_leaves and len(chunks) > 1:
+            block = chunk
+            cid_bytes = bytes([1, CODEC_RAW]) + _multihash(block)
+        else:
+            block = _pb_node(_unixfs_file(chunk, len(chunk), []), [])
+            cid_bytes = cid_prefix + _multihash(block)
+        level.append((cid_bytes, len(chunk), len(block)))
+
+    if len(level) == 1:
+        if raw_leaves and cid_prefix:
+            return bytes([1, CODEC_RAW]) + _multihash(data), CODEC_RAW, len(data)
+        return level[0][0], CODEC_DAG_PB, level[0][2]
+
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), MAX_LINKS):
+            group = level[i:i + MAX_LINKS]
+            filesize = sum(size for _, size, _ in group)
+            block = _pb_node(
+                _unixfs_file(None, filesize, [size for _, size, _ in group]),
+                [(cid_bytes, tsize) for cid_bytes, _, tsize in group],
+            )
+            cid_bytes = cid_prefix + _multihash(block)
+            parents.append((cid_bytes, filesize, len(block) + sum(t for _, _, t in group)))
+        level = parents
+    return level[0][0], CODEC_DAG_PB, level[0][2]
+
+
+def cid_v0(data: bytes) -> str:
+    """CIDv0 of a file as added by `ipfs add` / Pinata with default options"""
+    root, _, _ = _unixfs_root(data, raw_leaves=False, cid_prefix=b"")
+    return b58encode(root)
+
+
+def directory_cid_v0(files: List[Tuple[str, bytes]]) -> str:
+    """CIDv0 of a flat directory of (name, content) files, as `ipfs add -r` / Pinata build it"""
+    links, names = [], []
+    for name, data in sorted(files, key=lambda f: f[0].encode()):
+        root, _, tsize = _unixfs_root(data, raw_leaves=False, cid_prefix=b"")
+        links.append((root, tsize))
+        names.append(name.encode())
+    block = _pb_node(_field(1, 0) + _varint(1), links, names)  # Type = Directory
+    return b58encode(_multihash(block))
+
+
+def cid_v1(data: bytes, raw_leaves: bool = True) -> str:
+    """CIDv1 (base32) of a file; single-chunk files with raw leaves are a raw block"""
+    root, _, _ = _unixfs_root(data, raw_leaves=raw_leaves, cid_prefix=bytes([1, CODEC_DAG_PB]))
+    return "b" + base64.b32encode(root).decode().lower().rstrip("=")
+
+
+def parse_cid(cid: str) -> Tuple[int, int, bytes]:
+    """Return (version, codec, multihash) for a CIDv0 or base32 CIDv1 string"""
+    if len(cid) == 46 and cid.startswith("Qm"):
+        return 0, CODEC_DAG_PB, b58decode(cid)
+    if cid.startswith("b"):
+        body = cid[1:].upper()
+        raw = base64.b32decode(body + "=" * (-len(body) % 8))
+        version, offset = _read_varint(raw, 0)
+        codec, offset = _read_varint(raw, offset)
+        return version, codec, raw[offset:]
+    raise ValueError(f"unsupported CID encoding: {cid}")
+
+
+def verify_cid(cid: str, data: bytes) -> Optional[bool]:
+    """Check that `data` is the file content addressed by `cid`.
+
+    Returns None when the CID cannot be checked locally (non-sha256 hash or a
+    DAG layout other than the `ipfs add` defaults). A DAG-PB CID that does not
+    match the default layout is such a case: another chunker or DAG shape gives
+    the same content a different CID, so only a match is conclusive.
+    """
+    try:
+        version, codec, multihash = parse_cid(cid)
+    except Exception:
+        return None
+    if multihash[:2] != bytes([SHA2_256, 32]):
+        return None
+    if version == 0:
+        return True if cid_v0(data) == cid else None
+    if codec == CODEC_RAW:
+        return multihash == _multihash(data)
+    if codec == CODEC_DAG_PB:
+        if cid_v1(data, raw_leaves=True) == cid or cid_v1(data, raw_leaves=False) == cid:
+            return True
+        return None
+    return None
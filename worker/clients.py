@@ -0,0 +1,110 @@
+import threading
+from typing import List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from solana.rpc.api import Client
+
+from rpc_pool import RpcPool, client_session
+
+
+def pooled_session(pool_size: int, headers: Optional[dict] = None) -> requests.Session:
+    """requests.Session with a keep-alive connection pool of `pool_size`"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def pooled_rpc_client(url: str, pool_size: int, timeout: float) -> Client:
+    """solana-py Client whose httpx connection pool holds `pool_size` keep-alive connections.
+
+    Client takes no session or limits, so the default httpx.Client its
+    HTTPProvider builds is closed and replaced. The provider attribute is
+    private; requirements.txt caps solana-py at the versions that have it.
+    """
+    rpc = Client(url, timeout=timeout)
+    client_session(rpc).close()
+    rpc._provider.session = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60),
+    )
+    return rpc
+
+
+class WorkerClients:
+    """Long-lived clients shared by every job a worker processes.
+
+    One keep-alive pool per endpoint, sized to the concurrency of the stage
+    that uses it, so connections (and TLS sessions) are reused across jobs.
+    `rpc` is an RpcPool over one Client per RPC URL.
+    The Lambda client is built on first use to keep boto3 off the startup path.
+    """
+
+    def __init__(self, rpc_urls: List[str], aws_access_key: Optional[str] = None,
+                 aws_secret_key: Optional[str] = None, aws_region: Optional[str] = None,
+                 pinata_jwt: Optional[str] = None,
+                 rpc_pool: int = 8, ipfs_pool: int = 8, lambda_pool: int = 16, pinata_pool: int = 8,
+                 rpc_timeout: float = 10.0, ipfs_timeout: float = 30.0,
+                 lambda_connect_timeout: float = 5.0, lambda_read_timeout: float = 40.0,
+                 pinata_timeout: float = 30.0, rpc_rate_limit: Optional[float] = None,
+                 rpc_hedge_percentile: float = 0.9, rpc_retries: int = 2, rpc_send_fanout: int = 3):
+        self.aws_access_key = aws_access_key
+        self.aws_secret_key = aws_secret_key
+        self.aws_region = aws_region
+        self.lambda_pool = lambda_pool
+        self.lambda_connect_timeout = lambda_connect_timeout
+        self.lambda_read_timeout = lambda_read_timeout
+        self.ipfs_timeout = ipfs_timeout
+        self.pinata_timeout = pinata_timeout
+
+        rpc_clients = {url: pooled_rpc_client(url, rpc_pool, rpc_timeout) for url in rpc_urls}
+        self.rpc = RpcPool(rpc_clients, rate_limit=rpc_rate_limit, hedge_percentile=rpc_hedge_percentile,
+                           retries=rpc_retries, send_fanout=rpc_send_fanout)
+
+        self.ipfs = pooled_session(ipfs_pool)
+        self.pinata = pooled_session(
+            pinata_pool, {"Authorization": f"Bearer {pinata_jwt}"} if pinata_jwt else None
+        )
+
+        self._lambda = None
+        self._lock = threading.Lock()
+
+    @property
+    def lambda_client(self):
+        if self._lambda is None:
+            with self._lock:
+                if self._lambda is None:
+                    self._lambda = self._aws_client("lambda")
+        return self._lambda
+
+    def aws_client(self, service: str):
+        """A fresh boto3 client for one-off use (e.g. IAM during deploy)"""
+        return self._aws_client(service)
+
+    def _aws_client(self, service: str):
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            service,
+            aws_access_key_id=self.aws_access_key,
+            aws_secret_access_key=self.aws_secret_key,
+            region_name=self.aws_region,
+            config=Config(
+                max_pool_connections=self.lambda_pool,
+                connect_timeout=self.lambda_connect_timeout,
+                read_timeout=self.lambda_read_timeout,
+                tcp_keepalive=True,
+                retries={"max_attempts": 2, "mode": "standard"},
+            ),
+        )
+
+    def close(self):
+        self.ipfs.close()
+        self.pinata.close()
+        self.rpc.close()
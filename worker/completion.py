@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.message import Message
+from solders.pubkey import Pubkey
+
+PACKET_DATA_SIZE = 1232  # max serialized transaction size
+SIGNATURE_SIZE = 64
+
+
+def transaction_size(instructions: List[Instruction], payer: Pubkey, signers: int = 1) -> int:
+    """Serialized size of a legacy transaction holding `instructions`"""
+    msg = Message.new_with_blockhash(instructions, payer, Hash.default())
+    # shortvec signature count (1 byte below 128) + signatures + message
+    return 1 + signers * SIGNATURE_SIZE + len(bytes(msg))
+
+
+class CompletionBatcher:
+    """Packs instructions from many jobs into as few transactions as possible.
+
+    submit() returns a Future per instruction. A background thread collects
+    instructions for up to `window` seconds or `max_batch` items, packs them
+    greedily into transactions under the packet size limit and hands each to
+    `send(instructions)`. The Future resolves with whatever `send` returns for
+    the transaction its instruction went into; if that is itself a Future (a
+    pending confirmation), with its result. If `send` raises or the returned
+    Future fails, the batch is split in half and each half retried, so one bad
+    instruction only fails itself.
+    """
+
+    def __init__(self, send: Callable[[List[Instruction]], object], payer: Pubkey,
+                 window: float = 0.25, max_batch: int = 16,
+                 max_tx_size: int = PACKET_DATA_SIZE, senders: int = 4):
+        self.send = send
+        self.payer = payer
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.max_tx_size = max_tx_size
+        self.stats = {"instructions": 0, "transactions": 0, "splits": 0, "failed": 0}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=senders, thread_name_prefix="complete-send")
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="completion-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._senders.shutdown(wait=True)
+
+    def submit(self, ix: Instruction) -> Future:
+        future: Future = Future()
+        self._queue.put((ix, future))
+        return future
+
+    def pack(self, instructions: List[Instruction]) -> List[List[Instruction]]:
+        """Greedily split instructions into transactions under the size limit"""
+        batches: List[List[Instruction]] = []
+        current: List[Instruction] = []
+        for ix in instructions:
+            if current and transaction_size(current + [ix], self.payer) > self.max_tx_size:
+                batches.append(current)
+                current = []
+            current.append(ix)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            items = [first]
+            deadline = time.time() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(items)
+
+    def _flush(self, items):
+        with self._lock:
+            self.stats["instructions"] += len(items)
+        start = 0
+        for batch in self.pack([ix for ix, _ in items]):
+            chunk = items[start:start + len(batch)]
+            start += len(batch)
+            self._senders.submit(self._send_chunk, chunk)
+
+    def _send_chunk(self, chunk):
+        try:
+            with self._lock:
+                self.stats["transactions"] += 1
+            result = self.send([ix for ix, _ in chunk])
+        except Exception as e:
+            self._retry(chunk, e)
+            return
+        if isinstance(result, Future):
+            # send() handed back a pending confirmation; settle the batch when it resolves
+            result.add_done_callback(lambda outcome: self._settle(chunk, outcome))
+            return
+        for _, future in chunk:
+            future.set_result(result)
+
+    def _settle(self, chunk, outcome: Future):
+        error = outcome.exception()
+        if error is not None:
+            self._retry(chunk, error)
+            return
+        for _, future in chunk:
+            future.set_result(outcome.result())
+
+    def _retry(self, chunk, error: Exception):
+        if len(chunk) == 1:
+            with self._lock:
+                self.stats["failed"] += 1
+            chunk[0][1].set_exception(error)
+            return
+        with self._lock:
+            self.stats["splits"] += 1
+        mid = len(chunk) // 2
+        for half in (chunk[:mid], chunk[mid:]):
+            try:
+                self._senders.submit(self._send_chunk, half)
+            except RuntimeError:
+                # Shutting down: no more retries
+                for _, future in half:
+                    future.set_exception(error)
@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from solders.signature import Signature
+from solders.transaction_status import TransactionConfirmationStatus
+
+from log import get_logger
+
+STATUS_BATCH_SIZE = 256  # getSignatureStatuses limit
+
+_COMMITMENTS = {"processed": 0, "confirmed": 1, "finalized": 2}
+
+log = get_logger("confirmation")
+
+
+def _level(status) -> int:
+    # solders status enums are not hashable, so no dict lookup
+    if status == TransactionConfirmationStatus.Finalized:
+        return 2
+    if status == TransactionConfirmationStatus.Confirmed:
+        return 1
+    return 0
+
+
+class TransactionFailed(Exception):
+    """The transaction landed but its execution failed"""
+
+
+class TransactionExpired(Exception):
+    """The blockhash expired before the transaction landed and it was not re-sent"""
+
+
+class _Pending:
+    __slots__ = ("signature", "last_valid_block_height", "resend", "resends", "future", "sent_at", "tracked_at",
+                 "resolved_at")
+
+    def __init__(self, signature: Signature, last_valid_block_height: int,
+                 resend: Optional[Callable[[], Tuple[Signature, int]]], future: Future):
+        self.signature = signature
+        self.last_valid_block_height = last_valid_block_height
+        self.resend = resend
+        self.resends = 0
+        self.future = future
+        self.sent_at = time.time()
+        self.tracked_at = self.sent_at
+        self.resolved_at = 0.0
+
+
+class ConfirmationTracker:
+    """Confirms sent transactions in the background.
+
+    track() returns a Future that resolves to the final signature once the
+    transaction reaches `commitment`, or fails with TransactionFailed /
+    TransactionExpired. All outstanding signatures are checked together with
+    batched getSignatureStatuses calls. Polling is fast while signatures are
+    resolving and backs off while nothing changes. When the current block
+    height passes a transaction's last valid block height, `resend()` is called
+    to send it again with a fresh blockhash, up to `max_resends` times.
+    `on_resolved(outcome, seconds)` is called with each transaction's outcome
+    and the time since it was first tracked.
+    Tracking a signature that is already tracked returns the existing Future.
+    So does tracking a signature a re-send replaced, until `keep_replaced`
+    seconds after the outcome: jobs that shared the old transaction (e.g. after
+    a restart) follow the re-sent one instead of sending it again.
+    """
+
+    def __init__(self, client, commitment: str = "confirmed",
+                 min_interval: float = 0.4, max_interval: float = 2.0,
+                 max_resends: int = 3, keep_replaced: float = 600.0,
+                 on_resolved: Optional[Callable[[str, float], None]] = None):
+        self.client = client
+        self.level = _COMMITMENTS[commitment]
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_resends = max_resends
+        self.keep_replaced = keep_replaced
+        self.on_resolved = on_resolved
+        self.stats = {"tracked": 0, "confirmed": 0, "failed": 0, "expired": 0,
+                      "resent": 0, "polls": 0}
+        self._pending: Dict[Signature, _Pending] = {}
+        self._replaced: Dict[Signature, _Pending] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="confirmation-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def track(self, signature: Signature, last_valid_block_height: int,
+              resend: Optional[Callable[[], Tuple[Signature, int]]] = None) -> Future:
+        future: Future = Future()
+        with self._lock:
+            existing = self._pending.get(signature) or self._replaced.get(signature)
+            if existing is not None:
+                return existing.future
+            self._pending[signature] = _Pending(signature, last_valid_block_height, resend, future)
+            self.stats["tracked"] += 1
+        self._wake.set()
+        return future
+
+    def outstanding(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def check(self, signatures: List[Signature]) -> List[Optional[str]]:
+        """One-off status of sent signatures without tracking them.
+
+        Per signature: "confirmed" (reached the commitment), "failed",
+        "pending" (seen below the commitment) or None (unknown to the node).
+        """
+        outcomes: List[Optional[str]] = []
+        for i in range(0, len(signatures), STATUS_BATCH_SIZE):
+            batch = signatures[i:i + STATUS_BATCH_SIZE]
+            for status in self.client.get_signature_statuses(batch).value:
+                if status is None:
+                    outcomes.append(None)
+                elif status.err is not None:
+                    outcomes.append("failed")
+                elif status.confirmation_status is not None and _level(status.confirmation_status) >= self.level:
+                    outcomes.append("confirmed")
+                else:
+                    outcomes.append("pending")
+        return outcomes
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            self._forget_replaced()
+            with self._lock:
+                pending = list(self._pending.values())
+            if not pending:
+                interval = self.max_interval
+                continue
+            try:
+                resolved = self._poll(pending)
+            except Exception as e:
+                log.warning("✗ Confirmation poll error", error=str(e))
+                resolved = 0
+            # Poll quickly while transactions are landing, back off while idle
+            interval = self.min_interval if resolved else min(interval * 1.5, self.max_interval)
+
+    def _poll(self, pending: List[_Pending]) -> int:
+        resolved = 0
+        unresolved: List[_Pending] = []
+        for i in range(0, len(pending), STATUS_BATCH_SIZE):
+            batch = pending[i:i + STATUS_BATCH_SIZE]
+            statuses = self.client.get_signature_statuses([p.signature for p in batch]).value
+            with self._lock:
+                self.stats["polls"] += 1
+            for entry, status in zip(batch, statuses):
+                if status is None:
+                    unresolved.append(entry)
+                    continue
+                if status.err is not None:
+                    self._resolve(entry, TransactionFailed(str(status.err)), "failed")
+                    resolved += 1
+                elif status.confirmation_status is not None and _level(status.confirmation_status) >= self.level:
+                    self._resolve(entry, None, "confirmed")
+                    resolved += 1
+
+        if unresolved:
+            block_height = self.client.get_block_height().value
+            for entry in unresolved:
+                if block_height > entry.last_valid_block_height:
+                    resolved += self._expire(entry)
+        return resolved
+
+    def _expire(self, entry: _Pending) -> int:
+        if entry.resend is None or entry.resends >= self.max_resends:
+            self._resolve(entry, TransactionExpired(str(entry.signature)), "expired")
+            return 1
+        try:
+            signature, last_valid = entry.resend()
+        except Exception as e:
+            self._resolve(entry, e, "failed")
+            return 1
+        with self._lock:
+            self._pending.pop(entry.signature, None)
+            self._replaced[entry.signature] = entry
+            entry.signature = signature
+            entry.last_valid_block_height = last_valid
+            entry.resends += 1
+            entry.sent_at = time.time()
+            self._pending[signature] = entry
+            self.stats["resent"] += 1
+        log.info("↻ Blockhash expired, re-sent", signature=str(signature))
+        return 0
+
+    def _resolve(self, entry: _Pending, error: Optional[Exception], outcome: str):
+        with self._lock:
+            self._pending.pop(entry.signature, None)
+            entry.resolved_at = time.time()
+            self.stats[outcome] += 1
+        if self.on_resolved:
+            self.on_resolved(outcome, time.time() - entry.tracked_at)
+        if error is None:
+            entry.future.set_result(entry.signature)
+        else:
+            entry.future.set_exception(error)
+
+    def _forget_replaced(self):
+        """Drop replaced signatures of transactions resolved over `keep_replaced` seconds ago"""
+        cutoff = time.time() - self.keep_replaced
+        with self._lock:
+            for signature in [s for s, e in self._replaced.items() if 0 < e.resolved_at < cutoff]:
+                del self._replaced[signature]
@@ -0,0 +1,505 @@
+import base64
+import json
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from log import get_logger
+
+log = get_logger("executor")
+
+RUNNER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_runner.py")
+# The whole environment of a local executor process: nothing is inherited from the worker's
+# (AWS keys, PINATA_JWT, paths to the keypair or the journal)
+SANDBOX_ENV = {"PATH": "/usr/local/bin:/usr/bin:/bin", "LANG": "C.UTF-8", "PYTHONIOENCODING": "utf-8"}
+
+
+class Executor:
+    """Runs job code and returns the parsed handler body (same shape as Lambda's)"""
+
+    name = "executor"
+
+    def execute(self, code: str, job: Dict) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def job_event(code: str, job: Dict, output_limit: Optional[int] = None, timeout: Optional[float] = None) -> Dict:
+    """The event every backend hands to lambda_handler"""
+    event = {
+        "code": code,
+        "job_title": job['title'],
+        "job_type": job['job_type_name'],
+        "owner": job['owner'],
+    }
+    if output_limit:
+        event["output_limit"] = output_limit
+    if timeout:
+        event["timeout_ms"] = int(timeout * 1000)
+    return event
+
+
+def compress_code(event: Dict) -> Dict:
+    """Replace the event's code with its zlib-compressed, base64 form (code_z)"""
+    code = event.pop("code")
+    event["code_z"] = base64.b64encode(zlib.compress(code.encode('utf-8'))).decode('ascii')
+    return event
+
+
+def invoke_rejected(error: Exception) -> bool:
+    """True when Lambda refused or never received the invoke, so no job in it ran"""
+    try:
+        from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError
+    except ImportError:
+        return False
+    return isinstance(error, (ClientError, ConnectTimeoutError, EndpointConnectionError))
+
+
+def decode_body(body) -> Tuple[Dict, int]:
+    """Parse a handler body, inflating it if the handler compressed it.
+
+    Returns the body and its uncompressed JSON size (0 for a body the handler
+    returned as an object, which arrives already parsed with the response).
+    """
+    size = len(body) if isinstance(body, str) else 0
+    if isinstance(body, str):
+        body = json.loads(body)
+    if body.get('encoding') == 'zlib+base64':
+        size = body.get('size', 0)
+        body = json.loads(zlib.decompress(base64.b64decode(body['data'])))
+    return body, size
+
+
+class LambdaExecutor(Executor):
+    """Invokes the deployed AWS Lambda function.
+
+    With `compress` set, code of at least `compress_min_bytes` is sent
+    zlib-compressed and the handler is asked to compress its response; both
+    are inflated here, so callers see plain results. Raw and on-the-wire
+    sizes of both directions are counted in `stats`. If `ready` is set to a
+    Future (a deploy still running), invokes wait for it and fail if it
+    resolves to False. Each job gets `job_timeout` seconds, enforced by the
+    handler.
+    """
+
+    name = "lambda"
+
+    def __init__(self, clients, function_name: str, compress: bool = True,
+                 compress_min_bytes: int = 1024, output_limit: Optional[int] = None,
+                 job_timeout: Optional[float] = None):
+        self.clients = clients
+        self.function_name = function_name
+        self.job_timeout = job_timeout
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.output_limit = output_limit
+        self.ready: Optional[Future] = None
+        self.stats = {"code_bytes": 0, "code_sent_bytes": 0,
+                      "response_bytes": 0, "response_received_bytes": 0}
+        self._lock = threading.Lock()
+
+    def execute(self, code: str, job: Dict) -> Optional[Dict]:
+        return self.invoke(self.encode_event(code, job))
+
+    def encode_event(self, code: str, job: Dict) -> Dict:
+        event = job_event(code, job, self.output_limit, self.job_timeout)
+        raw = len(code.encode('utf-8'))
+        if self.compress and raw >= self.compress_min_bytes:
+            compress_code(event)
+        sent = len(event["code_z"]) if "code_z" in event else raw
+        with self._lock:
+            self.stats["code_bytes"] += raw
+            self.stats["code_sent_bytes"] += sent
+        return event
+
+    def invoke(self, event: Dict) -> Dict:
+        if self.ready is not None and not self.ready.result():
+            raise RuntimeError(f"Lambda function {self.function_name} is not deployed")
+        if self.compress:
+            # Ask for a compressed response
+            event = dict(event, compress=True)
+        response = self.clients.lambda_client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(event)
+        )
+        raw = response['Payload'].read()
+        response_payload = json.loads(raw)
+        if response.get('FunctionError'):
+            # The invoke itself failed (timeout, out of memory); any job in it may have run
+            raise RuntimeError(f"Lambda {response['FunctionError']} error: "
+                               f"{response_payload.get('errorType')}: {response_payload.get('errorMessage')}")
+        wire_body = response_payload.get('body', '{}')
+        body, size = decode_body(wire_body)
+        with self._lock:
+            self.stats["response_bytes"] += size or len(raw)
+            self.stats["response_received_bytes"] += len(wire_body) if isinstance(wire_body, str) else len(raw)
+        return body
+
+
+class LambdaBatchExecutor(LambdaExecutor):
+    """Sends concurrently submitted jobs to Lambda together, one invoke per batch.
+
+    execute() blocks its caller as before. A background thread collects jobs
+    for up to `window` seconds, `max_batch` jobs or `max_payload_bytes` of
+    request payload and sends them as {"jobs": [...]}; the handler runs them
+    one after another in the same warm container, each under its own timeout,
+    and returns a result per job. Jobs the handler deferred because the invoke
+    could no longer give them their whole timeout are sent again on their own.
+
+    Only jobs known not to have run are sent again. A batch Lambda refused
+    (throttled, too large, unreachable) is split in half and each half
+    retried. A batch whose invoke failed after it reached the handler may
+    have run some of its jobs, so every job in it fails instead of running a
+    second time; the pipeline picks them up on a later poll like any failed
+    job.
+    """
+
+    def __init__(self, clients, function_name: str, window: float = 0.05, max_batch: int = 8,
+                 max_payload_bytes: int = 1024 * 1024, invokers: int = 8, **options):
+        super().__init__(clients, function_name, **options)
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.max_payload_bytes = max_payload_bytes
+        self.stats.update({"jobs": 0, "invokes": 0, "batched": 0, "splits": 0, "deferred": 0, "failed": 0,
+                           "rejected": 0})
+        self._queue: "queue.Queue" = queue.Queue()
+        self._invokers = ThreadPoolExecutor(max_workers=invokers, thread_name_prefix="lambda-invoke")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lambda-batcher", daemon=True)
+        self._thread.start()
+
+    def execute(self, code: str, job: Dict) -> Optional[Dict]:
+        event = self.encode_event(code, job)
+        future: Future = Future()
+        self._queue.put((event, len(json.dumps(event)), future))
+        return future.result()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(5.0)
+        self._invokers.shutdown(wait=True)
+
+    def _run(self):
+        carry = None
+        while not (self._stop.is_set() and self._queue.empty() and carry is None):
+            if carry is not None:
+                first, carry = carry, None
+            else:
+                try:
+                    first = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            items = [first]
+            size = first[1]
+            deadline = time.time() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + item[1] > self.max_payload_bytes:
+                    # Starts the next batch instead
+                    carry = item
+                    break
+                items.append(item)
+                size += item[1]
+            self._submit(items)
+
+    def _submit(self, items):
+        try:
+            self._invokers.submit(self._invoke_batch, items)
+        except RuntimeError as e:
+            # Shutting down
+            for _, _, future in items:
+                future.set_exception(e)
+
+    def _invoke_batch(self, items):
+        with self._lock:
+            self.stats["invokes"] += 1
+            if len(items) > 1:
+                self.stats["batched"] += 1
+        try:
+            if len(items) == 1:
+                results = [self.invoke(items[0][0])]
+            else:
+                body = self.invoke({"jobs": [event for event, _, _ in items]})
+                results = body.get('results')
+                if body.get('status') != 'batch' or not isinstance(results, list) or len(results) != len(items):
+                    raise RuntimeError(f"bad batch response: {body.get('error', body.get('status'))}")
+        except Exception as e:
+            if invoke_rejected(e):
+                self._retry(items, e)
+            else:
+                self._fail(items, e)
+            return
+
+        deferred = []
+        for item, result in zip(items, results):
+            if result.get('status') == 'deferred':
+                deferred.append(item)
+            else:
+                item[2].set_result(result)
+        with self._lock:
+            self.stats["jobs"] += len(items) - len(deferred)
+            self.stats["deferred"] += len(deferred)
+        for item in deferred:
+            self._submit([item])
+
+    def _retry(self, items, error: Exception):
+        """Split a batch that never ran; a single job fails"""
+        with self._lock:
+            self.stats["rejected"] += 1
+        if len(items) == 1:
+            self._fail(items, error)
+            return
+        with self._lock:
+            self.stats["splits"] += 1
+        mid = len(items) // 2
+        self._submit(items[:mid])
+        self._submit(items[mid:])
+
+    def _fail(self, items, error: Exception):
+        with self._lock:
+            self.stats["failed"] += len(items)
+        for _, _, future in items:
+            future.set_exception(error)
+
+
+def sandbox_user(user: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(uid, gid) of a user name or numeric uid, None for "" (run as the worker's own user)"""
+    if not user:
+        return None
+    import pwd
+    entry = pwd.getpwuid(int(user)) if user.isdigit() else pwd.getpwnam(user)
+    return entry.pw_uid, entry.pw_gid
+
+
+class _LocalWorker:
+    def __init__(self, handler_source: str, memory_mb: int, max_file_mb: int,
+                 python: Optional[str] = None, user: Optional[Tuple[int, int]] = None):
+        if os.name == "posix":
+            # Imported here, not in the child: after dropping to `user` it may not read the stdlib
+            import resource
+
+        def limit():
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+            if memory_mb:
+                limit_bytes = memory_mb * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+            if max_file_mb:
+                limit_bytes = max_file_mb * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_FSIZE, (limit_bytes, limit_bytes))
+
+        # A throwaway working and home directory, removed with the process
+        self.home = tempfile.mkdtemp(prefix="cloudmesh-job-")
+        credentials = {}
+        if user is not None:
+            os.chown(self.home, *user)
+            credentials = {"user": user[0], "group": user[1], "extra_groups": []}
+        with open(RUNNER_PATH, encoding="utf-8") as f:
+            runner = f.read()
+        try:
+            # -I: no PYTHON* variables, user site-packages or script directory on sys.path
+            self.proc = subprocess.Popen(
+                [python or sys.executable, "-I", "-u", "-c", runner],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                text=True, encoding="utf-8",
+                cwd=self.home, env=dict(SANDBOX_ENV, HOME=self.home, TMPDIR=self.home),
+                preexec_fn=limit if os.name == "posix" else None,
+                start_new_session=True,  # Ctrl-C on the worker must not kill running jobs
+                **credentials,
+            )
+        except Exception:
+            shutil.rmtree(self.home, ignore_errors=True)
+            raise
+        self.jobs = 0
+        try:
+            self._send({"handler_source": handler_source})
+            ready = self._recv(timeout=30)
+        except (OSError, ValueError, EOFError):
+            ready = None
+        if ready is None:
+            self.kill()
+            raise RuntimeError("local executor process failed to start")
+
+    def run(self, event: Dict, timeout: float) -> Optional[Dict]:
+        self.jobs += 1
+        self._send(event)
+        return self._recv(timeout)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        shutil.rmtree(self.home, ignore_errors=True)
+
+    def _send(self, message: Dict):
+        self.proc.stdin.write(json.dumps(message) + "\n")
+        self.proc.stdin.flush()
+
+    def _recv(self, timeout: float) -> Optional[Dict]:
+        """Next reply, or None on timeout; EOFError once the process has exited"""
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            return None
+        line = self.proc.stdout.readline()
+        if not line:
+            raise EOFError("executor process exited")
+        return json.loads(line)
+
+
+class LocalPoolExecutor(Executor):
+    """Runs lambda_handler in a pool of warm, resource-limited Python processes.
+
+    Each process loads the handler source once and then serves jobs over a
+    pipe, so a job costs one round trip instead of an interpreter start or a
+    Lambda invoke. A process that times out or dies is killed and replaced;
+    healthy ones are recycled after `max_jobs_per_worker` jobs.
+
+    Job code is untrusted, so a process inherits nothing from the worker: it
+    gets SANDBOX_ENV only, an empty throwaway directory as cwd and home, and
+    runs as `user` (a name or uid; needs the worker to run as root) so files
+    readable only by the worker's user, such as its keypair and journal, stay
+    out of reach. `python` is the interpreter to start, which that user must
+    be able to execute (default: the worker's own).
+    """
+
+    name = "local"
+
+    def __init__(self, handler_source: str, workers: int = 4, timeout: float = 30.0,
+                 memory_mb: int = 512, max_file_mb: int = 16, max_jobs_per_worker: int = 500,
+                 output_limit: Optional[int] = None, python: Optional[str] = None, user: Optional[str] = None):
+        self.handler_source = handler_source
+        self.python = python
+        self.user = sandbox_user(user)
+        self.output_limit = output_limit
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_file_mb = max_file_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.stats = {"jobs": 0, "timeouts": 0, "crashes": 0, "recycled": 0}
+        self._lock = threading.Lock()
+        self._idle: "queue.Queue[_LocalWorker]" = queue.Queue()
+        for _ in range(max(1, workers)):
+            self._idle.put(self._spawn())
+
+    def execute(self, code: str, job: Dict) -> Optional[Dict]:
+        worker = self._idle.get()
+        start = time.time()
+        try:
+            response = worker.run(job_event(code, job, self.output_limit), self.timeout)
+            timed_out = response is None
+        except (OSError, ValueError, EOFError):
+            response = None
+            timed_out = False
+        elapsed_ms = int((time.time() - start) * 1000)
+
+        with self._lock:
+            self.stats["jobs"] += 1
+        if response is None:
+            with self._lock:
+                self.stats["timeouts" if timed_out else "crashes"] += 1
+            worker.kill()
+            self._replace()
+            error = (f"Task timed out after {self.timeout:.2f} seconds" if timed_out
+                     else "Executor process exited")
+            return {
+                'status': 'error',
+                'job_title': job['title'],
+                'error': error,
+                'error_type': 'Timeout' if timed_out else 'ProcessExit',
+                'execution_time_ms': elapsed_ms,
+                'stdout': '',
+                'stderr': '',
+                'timestamp': int(time.time()),
+            }
+
+        if worker.jobs >= self.max_jobs_per_worker:
+            with self._lock:
+                self.stats["recycled"] += 1
+            worker.kill()
+            self._replace()
+        else:
+            self._idle.put(worker)
+        return decode_body(response.get('body', '{}'))[0]
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+    def _spawn(self) -> _LocalWorker:
+        return _LocalWorker(self.handler_source, self.memory_mb, self.max_file_mb, self.python, self.user)
+
+    def _replace(self):
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            log.error("✗ Could not restart local executor process", error=str(e))
+            # Try again on a later job rather than shrinking the pool for good
+            threading.Timer(5.0, self._replace).start()
+
+
+class ExecutorRouter(Executor):
+    """Sends small jobs of the configured types to the local pool, the rest to Lambda.
+
+    Either backend may be None; everything then goes to the other one.
+    """
+
+    name = "router"
+
+    def __init__(self, local: Optional[Executor], remote: Optional[Executor],
+                 local_max_code_bytes: int = 16 * 1024,
+                 local_job_types: Iterable[str] = ("API", "MANUAL")):
+        if local is None and remote is None:
+            raise ValueError("at least one executor backend is required")
+        self.local = local
+        self.remote = remote
+        self.local_max_code_bytes = local_max_code_bytes
+        self.local_job_types = set(local_job_types)
+        self.stats = {"local": 0, "remote": 0}
+        self._lock = threading.Lock()
+
+    def route(self, code: str, job: Dict) -> Executor:
+        if self.remote is None:
+            return self.local
+        if self.local is None:
+            return self.remote
+        if (job['job_type_name'] in self.local_job_types
+                and len(code.encode('utf-8')) <= self.local_max_code_bytes):
+            return self.local
+        return self.remote
+
+    def execute(self, code: str, job: Dict) -> Optional[Dict]:
+        backend = self.route(code, job)
+        with self._lock:
+            self.stats["local" if backend is self.local else "remote"] += 1
+        return backend.execute(code, job)
+
+    def close(self):
+        for backend in (self.local, self.remote):
+            if backend is not None:
+                backend.close()
@@ -0,0 +1,296 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import requests
+
+from cid import verify_cid
+from log import get_logger
+
+_SAFE_CID = re.compile(r"^[A-Za-z0-9]+$")
+
+log = get_logger("ipfs")
+
+
+class BlobCache:
+    """Content-addressed cache for immutable IPFS blobs.
+
+    Two LRU tiers: a small in-memory one and a larger on-disk one (one file per
+    CID, access order tracked via mtime). Content is checked against its CID on
+    insert, so a bad gateway response can never poison the cache. Content whose
+    CID cannot be checked locally (see verify_cid) is counted as unverified.
+    """
+
+    def __init__(self, directory: Optional[str], memory_bytes: int = 32 * 1024 * 1024,
+                 disk_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                      "inserts": 0, "rejected": 0, "unverified": 0, "evictions": 0}
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, cid: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(cid)
+            if data is not None:
+                self._memory.move_to_end(cid)
+                self.stats["memory_hits"] += 1
+                return data
+            on_disk = cid in self._disk
+        if on_disk:
+            try:
+                path = self._path(cid)
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    if cid in self._disk:
+                        self._disk.move_to_end(cid)
+                    self.stats["disk_hits"] += 1
+                    self._remember(cid, data)
+                return data
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, cid: str, data: bytes) -> bool:
+        """Insert a blob; False if it does not match its CID"""
+        if not _SAFE_CID.match(cid):
+            return False
+        verified = verify_cid(cid, data)
+        with self._lock:
+            if verified is False:
+                self.stats["rejected"] += 1
+                return False
+            if verified is None:
+                self.stats["unverified"] += 1
+            self.stats["inserts"] += 1
+            self._remember(cid, data)
+        if self.directory and len(data) <= self.disk_bytes:
+            self._write_disk(cid, data)
+        return True
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, cid)
+
+    def _remember(self, cid: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        if cid in self._memory:
+            self._memory.move_to_end(cid)
+            return
+        self._memory[cid] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+
+    def _write_disk(self, cid: str, data: bytes):
+        path = self._path(cid)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("✗ Cache write error", error=str(e))
+            return
+        evict = []
+        with self._lock:
+            if cid not in self._disk:
+                self._disk[cid] = len(data)
+                self._disk_size += len(data)
+            self._disk.move_to_end(cid)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                self.stats["evictions"] += 1
+                evict.append(old)
+        for old in evict:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.endswith(".tmp"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_size += size
+
+
+class GatewayFetcher:
+    """Fetches CIDs through several IPFS gateways with hedged requests.
+
+    The first gateway (lowest average latency once measured) is asked right
+    away; each further gateway joins after `hedge_delay` seconds if no valid
+    answer has arrived. The first response that matches its CID wins and the
+    remaining downloads are abandoned. Concurrent fetches of the same CID share
+    one download.
+    """
+
+    def __init__(self, gateways: List[str], cache: Optional[BlobCache] = None,
+                 session: Optional[requests.Session] = None, timeout: float = 30.0,
+                 hedge_delay: float = 0.3, max_bytes: int = 10 * 1024 * 1024):
+        self.gateways = [g if g.endswith("/") else g + "/" for g in gateways]
+        self.cache = cache
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.max_bytes = max_bytes
+        self.gateway_stats: Dict[str, Dict[str, float]] = {
+            g: {"requests": 0, "wins": 0, "errors": 0, "cancelled": 0, "latency_ms_avg": 0.0}
+            for g in self.gateways
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max(4, len(self.gateways) * 4),
+                                        thread_name_prefix="ipfs-gw")
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, cid: str) -> Optional[bytes]:
+        if self.cache is not None:
+            data = self.cache.get(cid)
+            if data is not None:
+                return data
+
+        with self._lock:
+            waiter = self._inflight.get(cid)
+            leader = waiter is None
+            if leader:
+                waiter = self._inflight[cid] = threading.Event()
+        if not leader:
+            waiter.wait(self.timeout)
+            return self.cache.get(cid) if self.cache is not None else None
+
+        try:
+            data = self._race(cid)
+            if data is not None and self.cache is not None:
+                self.cache.put(cid, data)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(cid, None)
+            waiter.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            gateways = {g: dict(s) for g, s in self.gateway_stats.items()}
+        out = {"gateways": gateways}
+        if self.cache is not None:
+            out["cache"] = dict(self.cache.stats, hit_rate=round(self.cache.hit_rate(), 4))
+        return out
+
+    def _ranked(self) -> List[str]:
+        with self._lock:
+            def score(g):
+                s = self.gateway_stats[g]
+                # Untried gateways keep config order; errors push a gateway back
+                if not s["latency_ms_avg"]:
+                    return float("inf") if s["errors"] else 0.0
+                return s["latency_ms_avg"] * (1 + s["errors"] / (s["requests"] or 1))
+            return sorted(self.gateways, key=score)
+
+    def _race(self, cid: str) -> Optional[bytes]:
+        cancel = threading.Event()
+        pending = set()
+        gateways = self._ranked()
+        deadline = time.time() + self.timeout
+        result = None
+        try:
+            for i, gateway in enumerate(gateways):
+                pending.add(self._pool.submit(self._get, gateway, cid, cancel))
+                # Give the requests already out a head start before hedging
+                hedge_until = time.time() + self.hedge_delay if i + 1 < len(gateways) else deadline
+                while pending and result is None:
+                    done, pending = wait(pending, timeout=max(0.0, hedge_until - time.time()),
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.result() is not None and result is None:
+                            result = future.result()
+                    if not done:
+                        break
+                if result is not None or time.time() >= deadline:
+                    break
+            if result is None and pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.time()))
+                for future in done:
+                    if future.result() is not None:
+                        result = future.result()
+                        break
+        finally:
+            cancel.set()
+        return result
+
+    def _get(self, gateway: str, cid: str, cancel: threading.Event) -> Optional[bytes]:
+        stats = self.gateway_stats[gateway]
+        with self._lock:
+            stats["requests"] += 1
+        start = time.time()
+        try:
+            with self.session.get(f"{gateway}{cid}", timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(64 * 1024):
+                    if cancel.is_set():
+                        with self._lock:
+                            stats["cancelled"] += 1
+                        return None
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"blob larger than {self.max_bytes} bytes")
+                    chunks.append(chunk)
+            data = b"".join(chunks)
+            if verify_cid(cid, data) is False:
+                raise ValueError("content does not match CID")
+        except Exception as e:
+            with self._lock:
+                stats["errors"] += 1
+            if not cancel.is_set():
+                log.warning("✗ Gateway failed", gateway=gateway, cid=cid, error=str(e))
+            return None
+
+        elapsed_ms = (time.time() - start) * 1000
+        with self._lock:
+            # Exponential moving average so a gateway's ranking follows recent latency
+            avg = stats["latency_ms_avg"]
+            stats["latency_ms_avg"] = round(elapsed_ms if not avg else avg * 0.8 + elapsed_ms * 0.2, 1)
+            if cancel.is_set():
+                stats["cancelled"] += 1
+                return None
+            stats["wins"] += 1
+        return data
@@ -0,0 +1,223 @@
+import struct
+from typing import Dict, Iterator, List, Optional, Union
+
+from solders.pubkey import Pubkey
+
+JOB_ACCOUNT_SIZE = 8 + 300
+OWNER_OFFSET = 8
+STRINGS_OFFSET = 8 + 32
+
+_U32 = struct.Struct('<I')
+# start_time, end_time, status, job_type, cost, cost_paid, bump
+_TAIL = struct.Struct('<qqBBQBB')
+_STATUS_SKIP = 16  # start_time + end_time precede the status byte
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class JobStatus:
+    PENDING = 0
+    COMPLETED = 1
+    CANCELLED = 2
+
+    @staticmethod
+    def to_string(status: int) -> str:
+        return {0: "PENDING", 1: "COMPLETED", 2: "CANCELLED"}.get(status, f"UNKNOWN({status})")
+
+
+class JobType:
+    CRON = 0
+    API = 1
+    MANUAL = 2
+
+    @staticmethod
+    def to_string(job_type: int) -> str:
+        return {0: "CRON", 1: "API", 2: "MANUAL"}.get(job_type, f"UNKNOWN({job_type})")
+
+
+class JobRecord:
+    """A Job account decoded on demand from a shared buffer.
+
+    Only the three string length prefixes and the status byte are read up
+    front, and the strings checked to be valid UTF-8 so an account the eager
+    decoder rejects is rejected here too; everything else is decoded (and
+    cached) on first access. Supports
+    the same item access as the dicts returned by deserialize_job, so it can
+    stand in for them.
+    """
+
+    __slots__ = ("_buf", "_base", "_title", "_code", "_result", "_tail",
+                 "_owner", "_tail_values", "status", "account_address")
+
+    def __init__(self, buf: memoryview, base: int = 0):
+        self._buf = buf
+        self._base = base
+        offset = base + STRINGS_OFFSET
+        # (start, end) of each string within the buffer
+        title_len = _U32.unpack_from(buf, offset)[0]
+        self._title = (offset + 4, offset + 4 + title_len)
+        offset = self._title[1]
+        code_len = _U32.unpack_from(buf, offset)[0]
+        self._code = (offset + 4, offset + 4 + code_len)
+        offset = self._code[1]
+        result_len = _U32.unpack_from(buf, offset)[0]
+        self._result = (offset + 4, offset + 4 + result_len)
+        self._tail = self._result[1]
+        if self._tail + _TAIL.size > base + JOB_ACCOUNT_SIZE or self._tail + _TAIL.size > len(buf):
+            raise ValueError("corrupt Job account")
+        if (title_len | code_len | result_len) < 0x80:
+            # The length prefixes between the strings are then plain ASCII, so one
+            # decode of the whole span checks all three (Anchor caps them at 100 bytes)
+            buf[self._title[0]:self._tail].tobytes().decode('utf-8')
+        else:
+            for span in (self._title, self._code, self._result):
+                self._str(span)
+        self.status = buf[self._tail + _STATUS_SKIP]
+        self._owner = None
+        self._tail_values = None
+        self.account_address: Optional[str] = None
+
+    def _str(self, span) -> str:
+        return str(self._buf[span[0]:span[1]], 'utf-8')
+
+    def _unpack_tail(self):
+        if self._tail_values is None:
+            self._tail_values = _TAIL.unpack_from(self._buf, self._tail)
+        return self._tail_values
+
+    @property
+    def owner(self) -> str:
+        if self._owner is None:
+            start = self._base + OWNER_OFFSET
+            self._owner = str(Pubkey.from_bytes(bytes(self._buf[start:start + 32])))
+        return self._owner
+
+    @property
+    def title(self) -> str:
+        return self._str(self._title)
+
+    @property
+    def code_cid(self) -> str:
+        return self._str(self._code)
+
+    @property
+    def result_cid(self) -> str:
+        return self._str(self._result)
+
+    @property
+    def start_time(self) -> int:
+        return self._unpack_tail()[0]
+
+    @property
+    def end_time(self) -> int:
+        return self._unpack_tail()[1]
+
+    @property
+    def job_type(self) -> int:
+        return self._buf[self._tail + _STATUS_SKIP + 1]
+
+    @property
+    def cost(self) -> int:
+        return self._unpack_tail()[4]
+
+    @property
+    def cost_paid(self) -> bool:
+        return bool(self._unpack_tail()[5])
+
+    @property
+    def bump(self) -> int:
+        return self._unpack_tail()[6]
+
+    @property
+    def status_name(self) -> str:
+        return JobStatus.to_string(self.status)
+
+    @property
+    def job_type_name(self) -> str:
+        return JobType.to_string(self.job_type)
+
+    def detach(self) -> "JobRecord":
+        """Copy this account out of a shared (batch) buffer so the buffer can be freed"""
+        start = self._base
+        record = JobRecord(memoryview(bytes(self._buf[start:start + JOB_ACCOUNT_SIZE])))
+        record.account_address = self.account_address
+        return record
+
+    def to_dict(self) -> Dict:
+        job = {key: getattr(self, key) for key in _FIELDS}
+        if self.account_address is not None:
+            job["account_address"] = self.account_address
+        return job
+
+    # dict-style access, matching deserialize_job
+    def __getitem__(self, key: str):
+        if key in _FIELDS or (key == "account_address" and self.account_address is not None):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key != "account_address":
+            raise KeyError(f"{key} is read-only")
+        self.account_address = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in _FIELDS or (key == "account_address" and self.account_address is not None)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"JobRecord({self.account_address or '?'}, status={self.status_name})"
+
+
+_FIELDS = ("owner", "title", "code_cid", "result_cid", "start_time", "end_time",
+           "status", "status_name", "job_type", "job_type_name", "cost", "cost_paid", "bump")
+
+
+def decode_job(data: Buffer) -> Optional[JobRecord]:
+    """Lazily decode one Job account; None if it is not a valid Job layout"""
+    try:
+        return JobRecord(data if isinstance(data, memoryview) else memoryview(data))
+    except (ValueError, struct.error, IndexError):
+        return None
+
+
+def iter_jobs(buffer: Buffer, stride: int = JOB_ACCOUNT_SIZE) -> Iterator[Optional[JobRecord]]:
+    """Decode fixed-size Job accounts laid out back to back in one buffer.
+
+    Yields one record per slot (None for undecodable ones); records share the
+    buffer, so call detach() on any you keep after the buffer goes away.
+    """
+    view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+    for base in range(0, len(view) - stride + 1, stride):
+        try:
+            yield JobRecord(view, base)
+        except (ValueError, struct.error, IndexError):
+            yield None
+
+
+def pending_jobs(buffer: Buffer, stride: int = JOB_ACCOUNT_SIZE,
+                 pending: int = JobStatus.PENDING) -> List[JobRecord]:
+    """All pending records from a batch buffer, detached from it.
+
+    Non-pending accounts are skipped after reading three length prefixes and
+    the status byte; no record object is built for them.
+    """
+    view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+    unpack = _U32.unpack_from
+    records = []
+    for base in range(0, len(view) - stride + 1, stride):
+        try:
+            offset = base + STRINGS_OFFSET
+            offset += 4 + unpack(view, offset)[0]
+            offset += 4 + unpack(view, offset)[0]
+            offset += 4 + unpack(view, offset)[0]
+            if view[offset + _STATUS_SKIP] != pending:
+                continue
+            records.append(JobRecord(view, base).detach())
+        except (ValueError, struct.error, IndexError):
+            continue
+    return records
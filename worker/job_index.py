@@ -0,0 +1,216 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class RunState:
+    IDLE = "idle"
+    IN_FLIGHT = "in_flight"
+    SUBMITTED = "submitted"  # completion sent, waiting for the account to leave PENDING
+    FAILED = "failed"
+
+
+class IndexEntry:
+    __slots__ = ("address", "slot", "data_hash", "probe_hash", "status", "job",
+                 "state", "attempts", "retry_at", "updated_at")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.slot = 0
+        self.data_hash: Optional[bytes] = None
+        self.probe_hash: Optional[bytes] = None
+        self.status: Optional[int] = None
+        self.job: Optional[Dict] = None
+        self.state = RunState.IDLE
+        self.attempts = 0
+        self.retry_at = 0.0
+        self.updated_at = 0.0
+
+
+class IndexDiff:
+    def __init__(self):
+        self.new: List[Dict] = []
+        self.changed: List[Dict] = []
+        self.settled: List[str] = []  # left PENDING (completed or cancelled)
+        self.removed: List[str] = []
+
+    def __bool__(self):
+        return bool(self.new or self.changed or self.settled or self.removed)
+
+    def __repr__(self):
+        return (f"IndexDiff(new={len(self.new)}, changed={len(self.changed)}, "
+                f"settled={len(self.settled)}, removed={len(self.removed)})")
+
+
+class JobIndex:
+    """In-process index of Job accounts keyed by account address.
+
+    Each entry remembers the last slot and data hash it was seen at, so an
+    unchanged account is never decoded twice, and the run state of the job, so
+    a job whose completion has not landed yet is not executed again.
+    `decode` turns raw account data into a job dict (None if undecodable);
+    `pending` is the status value that makes a job runnable.
+    """
+
+    def __init__(self, decode: Callable[[bytes], Optional[Dict]], pending: int = 0,
+                 retry_delay: float = 30.0, submitted_timeout: float = 120.0,
+                 max_attempts: int = 5):
+        self.decode = decode
+        self.pending = pending
+        self.retry_delay = retry_delay
+        self.submitted_timeout = submitted_timeout
+        self.max_attempts = max_attempts
+        self.decoded = 0
+        self._entries: Dict[str, IndexEntry] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, address: str) -> Optional[IndexEntry]:
+        with self._lock:
+            return self._entries.get(address)
+
+    def probe_changed(self, address: str, probe: bytes, status: Optional[int],
+                      diff: Optional[IndexDiff] = None) -> bool:
+        """Record a partial (sliced) view of an account.
+
+        Returns True if full data should be fetched: the account is new or its
+        slice changed, and it is (or may be) pending.
+        """
+        probe_hash = hashlib.blake2b(probe, digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and entry.probe_hash == probe_hash and (
+                    entry.data_hash is not None or (status is not None and status != self.pending)):
+                return False
+            if entry is None:
+                entry = self._entries[address] = IndexEntry(address)
+            entry.probe_hash = probe_hash
+            if status is not None and status != self.pending:
+                if self._settle(entry, status) and diff is not None:
+                    diff.settled.append(address)
+                return False
+            return True
+
+    def observe(self, address: str, data: bytes, slot: int, diff: Optional[IndexDiff] = None) -> Optional[str]:
+        """Record full account data seen at `slot`.
+
+        Returns "new", "changed" or None (unchanged or older than what we have),
+        and appends the decoded job to `diff` when given.
+        """
+        data_hash = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and (slot < entry.slot or entry.data_hash == data_hash):
+                if slot > entry.slot:
+                    entry.slot = slot
+                return None
+
+        job = self.decode(data)
+        if job is None:
+            return None
+        job["account_address"] = address
+
+        with self._lock:
+            self.decoded += 1
+            entry = self._entries.get(address)
+            kind = "changed" if entry is not None and entry.data_hash is not None else "new"
+            if entry is None:
+                entry = self._entries[address] = IndexEntry(address)
+            entry.slot = max(entry.slot, slot)
+            entry.data_hash = data_hash
+            entry.job = job
+            entry.updated_at = time.time()
+            if job["status"] != self.pending:
+                settled = self._settle(entry, job["status"])
+            else:
+                settled = False
+                entry.status = job["status"]
+
+        if diff is not None:
+            (diff.new if kind == "new" else diff.changed).append(job)
+            if settled:
+                diff.settled.append(address)
+        return kind
+
+    def retain(self, addresses: Iterable[str]) -> List[str]:
+        """Drop entries not in `addresses` (a full sweep); returns the removed ones"""
+        keep = set(addresses)
+        with self._lock:
+            removed = [a for a, e in self._entries.items()
+                       if a not in keep and e.state != RunState.IN_FLIGHT]
+            for address in removed:
+                del self._entries[address]
+        return removed
+
+    def claim(self, address: str) -> bool:
+        """Mark a pending job as in flight. False if it is not runnable right now."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None or entry.job is None or entry.status != self.pending:
+                return False
+            if not self._runnable(entry, now):
+                return False
+            entry.state = RunState.IN_FLIGHT
+            entry.attempts += 1
+            return True
+
+    def unclaim(self, address: str):
+        """Undo a claim for a job that never started (e.g. the pipeline was full)"""
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is not None and entry.state == RunState.IN_FLIGHT:
+                entry.state = RunState.IDLE
+                entry.attempts = max(0, entry.attempts - 1)
+
+    def release(self, address: str, completed: bool):
+        """Record the outcome of a claimed job"""
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None or entry.state != RunState.IN_FLIGHT:
+                return
+            if completed:
+                entry.state = RunState.SUBMITTED
+                entry.retry_at = time.time() + self.submitted_timeout
+            else:
+                entry.state = RunState.FAILED
+                entry.retry_at = time.time() + self.retry_delay * entry.attempts
+
+    def runnable(self) -> List[Dict]:
+        """Pending jobs that may be claimed now (new, retry due, or completion lost)"""
+        now = time.time()
+        with self._lock:
+            return [e.job for e in self._entries.values()
+                    if e.job is not None and e.status == self.pending and self._runnable(e, now)]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {RunState.IDLE: 0, RunState.IN_FLIGHT: 0, RunState.SUBMITTED: 0, RunState.FAILED: 0}
+            for entry in self._entries.values():
+                if entry.status == self.pending:
+                    counts[entry.state] += 1
+            counts["accounts"] = len(self._entries)
+            return counts
+
+    def _runnable(self, entry: IndexEntry, now: float) -> bool:
+        if entry.state == RunState.IDLE:
+            return True
+        if entry.state == RunState.IN_FLIGHT:
+            return False
+        if entry.state == RunState.FAILED and entry.attempts >= self.max_attempts:
+            return False
+        return now >= entry.retry_at
+
+    def _settle(self, entry: IndexEntry, status: int) -> bool:
+        """Record a non-pending status; True if the job was pending before"""
+        was_pending = entry.status == self.pending
+        entry.status = status
+        if entry.job is not None and entry.job["status"] != status:
+            entry.job = None
+        if entry.state != RunState.IN_FLIGHT:
+            entry.state = RunState.IDLE
+            entry.attempts = 0
+        return was_pending
@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from log import get_logger
+
+log = get_logger("journal")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    at REAL NOT NULL,
+    fields TEXT NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS events_address ON events (address, id);
+"""
+
+
+class JobJournal:
+    """Append-only log of each job's stage outcomes in SQLite (WAL mode).
+
+    Events per job account, in order:
+      executed   code_cid, code_bytes and the encoded result (the bytes that get pinned)
+      uploaded   result_cid, cost
+      sent       signature, last_valid_block_height (again on every re-send)
+      rejected   the sent transaction failed or expired, so it can be sent anew
+      confirmed  signature
+    A job's events are folded into one progress dict (kept in memory, result
+    bodies stay on disk) that the worker resumes from after a restart.
+    forget() drops the events of jobs that left PENDING on-chain.
+
+    Writes are committed one at a time; with WAL and synchronous=NORMAL a
+    committed event survives the process dying at any point.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.stats = {"events": 0, "forgotten": 0, "errors": 0}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._progress: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        for event_id, address, stage, at, fields in self._db.execute(
+                "SELECT id, address, stage, at, fields FROM events ORDER BY id"):
+            self._fold(address, event_id, stage, at, json.loads(fields))
+
+    def record(self, address: str, stage: str, body: Optional[bytes] = None, **fields):
+        """Append one stage outcome; errors are logged, never raised into the pipeline"""
+        at = time.time()
+        try:
+            with self._lock:
+                cursor = self._db.execute(
+                    "INSERT INTO events (address, stage, at, fields, result) VALUES (?, ?, ?, ?, ?)",
+                    (address, stage, at, json.dumps(fields), body))
+                self._fold(address, cursor.lastrowid, stage, at, fields)
+                self.stats["events"] += 1
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            log.warning("✗ Journal write failed", job=address, stage=stage, error=str(e))
+
+    def progress(self, address: str) -> Optional[Dict]:
+        """Folded state of a job: stage, at, code_cid, code_bytes, result_cid, cost,
+        signature, last_valid_block_height, confirmed_at (whichever are known)"""
+        with self._lock:
+            progress = self._progress.get(address)
+            return dict(progress) if progress is not None else None
+
+    def result(self, address: str) -> Optional[bytes]:
+        """The encoded result recorded by the job's latest `executed` event"""
+        with self._lock:
+            progress = self._progress.get(address)
+            if progress is None or "result_id" not in progress:
+                return None
+            row = self._db.execute("SELECT result FROM events WHERE id = ?", (progress["result_id"],)).fetchone()
+        if not row or not row[0]:
+            return None
+        return row[0] if isinstance(row[0], bytes) else row[0].encode('utf-8')
+
+    def open_jobs(self) -> Dict[str, Dict]:
+        """address -> progress for every job still in the journal"""
+        with self._lock:
+            return {address: dict(progress) for address, progress in self._progress.items()}
+
+    def forget(self, addresses: Iterable[str]):
+        """Delete the events of jobs that no longer need resuming"""
+        with self._lock:
+            known = [address for address in addresses if address in self._progress]
+            if not known:
+                return
+            try:
+                self._db.executemany("DELETE FROM events WHERE address = ?", [(a,) for a in known])
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                log.warning("✗ Journal cleanup failed", error=str(e))
+                return
+            for address in known:
+                del self._progress[address]
+            self.stats["forgotten"] += len(known)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._progress)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _fold(self, address: str, event_id: int, stage: str, at: float, fields: Dict):
+        progress = self._progress.get(address)
+        if stage == "executed" or progress is None:
+            progress = self._progress[address] = {}
+        if stage == "executed":
+            progress["result_id"] = event_id
+        elif stage == "uploaded":
+            progress.pop("signature", None)
+            progress.pop("confirmed_at", None)
+        elif stage == "rejected":
+            progress.pop("signature", None)
+            progress.pop("last_valid_block_height", None)
+        elif stage == "confirmed":
+            progress["confirmed_at"] = at
+        progress.update(fields)
+        progress["stage"] = stage
+        progress["at"] = at
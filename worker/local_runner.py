@@ -0,0 +1,47 @@
+"""Warm interpreter for the local executor.
+
+Started by executors.LocalPoolExecutor. Reads one JSON message per line on
+stdin: the first carries the handler source (LAMBDA_CODE), every later one is
+a Lambda event. Each event gets one JSON line back with the handler's response.
+The real stdout is kept for replies only; anything job code writes to fd 1
+goes to stderr instead.
+"""
+import json
+import os
+import sys
+
+
+def main():
+    replies = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    first = sys.stdin.readline()
+    if not first:
+        return
+    namespace = {"__name__": "lambda_function"}
+    exec(compile(json.loads(first)["handler_source"], "lambda_function.py", "exec"), namespace)
+    handler = namespace["lambda_handler"]
+    replies.write(json.dumps({"ready": True}) + "\n")
+    replies.flush()
+
+    for line in sys.stdin:
+        event = json.loads(line)
+        try:
+            response = handler(event, None)
+        except BaseException as e:
+            response = {
+                "statusCode": 500,
+                "body": {
+                    "status": "error",
+                    "job_title": event.get("job_title"),
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                },
+            }
+        replies.write(json.dumps(response) + "\n")
+        replies.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Optional
+
+ROOT = "cloudmesh"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """`message  key=value ...` for humans, or one JSON object per line"""
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        if self.json_lines:
+            entry = {
+                "ts": round(record.created, 3),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "msg": record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        text = record.getMessage()
+        if fields:
+            text += "  " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+class Logger:
+    """Leveled logger taking structured fields: log.info("✓ Uploaded", cid=cid)
+
+    Calls below the configured level return before anything is formatted.
+    """
+
+    __slots__ = ("_logger",)
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def enabled(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, msg: str, **fields):
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(msg, extra={"fields": fields})
+
+    def info(self, msg: str, **fields):
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(msg, extra={"fields": fields})
+
+    def warning(self, msg: str, **fields):
+        if self._logger.isEnabledFor(logging.WARNING):
+            self._logger.warning(msg, extra={"fields": fields})
+
+    def error(self, msg: str, exc_info: bool = False, **fields):
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.error(msg, exc_info=exc_info, extra={"fields": fields})
+
+
+def get_logger(name: str) -> Logger:
+    """Logger under the worker's root, e.g. get_logger("ipfs") -> cloudmesh.ipfs"""
+    return Logger(f"{ROOT}.{name}")
+
+
+def configure(level: str = "info", fmt: str = "text", stream=None):
+    """Send worker logs through a queue to `stream` (stdout by default).
+
+    Threads only enqueue records; one listener thread formats and writes
+    them, so logging never blocks a pipeline stage on terminal or pipe I/O.
+    """
+    global _listener
+    shutdown()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(StructuredFormatter(json_lines=fmt == "json"))
+    records: "queue.Queue" = queue.Queue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(shutdown)
+
+    root = logging.getLogger(ROOT)
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    root.propagate = False
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,35 +1,258 @@
-from solana.rpc.api import Client
 from solders.pubkey import Pubkey
 from solders.keypair import Keypair
 from solders.transaction import Transaction
 from solders.instruction import Instruction, AccountMeta
 from solders.message import Message
+from solders.signature import Signature
 import struct
 import base64
 import time
 import json
-import requests
 import hashlib
 import zipfile
 import io
+import threading
+import socket
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
+from pipeline import JobPipeline
+from subscriptions import JobSubscriber, ws_url_from_http
+from job_index import JobIndex, IndexDiff
+from ipfs_cache import BlobCache, GatewayFetcher
+from cid import b58encode
+from account_stream import keyspace_slices
+from clients import WorkerClients
+from completion import CompletionBatcher
+from confirmation import ConfirmationTracker
+from journal import JobJournal
+from sharding import ShardRing, ShardAssignment, ShardLeases
+from scheduler import JobScheduler, parse_weights
+from result_cache import ResultCache, result_key
+from pinning import PinQueue
+from blockhash import BlockhashProvider
+from metrics import Registry, MetricsServer, JobTracer
+from log import get_logger, configure as configure_logging, shutdown as shutdown_logging
+from executors import Executor, LambdaExecutor, LambdaBatchExecutor, LocalPoolExecutor, ExecutorRouter, decode_body
+from job_decoder import JobStatus, JobType, decode_job, JOB_ACCOUNT_SIZE, STRINGS_OFFSET as JOB_STRINGS_OFFSET, \
+    OWNER_OFFSET as JOB_OWNER_OFFSET
 import signal
 import sys
 import os
 
 NET_URL = os.getenv("SOLANA_RPC_URL")
-IPFS_GATEWAY = "https://ipfs.io/ipfs/"
+# More RPC endpoints pooled with SOLANA_RPC_URL: reads go to the healthiest, transactions to several
+RPC_URLS = [NET_URL] + [u.strip() for u in os.getenv("SOLANA_RPC_URLS", "").split(",")
+                        if u.strip() and u.strip() != NET_URL]
+IPFS_GATEWAYS = [g.strip() for g in os.getenv(
+    "IPFS_GATEWAYS",
+    "https://gateway.pinata.cloud/ipfs/,https://ipfs.io/ipfs/,https://dweb.link/ipfs/"
+).split(",") if g.strip()]
+IPFS_HEDGE_DELAY_MS = int(os.getenv("IPFS_HEDGE_DELAY_MS", "300"))
+IPFS_CACHE_DIR = os.path.expanduser(os.getenv("IPFS_CACHE_DIR", "~/.cache/cloudmesh/ipfs"))
+IPFS_CACHE_MEMORY_MB = int(os.getenv("IPFS_CACHE_MEMORY_MB", "64"))
+IPFS_CACHE_DISK_MB = int(os.getenv("IPFS_CACHE_DISK_MB", "1024"))
 
 AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "ap-south-1")
 LAMBDA_FUNCTION_NAME = "solana-job-executor"
+# Jobs executing at the same time are sent to Lambda together (1 = one invoke per job)
+LAMBDA_BATCH_SIZE = int(os.getenv("LAMBDA_BATCH_SIZE", "8"))
+# Seconds each job may run on Lambda, alone or in a batch; the function timeout leaves room for a full
+# batch and the handler defers a job rather than start it with less than this left
+LAMBDA_JOB_TIMEOUT = float(os.getenv("LAMBDA_JOB_TIMEOUT", "25"))
+LAMBDA_SETTINGS = {
+    'Runtime': 'python3.11',
+    'Handler': 'lambda_function.lambda_handler',
+    'Timeout': min(900, int(LAMBDA_JOB_TIMEOUT * max(1, LAMBDA_BATCH_SIZE)) + 10),
+    'MemorySize': 512,
+}
+LAMBDA_BATCH_WINDOW_MS = int(os.getenv("LAMBDA_BATCH_WINDOW_MS", "50"))
+LAMBDA_BATCH_MAX_KB = int(os.getenv("LAMBDA_BATCH_MAX_KB", "1024"))
+# zlib-compress code sent to Lambda and results sent back
+LAMBDA_COMPRESS = os.getenv("LAMBDA_COMPRESS", "1") == "1"
+# stdout/stderr kept per job; the middle of longer output is dropped
+OUTPUT_LIMIT_KB = int(os.getenv("OUTPUT_LIMIT_KB", "256"))
 
 PINATA_JWT = os.getenv("PINATA_JWT")
+PINATA_API_URL = os.getenv("PINATA_API_URL", "https://api.pinata.cloud").rstrip("/")
 
-client = Client(NET_URL)
+# "lambda" = Lambda only, "local" = local pool only, "auto" = local pool for small API/MANUAL jobs and
+# Lambda for the rest. The local pool runs untrusted job code on this host, so it is opt-in
+EXECUTOR = os.getenv("EXECUTOR", "lambda")
+LOCAL_EXECUTOR_WORKERS = int(os.getenv("LOCAL_EXECUTOR_WORKERS", "4"))
+LOCAL_EXECUTOR_TIMEOUT = float(os.getenv("LOCAL_EXECUTOR_TIMEOUT", "30"))
+LOCAL_EXECUTOR_MEMORY_MB = int(os.getenv("LOCAL_EXECUTOR_MEMORY_MB", "512"))
+LOCAL_MAX_CODE_BYTES = int(os.getenv("LOCAL_MAX_CODE_BYTES", "16384"))
+LOCAL_JOB_TYPES = [t.strip().upper() for t in os.getenv("LOCAL_JOB_TYPES", "API,MANUAL").split(",") if t.strip()]
+# Unprivileged user local job processes run as; by default "nobody" when the worker runs as root, else its own user
+LOCAL_EXECUTOR_USER = os.getenv("LOCAL_EXECUTOR_USER", "nobody" if os.name == "posix" and os.geteuid() == 0 else "")
+# Interpreter for local job processes; LOCAL_EXECUTOR_USER must be able to run it (default: the worker's)
+LOCAL_EXECUTOR_PYTHON = os.getenv("LOCAL_EXECUTOR_PYTHON") or sys.executable
+
+PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", "8"))
+PIPELINE_EXECUTE_WORKERS = int(os.getenv("PIPELINE_EXECUTE_WORKERS", "16"))
+# Upload and complete workers mostly wait on batched pins and transactions, so there are many of them
+PIPELINE_UPLOAD_WORKERS = int(os.getenv("PIPELINE_UPLOAD_WORKERS", "32"))
+PIPELINE_COMPLETE_WORKERS = int(os.getenv("PIPELINE_COMPLETE_WORKERS", "32"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+
+# Dispatch order between discovery and the pipeline: weighted fair share per job type, oldest
+# start_time first, at most SCHEDULER_OWNER_CAP jobs of one owner in flight (0 = no cap)
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "API=8,MANUAL=2,CRON=1")
+SCHEDULER_OWNER_CAP = int(os.getenv("SCHEDULER_OWNER_CAP", "4"))
+SCHEDULER_MAX_QUEUED = int(os.getenv("SCHEDULER_MAX_QUEUED", "10000"))  # per job type
+# Jobs admitted while this many are already waiting for or running in the fetch and execute stages
+SCHEDULER_ADMIT_AHEAD = int(os.getenv(
+    "SCHEDULER_ADMIT_AHEAD", str(PIPELINE_FETCH_WORKERS + PIPELINE_EXECUTE_WORKERS)))
+
+# Results are spooled to PIN_SPOOL_DIR ("" keeps them in memory) and pinned by PIN_CONCURRENCY
+# requests of up to PIN_BATCH_SIZE results, retried with backoff; a job completes only once pinned
+PIN_SPOOL_DIR = os.path.expanduser(os.getenv("PIN_SPOOL_DIR", "~/.local/share/cloudmesh/pin-spool"))
+PIN_CONCURRENCY = int(os.getenv("PIN_CONCURRENCY", "4"))
+PIN_BATCH_SIZE = int(os.getenv("PIN_BATCH_SIZE", "16"))
+PIN_BATCH_WINDOW_MS = int(os.getenv("PIN_BATCH_WINDOW_MS", "100"))
+PIN_MAX_ATTEMPTS = int(os.getenv("PIN_MAX_ATTEMPTS", "5"))
+PIN_TIMEOUT = float(os.getenv("PIN_TIMEOUT", "120"))  # how long a job waits for its pin
+
+# complete_job instructions are packed into shared transactions
+COMPLETION_BATCH_WINDOW_MS = int(os.getenv("COMPLETION_BATCH_WINDOW_MS", "250"))
+COMPLETION_BATCH_SIZE = int(os.getenv("COMPLETION_BATCH_SIZE", "16"))
+COMPLETION_TIMEOUT = float(os.getenv("COMPLETION_TIMEOUT", "90"))
+CONFIRM_COMMITMENT = os.getenv("CONFIRM_COMMITMENT", "confirmed")
+CONFIRM_MAX_RESENDS = int(os.getenv("CONFIRM_MAX_RESENDS", "3"))
+BLOCKHASH_REFRESH_INTERVAL = float(os.getenv("BLOCKHASH_REFRESH_INTERVAL", "20"))
+
+# "filtered" = server-side discriminator/size filter + sliced status probe, "full" = legacy scan
+DISCOVERY_MODE = os.getenv("DISCOVERY_MODE", "filtered")
+DISCOVERY_PROBE_BYTES = int(os.getenv("DISCOVERY_PROBE_BYTES", "160"))
+DISCOVERY_BATCH_SIZE = 100  # getMultipleAccounts limit
+# Sweeps stream getProgramAccounts and decode accounts as they arrive; with DISCOVERY_SLICE_BYTES=n they
+# also page through the accounts in 256**n requests, one per prefix of the job owner's key (0 = one request)
+DISCOVERY_SLICE_BYTES = int(os.getenv("DISCOVERY_SLICE_BYTES", "0"))
+# Push discovery over the RPC websocket; polling then only runs as a slow reconciliation sweep
+DISCOVERY_SUBSCRIBE = os.getenv("DISCOVERY_SUBSCRIBE", "1") == "1"
+DISCOVERY_WS_URL = os.getenv("SOLANA_WS_URL") or ws_url_from_http(NET_URL)
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "60"))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "30"))
+JOB_SUBMITTED_TIMEOUT = int(os.getenv("JOB_SUBMITTED_TIMEOUT", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Several workers split the job accounts into SHARD_COUNT shards by consistent hash of the address.
+# SHARD_INDEX pins this worker's shard; with SHARD_LEASE_PATH (a SQLite file on a local disk, so for the
+# workers of one host only) shards are leased instead, SHARD_INDEX is only preferred and a silent worker's
+# shards are taken over
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX = os.getenv("SHARD_INDEX", "")
+SHARD_LEASE_PATH = os.path.expanduser(os.getenv("SHARD_LEASE_PATH", ""))
+SHARD_LEASE_TTL = float(os.getenv("SHARD_LEASE_TTL", "30"))
+# Stage outcomes per job, so a restart resumes jobs instead of re-running them ("" disables)
+JOURNAL_PATH = os.path.expanduser(os.getenv("JOURNAL_PATH", "~/.local/share/cloudmesh/journal.db"))
+# Opt-in memoization of deterministic jobs: a job whose code CID, job type and handler version match an
+# output stored less than RESULT_CACHE_TTL seconds ago reuses that output instead of running (0 disables)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_PATH = os.path.expanduser(os.getenv("RESULT_CACHE_PATH", "~/.cache/cloudmesh/results.db"))
+RESULT_CACHE_JOB_TYPES = frozenset(
+    name.strip().upper() for name in os.getenv("RESULT_CACHE_JOB_TYPES", "API,MANUAL").split(",") if name.strip())
+
+# Job account layout (see anchor/programs/counter/src/lib.rs)
+JOB_DISCRIMINATOR = hashlib.sha256(b"account:Job").digest()[:8]
+JOB_CREATED_DISCRIMINATOR = hashlib.sha256(b"event:JobCreated").digest()[:8]
+
+# Logging and telemetry
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables the endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # JSON line per finished job when set
+
+# Per-endpoint timeouts (seconds)
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10"))
+# RPC pool: requests/s per endpoint (0 = unlimited until it answers 429), latency percentile after
+# which a read is hedged to the next endpoint, retry rounds per read, endpoints each send goes to
+RPC_RATE_LIMIT = float(os.getenv("RPC_RATE_LIMIT", "0"))
+RPC_HEDGE_PERCENTILE = float(os.getenv("RPC_HEDGE_PERCENTILE", "0.9"))
+RPC_RETRIES = int(os.getenv("RPC_RETRIES", "2"))
+RPC_SEND_FANOUT = int(os.getenv("RPC_SEND_FANOUT", "3"))
+IPFS_TIMEOUT = float(os.getenv("IPFS_TIMEOUT", "30"))
+LAMBDA_READ_TIMEOUT = float(os.getenv("LAMBDA_READ_TIMEOUT") or LAMBDA_SETTINGS['Timeout'] + 10)
+PINATA_TIMEOUT = float(os.getenv("PINATA_TIMEOUT", "30"))
+
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+log = get_logger("worker")
+
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    "worker_stage_seconds", "Time a job spent running in each pipeline stage", ["stage", "outcome"])
+stage_wait_seconds = metrics.histogram(
+    "worker_stage_queue_wait_seconds", "Time a job waited in the queue in front of each stage", ["stage"])
+stage_errors = metrics.counter(
+    "worker_stage_errors_total", "Jobs dropped by each stage, by error class", ["stage", "error"])
+jobs_total = metrics.counter("worker_jobs_total", "Jobs that left the pipeline", ["outcome"])
+job_seconds = metrics.histogram(
+    "worker_job_seconds", "Time from queueing a job to it leaving the pipeline", ["outcome"])
+discovery_seconds = metrics.histogram("worker_discovery_seconds", "Duration of a polling sweep")
+ipfs_fetch_seconds = metrics.histogram("worker_ipfs_fetch_seconds", "Code download time, cache hits included", ["outcome"])
+ipfs_bytes = metrics.counter("worker_ipfs_bytes_total", "Bytes of job code fetched")
+execute_seconds = metrics.histogram("worker_execute_seconds", "Job execution time as seen by the worker", ["backend", "status"])
+upload_seconds = metrics.histogram("worker_upload_seconds", "Pinata request time", ["outcome"])
+upload_files = metrics.histogram(
+    "worker_upload_files", "Results pinned per Pinata request", buckets=(1, 2, 4, 8, 16, 32, 64))
+result_bytes = metrics.counter("worker_result_bytes_total", "Bytes of job results uploaded")
+blockhash_seconds = metrics.histogram("worker_blockhash_seconds", "Time to get a blockhash for a transaction")
+send_seconds = metrics.histogram("worker_send_transaction_seconds", "sendTransaction round trip")
+scheduler_wait_seconds = metrics.histogram(
+    "worker_scheduler_wait_seconds", "Time a job waited in the scheduler before entering the pipeline", ["job_type"])
+confirm_seconds = metrics.histogram(
+    "worker_confirmation_seconds", "Time from sending a transaction to its outcome", ["outcome"])
+
+clients = WorkerClients(
+    RPC_URLS,
+    aws_access_key=AWS_ACCESS_KEY, aws_secret_key=AWS_SECRET_KEY, aws_region=AWS_REGION,
+    pinata_jwt=PINATA_JWT,
+    # Pools match stage concurrency; every IPFS fetch may hedge across all gateways
+    rpc_pool=PIPELINE_FETCH_WORKERS + PIPELINE_COMPLETE_WORKERS + 2,
+    ipfs_pool=PIPELINE_FETCH_WORKERS * len(IPFS_GATEWAYS),
+    lambda_pool=PIPELINE_EXECUTE_WORKERS,
+    pinata_pool=PIN_CONCURRENCY,
+    rpc_timeout=RPC_TIMEOUT, ipfs_timeout=IPFS_TIMEOUT,
+    lambda_read_timeout=LAMBDA_READ_TIMEOUT, pinata_timeout=PINATA_TIMEOUT,
+    rpc_rate_limit=RPC_RATE_LIMIT or None, rpc_hedge_percentile=RPC_HEDGE_PERCENTILE,
+    rpc_retries=RPC_RETRIES, rpc_send_fanout=RPC_SEND_FANOUT,
+)
+client = clients.rpc
 running = True
+confirmations = ConfirmationTracker(
+    client, CONFIRM_COMMITMENT, max_resends=CONFIRM_MAX_RESENDS,
+    on_resolved=lambda outcome, seconds: confirm_seconds.observe(seconds, outcome=outcome)
+)
+blockhashes = BlockhashProvider(client, refresh_interval=BLOCKHASH_REFRESH_INTERVAL)
+ipfs_fetcher = GatewayFetcher(
+    IPFS_GATEWAYS,
+    cache=BlobCache(
+        IPFS_CACHE_DIR or None,
+        memory_bytes=IPFS_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_bytes=IPFS_CACHE_DISK_MB * 1024 * 1024,
+    ),
+    session=clients.ipfs,
+    timeout=IPFS_TIMEOUT,
+    hedge_delay=IPFS_HEDGE_DELAY_MS / 1000,
+)
+pins = PinQueue(
+    clients.pinata, PINATA_API_URL, PIN_SPOOL_DIR or None, timeout=clients.pinata_timeout,
+    concurrency=PIN_CONCURRENCY, max_batch=PIN_BATCH_SIZE, window=PIN_BATCH_WINDOW_MS / 1000,
+    max_attempts=PIN_MAX_ATTEMPTS,
+    on_request=lambda files, size, seconds, outcome: observe_pin_request(files, size, seconds, outcome),
+)
+# Replaced in main() once the configured backends are up
+executor: Executor = LambdaExecutor(clients, LAMBDA_FUNCTION_NAME)
+# Opened in main() when JOURNAL_PATH is set
+journal: Optional[JobJournal] = None
+# Opened in main() when RESULT_CACHE_TTL is set
+result_cache: Optional[ResultCache] = None
+# Every shard until main() applies the SHARD_* settings
+shards = ShardAssignment(ShardRing(SHARD_COUNT), frozenset(range(SHARD_COUNT)))
 
 def signal_handler(sig, frame):
     global running
@@ -44,223 +267,354 @@ import sys
 import io
 import traceback
 import time
+import hashlib
+import base64
+import signal
+import threading
+import zlib
+from collections import OrderedDict, deque
 from contextlib import redirect_stdout, redirect_stderr
 
-def lambda_handler(event, context):
+# Compiled job code, kept across warm invocations and keyed by content hash
+CODE_CACHE_SIZE = 256
+_code_cache = OrderedDict()
+
+# Later jobs of a batch are not started once less than their timeout plus this much of the invoke remains
+BATCH_RESERVE_MS = 5000
+
+class JobTimeout(BaseException):
+    """Raised in job code when its timeout_ms runs out (not an Exception, so plain handlers miss it)"""
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+# Characters of stdout/stderr kept per job unless the event sets output_limit
+OUTPUT_LIMIT = 256 * 1024
+# Bodies smaller than this are returned uncompressed even when compression is requested
+COMPRESS_MIN_BYTES = 1024
+
+class BoundedCapture(io.TextIOBase):
+    """Keeps the first and last limit/2 characters written, dropping the middle"""
+    
+    def __init__(self, limit):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = []
+        self.head_size = 0
+        self.tail = deque()
+        self.tail_size = 0
+        self.dropped = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, s):
+        written = len(s)
+        if self.head_size < self.head_limit:
+            part = s[:self.head_limit - self.head_size]
+            self.head.append(part)
+            self.head_size += len(part)
+            s = s[len(part):]
+        if s:
+            self.tail.append(s)
+            self.tail_size += len(s)
+            while self.tail_size > self.tail_limit:
+                excess = self.tail_size - self.tail_limit
+                first = self.tail[0]
+                if len(first) <= excess:
+                    self.tail.popleft()
+                    self.tail_size -= len(first)
+                    self.dropped += len(first)
+                else:
+                    self.tail[0] = first[excess:]
+                    self.tail_size -= excess
+                    self.dropped += excess
+        return written
+    
+    def getvalue(self):
+        marker = f"\\n... [{self.dropped} characters truncated] ...\\n" if self.dropped else ''
+        return ''.join(self.head) + marker + ''.join(self.tail)
+
+def encode_body(body, compress):
+    # Uncompressed bodies stay objects, so the invoke response is serialized once, not JSON inside JSON
+    if not compress:
+        return body
+    data = json.dumps(body)
+    if len(data) < COMPRESS_MIN_BYTES:
+        return body
+    packed = base64.b64encode(zlib.compress(data.encode('utf-8'))).decode('ascii')
+    return json.dumps({'encoding': 'zlib+base64', 'size': len(data), 'data': packed})
+
+def with_truncation(stdout_capture, stderr_capture, body):
+    if stdout_capture.dropped:
+        body['stdout_truncated'] = stdout_capture.dropped
+    if stderr_capture.dropped:
+        body['stderr_truncated'] = stderr_capture.dropped
+    return body
+
+def compile_code(code):
+    key = hashlib.sha256(code.encode('utf-8')).hexdigest()
+    compiled = _code_cache.get(key)
+    if compiled is not None:
+        _code_cache.move_to_end(key)
+        return compiled, True
+    compiled = compile(code, '<string>', 'exec')
+    _code_cache[key] = compiled
+    if len(_code_cache) > CODE_CACHE_SIZE:
+        _code_cache.popitem(last=False)
+    return compiled, False
+
+def run_job(event):
     start_time = time.time()
     
+    code = event.get('code', '')
+    if 'code_z' in event:
+        code = zlib.decompress(base64.b64decode(event['code_z'])).decode('utf-8')
+    job_title = event.get('job_title', 'Unnamed Job')
+    job_type = event.get('job_type', 'MANUAL')
+    owner = event.get('owner', 'unknown')
+    
+    if not code:
+        return 400, {
+            'status': 'error',
+            'error': 'No code provided',
+            'execution_time_ms': 0
+        }
+    
+    output_limit = event.get('output_limit') or OUTPUT_LIMIT
+    stdout_capture = BoundedCapture(output_limit)
+    stderr_capture = BoundedCapture(output_limit)
+    
+    # Use a "safe" builtins but include __import__ for import statements
+    safe_builtins = {
+        'print': print, 'len': len, 'range': range, 'str': str,
+        'int': int, 'float': float, 'bool': bool, 'list': list,
+        'dict': dict, 'tuple': tuple, 'set': set, 'sum': sum,
+        'max': max, 'min': min, 'abs': abs, 'round': round,
+        'sorted': sorted, 'enumerate': enumerate, 'zip': zip,
+        'map': map, 'filter': filter, 'any': any, 'all': all,
+        '__import__': __import__,  # <--- allow imports
+    }
+    
+    # Preloaded globals (can add more modules if needed)
+    safe_globals = {
+        '__builtins__': safe_builtins,
+        'json': json,
+        'time': time,
+    }
+    
+    exec_start = time.time()
+    cached = False
+    # Each job has its own deadline; signals only reach the main thread, which is where Lambda calls us
+    timeout_s = (event.get('timeout_ms') or 0) / 1000
+    armed = timeout_s > 0 and threading.current_thread() is threading.main_thread()
+    
     try:
-        code = event.get('code', '')
-        job_title = event.get('job_title', 'Unnamed Job')
-        job_type = event.get('job_type', 'MANUAL')
-        owner = event.get('owner', 'unknown')
-        
-        if not code:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'status': 'error',
-                    'error': 'No code provided',
-                    'execution_time_ms': 0
-                })
-            }
+        compiled, cached = compile_code(code)
+        with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
+            if armed:
+                previous = signal.signal(signal.SIGALRM, _on_alarm)
+                signal.setitimer(signal.ITIMER_REAL, timeout_s)
+            try:
+                exec(compiled, safe_globals)
+            finally:
+                if armed:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                    signal.signal(signal.SIGALRM, previous)
         
-        stdout_capture = io.StringIO()
-        stderr_capture = io.StringIO()
-        
-        # Use a "safe" builtins but include __import__ for import statements
-        safe_builtins = {
-            'print': print, 'len': len, 'range': range, 'str': str,
-            'int': int, 'float': float, 'bool': bool, 'list': list,
-            'dict': dict, 'tuple': tuple, 'set': set, 'sum': sum,
-            'max': max, 'min': min, 'abs': abs, 'round': round,
-            'sorted': sorted, 'enumerate': enumerate, 'zip': zip,
-            'map': map, 'filter': filter, 'any': any, 'all': all,
-            '__import__': __import__,  # <--- allow imports
-        }
+        exec_time = time.time() - exec_start
         
-        # Preloaded globals (can add more modules if needed)
-        safe_globals = {
-            '__builtins__': safe_builtins,
-            'json': json,
-            'time': time,
-        }
+        return 200, with_truncation(stdout_capture, stderr_capture, {
+            'status': 'success',
+            'job_title': job_title,
+            'job_type': job_type,
+            'owner': owner,
+            'execution_time_ms': int(exec_time * 1000),
+            'total_time_ms': int((time.time() - start_time) * 1000),
+            'stdout': stdout_capture.getvalue(),
+            'stderr': stderr_capture.getvalue(),
+            'code_size': len(code),
+            'code_cached': cached,
+            'timestamp': int(time.time())
+        })
         
-        exec_start = time.time()
+    except JobTimeout:
+        return 200, with_truncation(stdout_capture, stderr_capture, {
+            'status': 'error',
+            'job_title': job_title,
+            'error': f"Task timed out after {timeout_s:.2f} seconds",
+            'error_type': 'Timeout',
+            'execution_time_ms': int((time.time() - exec_start) * 1000),
+            'stdout': stdout_capture.getvalue(),
+            'stderr': stderr_capture.getvalue(),
+            'timestamp': int(time.time())
+        })
+    
+    except Exception as e:
+        exec_time = time.time() - exec_start
         
-        try:
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                exec(code, safe_globals)
-            
-            exec_time = time.time() - exec_start
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'status': 'success',
-                    'job_title': job_title,
-                    'job_type': job_type,
-                    'owner': owner,
-                    'execution_time_ms': int(exec_time * 1000),
-                    'total_time_ms': int((time.time() - start_time) * 1000),
-                    'stdout': stdout_capture.getvalue(),
-                    'stderr': stderr_capture.getvalue(),
-                    'code_size': len(code),
-                    'timestamp': int(time.time())
-                })
-            }
-            
-        except Exception as e:
-            exec_time = time.time() - exec_start
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'status': 'error',
-                    'job_title': job_title,
-                    'error': str(e),
-                    'error_type': type(e).__name__,
-                    'traceback': traceback.format_exc(),
-                    'execution_time_ms': int(exec_time * 1000),
-                    'stdout': stdout_capture.getvalue(),
-                    'stderr': stderr_capture.getvalue(),
-                    'timestamp': int(time.time())
-                })
-            }
+        return 200, with_truncation(stdout_capture, stderr_capture, {
+            'status': 'error',
+            'job_title': job_title,
+            'error': str(e),
+            'error_type': type(e).__name__,
+            'traceback': traceback.format_exc(),
+            'execution_time_ms': int(exec_time * 1000),
+            'stdout': stdout_capture.getvalue(),
+            'stderr': stderr_capture.getvalue(),
+            'timestamp': int(time.time())
+        })
+
+def lambda_handler(event, context):
+    try:
+        if 'jobs' not in event:
+            status_code, body = run_job(event)
+            return {'statusCode': status_code, 'body': encode_body(body, event.get('compress'))}
+        
+        # Batch: one result per job, in order. A job that would not get its whole timeout
+        # is not started but returned as deferred, for the caller to send again on its own.
+        results = []
+        for i, job_event in enumerate(event['jobs']):
+            needed_ms = (job_event.get('timeout_ms') or 0) + BATCH_RESERVE_MS
+            if i and context is not None and context.get_remaining_time_in_millis() < needed_ms:
+                results.append({'status': 'deferred', 'job_title': job_event.get('job_title')})
+                continue
+            results.append(run_job(job_event)[1])
+        return {
+            'statusCode': 200,
+            'body': encode_body({'status': 'batch', 'results': results}, event.get('compress'))
+        }
     
     except Exception as e:
         return {
             'statusCode': 500,
-            'body': json.dumps({
+            'body': {
                 'status': 'error',
                 'error': str(e),
                 'traceback': traceback.format_exc(),
                 'timestamp': int(time.time())
-            })
+            }
         }
 '''
+# Part of the result cache key: results are only reused while the handler that produced them is unchanged
+HANDLER_VERSION = hashlib.sha256(LAMBDA_CODE.encode('utf-8')).hexdigest()[:16]
+# Result fields the handler takes from the job event and the clock; memoized outputs are stored without them
+JOB_RESULT_FIELDS = ('job_title', 'job_type', 'owner', 'timestamp')
 
-class JobStatus:
-    PENDING = 0
-    COMPLETED = 1
-    CANCELLED = 2
-    
-    @staticmethod
-    def to_string(status: int) -> str:
-        return {0: "PENDING", 1: "COMPLETED", 2: "CANCELLED"}.get(status, f"UNKNOWN({status})")
+def build_lambda_package() -> bytes:
+    """Zip LAMBDA_CODE reproducibly, so unchanged code gives the same CodeSha256"""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        # Fixed timestamp and mode: the default (now) would change the hash on every build
+        info = zipfile.ZipInfo('lambda_function.py', date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        zip_file.writestr(info, LAMBDA_CODE)
+    return zip_buffer.getvalue()
+
+def lambda_code_sha256(zip_content: bytes) -> str:
+    """CodeSha256 as Lambda reports it (base64 SHA-256 of the package)"""
+    return base64.b64encode(hashlib.sha256(zip_content).digest()).decode('ascii')
 
-class JobType:
-    CRON = 0
-    API = 1
-    MANUAL = 2
+def ensure_lambda_role(iam_client) -> str:
+    """Find or create the Lambda execution role and return its ARN"""
+    from botocore.exceptions import ClientError
+    
+    role_name = 'solana-lambda-execution-role'
+    try:
+        print(f"   Checking IAM role: {role_name}")
+        role = iam_client.get_role(RoleName=role_name)
+        role_arn = role['Role']['Arn']
+        print(f"   ✓ Role exists: {role_arn}")
+        return role_arn
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchEntity':
+            raise
+    
+    print(f"   Creating IAM role...")
+    
+    trust_policy = {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Principal": {"Service": "lambda.amazonaws.com"},
+            "Action": "sts:AssumeRole"
+        }]
+    }
+    
+    role = iam_client.create_role(
+        RoleName=role_name,
+        AssumeRolePolicyDocument=json.dumps(trust_policy),
+        Description='Execution role for Solana job processor Lambda'
+    )
+    role_arn = role['Role']['Arn']
     
-    @staticmethod
-    def to_string(job_type: int) -> str:
-        return {0: "CRON", 1: "API", 2: "MANUAL"}.get(job_type, f"UNKNOWN({job_type})")
+    # Attach basic execution policy
+    iam_client.attach_role_policy(
+        RoleName=role_name,
+        PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
+    )
+    
+    print(f"   ✓ Role created: {role_arn}")
+    print(f"   ⏳ Waiting 10s for role to propagate...")
+    time.sleep(10)
+    return role_arn
 
 def create_lambda_function():
-    """Automatically create Lambda function using boto3"""
+    """Create the Lambda function, or update it only if the deployed code or settings differ"""
     try:
-        import boto3
         from botocore.exceptions import ClientError
         
-        print("="*70)
-        print("Creating AWS Lambda Function")
-        print("="*70)
-        
-        # Initialize clients
-        lambda_client = boto3.client(
-            'lambda',
-            aws_access_key_id=AWS_ACCESS_KEY,
-            aws_secret_access_key=AWS_SECRET_KEY,
-            region_name=AWS_REGION
-        )
-        
-        iam_client = boto3.client(
-            'iam',
-            aws_access_key_id=AWS_ACCESS_KEY,
-            aws_secret_access_key=AWS_SECRET_KEY,
-            region_name=AWS_REGION
-        )
-        
-        role_name = 'solana-lambda-execution-role'
-        role_arn = None
+        lambda_client = clients.lambda_client
+        zip_content = build_lambda_package()
+        code_sha = lambda_code_sha256(zip_content)
         
         try:
-            print(f"\n1. Checking IAM role: {role_name}")
-            role = iam_client.get_role(RoleName=role_name)
-            role_arn = role['Role']['Arn']
-            print(f"   ✓ Role exists: {role_arn}")
+            config = lambda_client.get_function_configuration(FunctionName=LAMBDA_FUNCTION_NAME)
         except ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchEntity':
-                print(f"   Creating IAM role...")
-                
-                trust_policy = {
-                    "Version": "2012-10-17",
-                    "Statement": [{
-                        "Effect": "Allow",
-                        "Principal": {"Service": "lambda.amazonaws.com"},
-                        "Action": "sts:AssumeRole"
-                    }]
-                }
-                
-                role = iam_client.create_role(
-                    RoleName=role_name,
-                    AssumeRolePolicyDocument=json.dumps(trust_policy),
-                    Description='Execution role for Solana job processor Lambda'
-                )
-                role_arn = role['Role']['Arn']
-                
-                # Attach basic execution policy
-                iam_client.attach_role_policy(
-                    RoleName=role_name,
-                    PolicyArn='arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole'
-                )
-                
-                print(f"   ✓ Role created: {role_arn}")
-                print(f"   ⏳ Waiting 10s for role to propagate...")
-                time.sleep(10)
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            config = None
         
-        print(f"\n2. Creating deployment package")
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            zip_file.writestr('lambda_function.py', LAMBDA_CODE)
-        zip_buffer.seek(0)
-        zip_content = zip_buffer.read()
-        print(f"   ✓ Package created ({len(zip_content)} bytes)")
+        if config is not None:
+            stale = {key: value for key, value in LAMBDA_SETTINGS.items() if config.get(key) != value}
+            if config.get('CodeSha256') == code_sha and not stale:
+                print(f"✓ Lambda {LAMBDA_FUNCTION_NAME} is up to date ({code_sha[:12]}), skipping deploy")
+                return True
         
-        print(f"\n3. Deploying Lambda function: {LAMBDA_FUNCTION_NAME}")
+        print("="*70)
+        print("Deploying AWS Lambda Function")
+        print("="*70)
+        print(f"\nPackage: {len(zip_content)} bytes, CodeSha256 {code_sha}")
         
-        try:
-            lambda_client.get_function(FunctionName=LAMBDA_FUNCTION_NAME)
-            
-            # Update existing function
-            print(f"   Updating existing function...")
-            response = lambda_client.update_function_code(
+        if config is None:
+            print(f"\n1. Creating new function: {LAMBDA_FUNCTION_NAME}")
+            role_arn = ensure_lambda_role(clients.aws_client('iam'))
+            lambda_client.create_function(
                 FunctionName=LAMBDA_FUNCTION_NAME,
-                ZipFile=zip_content
+                Role=role_arn,
+                Code={'ZipFile': zip_content},
+                Description='Solana job executor',
+                **LAMBDA_SETTINGS,
             )
-            print(f"   ✓ Function updated")
-            
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                # Create new function
-                print(f"   Creating new function...")
-                response = lambda_client.create_function(
+            lambda_client.get_waiter('function_active').wait(FunctionName=LAMBDA_FUNCTION_NAME)
+            print(f"   ✓ Function created")
+        else:
+            print(f"\n1. Updating function: {LAMBDA_FUNCTION_NAME}")
+            if config.get('CodeSha256') != code_sha:
+                lambda_client.update_function_code(
                     FunctionName=LAMBDA_FUNCTION_NAME,
-                    Runtime='python3.11',
-                    Role=role_arn,
-                    Handler='lambda_function.lambda_handler',
-                    Code={'ZipFile': zip_content},
-                    Timeout=30,
-                    MemorySize=512,
-                    Description='Solana job executor',
+                    ZipFile=zip_content
                 )
-                print(f"   ✓ Function created")
-            else:
-                raise
+                # The test invoke below must hit the new code
+                lambda_client.get_waiter('function_updated').wait(FunctionName=LAMBDA_FUNCTION_NAME)
+                print(f"   ✓ Code updated (was {config.get('CodeSha256', '?')[:12]})")
+            if stale:
+                lambda_client.update_function_configuration(FunctionName=LAMBDA_FUNCTION_NAME, **stale)
+                lambda_client.get_waiter('function_updated').wait(FunctionName=LAMBDA_FUNCTION_NAME)
+                print(f"   ✓ Settings updated: {', '.join(stale)}")
         
-        print(f"\n4. Testing Lambda function")
+        print(f"\n2. Testing Lambda function")
         test_payload = {
             "code": "result = 5 + 5\nprint(f'Test result: {result}')",
             "job_title": "Test Job",
@@ -275,7 +629,7 @@ def create_lambda_function():
         )
         
         result = json.loads(response['Payload'].read())
-        test_result = json.loads(result.get('body', '{}'))
+        test_result, _ = decode_body(result.get('body', '{}'))
         
         if test_result.get('status') == 'success':
             print(f"   ✓ Test successful!")
@@ -316,7 +670,7 @@ def deserialize_string(data: bytes, offset: int) -> tuple:
     return string_value, offset
 
 def deserialize_job(data: bytes) -> Optional[Dict]:
-    """Deserialize Job account"""
+    """Deserialize Job account eagerly into a dict (see job_decoder.decode_job for the lazy decoder)"""
     try:
         offset = 8
         owner_bytes = data[offset:offset + 32]
@@ -353,125 +707,235 @@ def deserialize_job(data: bytes) -> Optional[Dict]:
     except Exception as e:
         return None
 
+def probe_job_status(data: bytes, base_offset: int = 0) -> Optional[int]:
+    """Read the status byte from a (possibly sliced) Job account.
+    
+    `data` starts at `base_offset` within the account. Returns None if the slice
+    ends before the status byte, which sits after the three variable-length strings.
+    """
+    try:
+        offset = JOB_STRINGS_OFFSET - base_offset
+        if offset < 0:
+            return None
+        for _ in range(3):
+            length = struct.unpack_from('<I', data, offset)[0]
+            offset += 4 + length
+        offset += 16  # start_time, end_time
+        if offset >= len(data):
+            return None
+        return data[offset]
+    except struct.error:
+        return None
+
+def account_data(account) -> bytes:
+    """Raw bytes of an RPC account, whatever encoding the client returned"""
+    if isinstance(account.data, (list, tuple)):
+        return base64.b64decode(account.data[0])
+    return bytes(account.data)
+
+def job_account_filters() -> List[Dict]:
+    """RPC filters matching Job accounts only (JSON form, for subscriptions)"""
+    return [
+        {"dataSize": JOB_ACCOUNT_SIZE},
+        {"memcmp": {"offset": 0, "bytes": b58encode(JOB_DISCRIMINATOR)}},
+    ]
+
+def decode_job_created(data: bytes) -> Optional[str]:
+    """Return the job address from an encoded JobCreated event, if it is one"""
+    if len(data) < 40 or data[:8] != JOB_CREATED_DISCRIMINATOR:
+        return None
+    return str(Pubkey(data[8:40]))
+
 def fetch_pending_jobs(program_id: str) -> List[Dict]:
-    """Fetch pending jobs"""
+    """Fetch pending jobs in this worker's shards"""
+    if DISCOVERY_MODE == "full":
+        jobs = fetch_pending_jobs_full(program_id)
+    else:
+        jobs = fetch_pending_jobs_filtered(program_id)
+    return [job for job in jobs if shards.owns(job['account_address'])]
+
+def program_accounts(program_id: str, filters: List[Dict],
+                     data_slice: Optional[Dict] = None) -> Iterator[Tuple[str, bytes]]:
+    """(address, data) of the program's accounts, one at a time as the RPC responses stream in.
+    
+    Memory stays bounded by the account being decoded, not the number of
+    accounts; with DISCOVERY_SLICE_BYTES each request covers one owner prefix.
+    """
+    for keyspace in keyspace_slices(JOB_OWNER_OFFSET, DISCOVERY_SLICE_BYTES):
+        yield from client.stream_program_accounts(
+            program_id, filters + [keyspace] if keyspace else filters, data_slice)
+
+def fetch_pending_jobs_full(program_id: str) -> List[Dict]:
+    """Fetch pending jobs by downloading and decoding every program account"""
     try:
-        prog_id = Pubkey.from_string(program_id)
-        response = client.get_program_accounts(prog_id, encoding="base64")
-        
-        if not response.value:
-            return []
-        
         jobs = []
-        for account_info in response.value:
+        for address, data in program_accounts(program_id, []):
             try:
-                pubkey = account_info.pubkey
-                account = account_info.account
-                
-                if isinstance(account.data, (list, tuple)):
-                    data = base64.b64decode(account.data[0])
-                else:
-                    data = account.data
-                
-                job = deserialize_job(data)
+                job = decode_job(data)
                 
                 if job and job["status"] == JobStatus.PENDING:
-                    job["account_address"] = str(pubkey)
+                    job["account_address"] = address
                     jobs.append(job)
             except:
                 continue
         
         return jobs
     except Exception as e:
-        print(f"Error fetching jobs: {e}")
+        log.error("Error fetching jobs", error=str(e))
         return []
 
-def fetch_from_ipfs(cid: str) -> Optional[str]:
-    """Fetch content from IPFS"""
+def probe_job_accounts(program_id: str) -> Iterator[Tuple[str, bytes]]:
+    """Phase 1: Job accounts only, with just the slice holding strings and status"""
+    return program_accounts(
+        program_id, job_account_filters(),
+        data_slice={"offset": JOB_STRINGS_OFFSET, "length": DISCOVERY_PROBE_BYTES},
+    )
+
+def fetch_job_accounts(pubkeys: List[Pubkey]):
+    """Phase 2: full data for the given accounts, yields (pubkey, data, slot)"""
+    for i in range(0, len(pubkeys), DISCOVERY_BATCH_SIZE):
+        batch = pubkeys[i:i + DISCOVERY_BATCH_SIZE]
+        response = client.get_multiple_accounts(batch, encoding="base64")
+        slot = response.context.slot
+        for pubkey, account in zip(batch, response.value):
+            if account is not None:
+                yield pubkey, account_data(account), slot
+
+def fetch_pending_jobs_filtered(program_id: str) -> List[Dict]:
+    """Fetch pending jobs in two phases.
+    
+    Phase 1 asks the RPC node for Job accounts only (size + discriminator filter)
+    and only the slice holding the strings and status. Phase 2 downloads full
+    data for accounts that probed as pending or whose status fell past the slice.
+    """
     try:
-        print(f"  Fetching from IPFS: {cid}")
-        url = f"{IPFS_GATEWAY}{cid}"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        print(f"  ✓ Fetched {len(response.text)} bytes")
-        return response.text
+        candidates = []
+        for address, probe in probe_job_accounts(program_id):
+            try:
+                status = probe_job_status(probe, JOB_STRINGS_OFFSET)
+            except Exception:
+                status = None
+            if status is None or status == JobStatus.PENDING:
+                candidates.append(Pubkey.from_string(address))
+        
+        jobs = []
+        for pubkey, data, _ in fetch_job_accounts(candidates):
+            job = decode_job(data)
+            if job and job["status"] == JobStatus.PENDING:
+                job["account_address"] = str(pubkey)
+                jobs.append(job)
+        
+        return jobs
     except Exception as e:
-        print(f"  ✗ IPFS fetch error: {e}")
-        return None
+        log.error("Error fetching jobs", error=str(e))
+        return []
 
-def execute_on_lambda(code: str, job: Dict) -> Optional[Dict]:
-    """Execute code on AWS Lambda"""
+def sync_job_index(program_id: str, index: JobIndex) -> IndexDiff:
+    """Refresh the job index from a full sweep and return what changed.
+    
+    Accounts whose probe slice is unchanged since the last sweep are neither
+    downloaded in full nor decoded again. Accounts outside this worker's
+    shards are skipped (and dropped from the index if they were in it).
+    """
+    diff = IndexDiff()
+    start = time.perf_counter()
     try:
-        import boto3
+        # The snapshot is at least as new as this slot
+        slot = client.get_slot().value
         
-        print(f"  Executing on Lambda...")
-        
-        lambda_client = boto3.client(
-            'lambda',
-            aws_access_key_id=AWS_ACCESS_KEY,
-            aws_secret_access_key=AWS_SECRET_KEY,
-            region_name=AWS_REGION
-        )
+        if DISCOVERY_MODE == "full":
+            seen = []
+            for address, data in program_accounts(program_id, []):
+                if not shards.owns(address):
+                    continue
+                seen.append(address)
+                index.observe(address, data, slot, diff)
+            diff.removed = index.retain(seen)
+            discovery_seconds.observe(time.perf_counter() - start)
+            return diff
         
-        payload = {
-            "code": code,
-            "job_title": job['title'],
-            "job_type": job['job_type_name'],
-            "owner": job['owner'],
-        }
+        seen = []
+        candidates = []
+        for address, probe in probe_job_accounts(program_id):
+            if not shards.owns(address):
+                continue
+            seen.append(address)
+            status = probe_job_status(probe, JOB_STRINGS_OFFSET)
+            if index.probe_changed(address, probe, status, diff):
+                candidates.append(Pubkey.from_string(address))
         
-        response = lambda_client.invoke(
-            FunctionName=LAMBDA_FUNCTION_NAME,
-            InvocationType='RequestResponse',
-            Payload=json.dumps(payload)
-        )
+        for pubkey, data, data_slot in fetch_job_accounts(candidates):
+            index.observe(str(pubkey), data, data_slot, diff)
+        diff.removed = index.retain(seen)
+        discovery_seconds.observe(time.perf_counter() - start)
+    except Exception as e:
+        log.error("Error syncing jobs", error=str(e))
+    return diff
+
+def fetch_from_ipfs(cid: str) -> Optional[str]:
+    """Fetch content from IPFS (local cache first, then racing gateways)"""
+    start = time.perf_counter()
+    try:
+        log.debug("Fetching from IPFS", cid=cid)
+        data = ipfs_fetcher.fetch(cid)
+        if data is None:
+            raise Exception("no gateway returned valid content")
+        text = data.decode('utf-8')
+        ipfs_fetch_seconds.observe(time.perf_counter() - start, outcome="ok")
+        ipfs_bytes.inc(len(data))
+        log.debug("✓ Fetched", cid=cid, bytes=len(data))
+        return text
+    except Exception as e:
+        ipfs_fetch_seconds.observe(time.perf_counter() - start, outcome="error")
+        log.warning("✗ IPFS fetch error", cid=cid, error=str(e))
+        return None
+
+def execute_job(code: str, job: Dict) -> Optional[Dict]:
+    """Execute code on the local pool or AWS Lambda, whichever the executor routes it to"""
+    backend = executor.route(code, job) if isinstance(executor, ExecutorRouter) else executor
+    start = time.perf_counter()
+    try:
+        log.debug("Executing", backend=backend.name, job=job['title'])
         
-        response_payload = json.loads(response['Payload'].read())
-        result = json.loads(response_payload.get('body', '{}'))
+        result = executor.execute(code, job)
+        status = result.get('status', 'empty')
+        execute_seconds.observe(time.perf_counter() - start, backend=backend.name, status=status)
         
-        if result.get('status') == 'success':
-            print(f"  ✓ Execution successful ({result.get('execution_time_ms', 0)}ms)")
+        if status == 'success':
+            log.debug("✓ Execution successful", job=job['title'], ms=result.get('execution_time_ms', 0))
             if result.get('stdout'):
-                print(f"  Output: {result['stdout'].strip()[:100]}")
+                log.debug("Output", job=job['title'], stdout=result['stdout'].strip()[:100])
         else:
-            print(f"  ✗ Execution failed: {result.get('error', 'Unknown')}")
+            log.info("✗ Execution failed", job=job['title'], error=result.get('error', 'Unknown'))
         
         return result
         
     except Exception as e:
-        print(f"  ✗ Lambda error: {e}")
+        execute_seconds.observe(time.perf_counter() - start, backend=backend.name, status="exception")
+        log.warning("✗ Executor error", backend=backend.name, job=job['title'], error=str(e))
         return None
 
-def upload_to_pinata(data: Dict) -> Optional[str]:
-    """Upload result to Pinata"""
+def encode_result(result: Dict) -> bytes:
+    """The one serialization of a result: it is journaled, sized, content-addressed and pinned as these bytes"""
+    return json.dumps(result, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def observe_pin_request(files: int, size: int, seconds: float, outcome: str):
+    """PinQueue hook: request latency, files per request and bytes pinned"""
+    upload_seconds.observe(seconds, outcome=outcome)
+    if outcome == "pinned":
+        upload_files.observe(files)
+        result_bytes.inc(size)
+
+def upload_to_pinata(content: bytes, name: Optional[str] = None) -> Optional[str]:
+    """Pin encoded result bytes through the pin queue; the CID once pinned, None if that failed"""
+    pins.start()
     try:
-        print(f"  Uploading to Pinata...")
-        
-        url = "https://api.pinata.cloud/pinning/pinJSONToIPFS"
-        headers = {
-            "Authorization": f"Bearer {PINATA_JWT}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "pinataContent": data,
-            "pinataMetadata": {"name": f"job_result_{int(time.time())}.json"}
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            cid = response.json()['IpfsHash']
-            print(f"  ✓ Uploaded: {cid}")
-            return cid
-        else:
-            raise Exception(f"Status {response.status_code}")
-            
+        cid = pins.submit(content, name or f"job_result_{int(time.time())}.json").result(timeout=PIN_TIMEOUT)
     except Exception as e:
-        print(f"  ✗ Upload error: {e}")
-        json_data = json.dumps(data)
-        cid = "Qm" + hashlib.sha256(json_data.encode()).hexdigest()[:44]
-        print(f"  → Fallback CID: {cid}")
-        return cid
+        log.warning("✗ Upload error, result not pinned", error=str(e) or type(e).__name__)
+        return None
+    log.debug("✓ Pinned", cid=cid)
+    return cid
 
 def calculate_cost(code_size: int, result_size: int, execution_time: float) -> int:
     """Calculate job cost"""
@@ -480,126 +944,553 @@ def calculate_cost(code_size: int, result_size: int, execution_time: float) -> i
     TIME_RATE = 100
     
     total = BASE_COST + (code_size + result_size) * SIZE_RATE + int(execution_time * TIME_RATE)
-    print(f"  Cost: {total / 1_000_000_000:.9f} SOL ({total} lamports)")
+    log.debug("Cost", sol=f"{total / 1_000_000_000:.9f}", lamports=total)
     return total
 
+def job_cost(code_bytes: int, result: Dict, result_size: int) -> int:
+    """calculate_cost for a job's code size and its result (`result_size` encoded bytes)"""
+    exec_time = result.get('execution_time_ms', 100) / 1000
+    return calculate_cost(code_bytes, result_size, exec_time)
+
+COMPLETE_JOB_DISCRIMINATOR = hashlib.sha256(b"global:complete_job").digest()[:8]
+
+def build_complete_instruction(
+    program_id: str, job_address: str, worker_pubkey: Pubkey,
+    result_cid: str, cost: int
+) -> Instruction:
+    """Build a complete_job instruction"""
+    prog_id = Pubkey.from_string(program_id)
+    job_pubkey = Pubkey.from_string(job_address)
+    result_bytes = result_cid.encode('utf-8')
+    
+    instruction_data = (
+        COMPLETE_JOB_DISCRIMINATOR +
+        struct.pack('<I', len(result_bytes)) +
+        result_bytes +
+        struct.pack('<Q', cost)
+    )
+    
+    accounts = [
+        AccountMeta(pubkey=job_pubkey, is_signer=False, is_writable=True),
+        AccountMeta(pubkey=worker_pubkey, is_signer=True, is_writable=False),
+    ]
+    
+    return Instruction(prog_id, instruction_data, accounts)
+
+def sign_and_send(instructions: List[Instruction], worker: Keypair) -> Tuple[Signature, int]:
+    """Sign and send a transaction; returns its signature and last valid block height"""
+    with blockhash_seconds.time():
+        blockhash, last_valid = blockhashes.get()
+    
+    msg = Message.new_with_blockhash(instructions, worker.pubkey(), blockhash)
+    tx = Transaction([worker], msg, blockhash)
+    
+    with send_seconds.time():
+        result = client.send_transaction(tx)
+    sig = result.value
+    
+    log.debug("✓ Transaction", signature=str(sig), instructions=len(instructions))
+    return sig, last_valid
+
+def send_complete_transaction(instructions: List[Instruction], worker: Keypair) -> Future:
+    """Send one transaction holding one or more complete_job instructions.
+    
+    Raises if the transaction is rejected, so a batch can be split and retried.
+    The returned Future resolves to the signature once it is confirmed; an
+    expired blockhash re-sends the same instructions.
+    """
+    log.debug("Sending transaction", jobs=len(instructions))
+    
+    def send() -> Tuple[Signature, int]:
+        sig, last_valid = sign_and_send(instructions, worker)
+        journal_sent(instructions, sig, last_valid)
+        return sig, last_valid
+    
+    sig, last_valid = send()
+    return confirmations.track(sig, last_valid, resend=send)
+
+def journal_record(ctx: Dict, stage: str, **fields):
+    """Append a stage outcome for the ctx's job to the journal, if one is open"""
+    if journal is not None:
+        journal.record(ctx['job']['account_address'], stage, **fields)
+
+def journal_sent(instructions: List[Instruction], sig: Signature, last_valid: int):
+    """Journal the transaction each complete_job instruction went out in"""
+    if journal is None:
+        return
+    for ix in instructions:
+        journal.record(str(ix.accounts[0].pubkey), "sent", signature=str(sig), last_valid_block_height=last_valid)
+
+def resume_context(job: Dict) -> Dict:
+    """Pipeline ctx fields restoring a job's journaled progress.
+    
+    Returns {'confirmed': signature} for a job whose completion was confirmed
+    recently (it only has to show up as settled), otherwise the result, result
+    CID/cost and outstanding signature the job already has, so the pipeline
+    continues from its last finished stage.
+    """
+    progress = journal.progress(job['account_address']) if journal is not None else None
+    if not progress or progress.get('code_cid') != job['code_cid']:
+        return {}
+    if 'confirmed_at' in progress and time.time() - progress['confirmed_at'] < JOB_SUBMITTED_TIMEOUT:
+        return {'confirmed': progress.get('signature')}
+    content = journal.result(job['account_address'])
+    if content is None:
+        return {}
+    ctx = {'result': json.loads(content), 'content': content, 'code_bytes': progress['code_bytes'],
+           'resumed': progress['stage']}
+    if 'result_cid' in progress:
+        ctx['result_cid'] = progress['result_cid']
+        ctx['cost'] = progress['cost']
+        if 'signature' in progress and 'confirmed_at' not in progress:
+            ctx['sent'] = (progress['signature'], progress['last_valid_block_height'])
+    return ctx
+
+def recheck_journal():
+    """Resolve journaled transactions whose outcome was not recorded before a restart.
+    
+    Confirmed ones are marked confirmed; failed ones, and ones the node does
+    not know whose blockhash has expired, are marked rejected so the job is
+    sent again. Anything still in flight is left for the complete stage to track.
+    """
+    outstanding = [(address, progress) for address, progress in journal.open_jobs().items()
+                   if 'signature' in progress and 'confirmed_at' not in progress]
+    if not outstanding:
+        return
+    try:
+        outcomes = confirmations.check([Signature.from_string(p['signature']) for _, p in outstanding])
+        block_height = client.get_block_height().value
+    except Exception as e:
+        log.warning("✗ Journal recheck failed", error=str(e))
+        return
+    counts = {"confirmed": 0, "rejected": 0, "in_flight": 0}
+    for (address, progress), outcome in zip(outstanding, outcomes):
+        if outcome == "confirmed":
+            journal.record(address, "confirmed", signature=progress['signature'])
+            counts["confirmed"] += 1
+        elif outcome == "failed" or (outcome is None and block_height > progress['last_valid_block_height']):
+            journal.record(address, "rejected", error=outcome or "expired")
+            counts["rejected"] += 1
+        else:
+            counts["in_flight"] += 1
+    print(f"↻ Journal: {len(outstanding)} unresolved transaction(s): {counts['confirmed']} confirmed, "
+          f"{counts['rejected']} to re-send, {counts['in_flight']} still in flight\n")
+
+def prune_journal(job_index: JobIndex, diff: IndexDiff):
+    """Forget journaled jobs that are no longer pending on-chain"""
+    if journal is None:
+        return
+    done = set(diff.settled) | set(diff.removed)
+    for address in journal.open_jobs():
+        entry = job_index.get(address)
+        if entry is not None and entry.status is not None and entry.status != JobStatus.PENDING:
+            done.add(address)
+    journal.forget(done)
+
 def complete_job_onchain(
     program_id: str, job_address: str, job_data: Dict,
     worker: Keypair, result_cid: str, cost: int
 ) -> bool:
     """Complete job on-chain"""
     try:
-        print(f"  Sending transaction...")
-        
-        prog_id = Pubkey.from_string(program_id)
-        job_pubkey = Pubkey.from_string(job_address)
-        
-        discriminator = hashlib.sha256(b"global:complete_job").digest()[:8]
-        result_bytes = result_cid.encode('utf-8')
-        
-        instruction_data = (
-            discriminator +
-            struct.pack('<I', len(result_bytes)) +
-            result_bytes +
-            struct.pack('<Q', cost)
-        )
-        
-        accounts = [
-            AccountMeta(pubkey=job_pubkey, is_signer=False, is_writable=True),
-            AccountMeta(pubkey=worker.pubkey(), is_signer=True, is_writable=False),
-        ]
-        
-        ix = Instruction(prog_id, instruction_data, accounts)
-        blockhash_resp = client.get_latest_blockhash()
-        blockhash = blockhash_resp.value.blockhash
-        
-        msg = Message.new_with_blockhash([ix], worker.pubkey(), blockhash)
-        tx = Transaction([worker], msg, blockhash)
-        
-        result = client.send_transaction(tx)
-        sig = result.value
-        
-        print(f"  ✓ Transaction: {sig}")
-        time.sleep(2)
-        
-        from solders.signature import Signature
-        sig_obj = Signature.from_string(str(sig))
-        confirmation = client.get_signature_statuses([sig_obj])
-        
-        if confirmation.value and confirmation.value[0]:
-            print(f"  ✓ Confirmed!")
-            return True
-        
-        return False
-            
+        ix = build_complete_instruction(program_id, job_address, worker.pubkey(), result_cid, cost)
+        confirmations.start()
+        send_complete_transaction([ix], worker).result(timeout=COMPLETION_TIMEOUT)
+        log.info("✓ Confirmed", job=job_data['title'])
+        return True
     except Exception as e:
-        print(f"  ✗ Transaction error: {e}")
+        log.warning("✗ Transaction error", job=job_data['title'], error=str(e))
         return False
 
-def process_job(job: Dict, program_id: str, worker: Keypair) -> bool:
-    """Process a single job"""
-    print(f"\n{'='*70}")
-    print(f"Processing: {job['title']}")
-    print(f"{'='*70}")
-    
-    start = time.time()
-    
-    code = fetch_from_ipfs(job['code_cid'])
-    if not code:
+def memo_key(ctx: Dict) -> Optional[str]:
+    """The job's result cache key, None when its result must not be reused"""
+    job = ctx['job']
+    if result_cache is None or job['job_type_name'] not in RESULT_CACHE_JOB_TYPES:
+        return None
+    return result_key(job['code_cid'], job['job_type_name'], HANDLER_VERSION)
+
+def reuse_result(ctx: Dict) -> bool:
+    """Fill in the result from a memoized output stamped with this job's fields; False on a miss"""
+    key = memo_key(ctx)
+    hit = result_cache.get(key) if key is not None else None
+    if hit is None:
         return False
-    
-    result = execute_on_lambda(code, job)
+    job = ctx['job']
+    # The result is pinned per job: it names this job and owner, never the one that first ran the code
+    result = dict(hit['output'], job_title=job['title'], job_type=job['job_type_name'], owner=job['owner'],
+                  timestamp=int(time.time()))
+    ctx.update(result=result, content=encode_result(result), code_bytes=hit['code_bytes'], cached=True)
+    journal_record(ctx, "executed", body=ctx['content'], code_cid=job['code_cid'], code_bytes=hit['code_bytes'])
+    log.info("⚡ Result reused", job=job['title'], saved_ms=result.get('execution_time_ms'))
+    return True
+
+def stage_fetch(ctx: Dict) -> Optional[Dict]:
+    """Pipeline stage: download job code from IPFS (nothing to do for a memoized result)"""
+    if 'result' in ctx:
+        return ctx  # resumed from the journal after execution
+    if reuse_result(ctx):
+        return ctx
+    code = fetch_from_ipfs(ctx['job']['code_cid'])
+    if not code:
+        return None
+    ctx['code'] = code
+    ctx['code_bytes'] = len(code.encode('utf-8'))
+    return ctx
+
+def stage_execute(ctx: Dict) -> Optional[Dict]:
+    """Pipeline stage: run job code on the executor"""
+    if 'result' in ctx:
+        return ctx
+    result = execute_job(ctx['code'], ctx['job'])
     if not result:
-        return False
+        return None
+    ctx['result'] = result
+    ctx['content'] = encode_result(result)
+    journal_record(ctx, "executed", body=ctx['content'],
+                   code_cid=ctx['job']['code_cid'], code_bytes=ctx['code_bytes'])
+    return ctx
+
+def stage_upload(ctx: Dict) -> Optional[Dict]:
+    """Pipeline stage: pin result and price the job"""
+    if 'result_cid' in ctx:
+        return ctx
+    result = ctx['result']
+    address = ctx['job']['account_address']
+    content = ctx['content']
+    # Nothing goes on-chain until the result is actually pinned
+    result_cid = upload_to_pinata(content, f"job_result_{address}.json")
+    if result_cid is None:
+        return None
     
-    result_cid = upload_to_pinata(result)
-    if not result_cid:
-        return False
+    ctx['result_cid'] = result_cid
+    ctx['cost'] = job_cost(ctx['code_bytes'], result, len(content))
+    journal_record(ctx, "uploaded", result_cid=result_cid, cost=ctx['cost'])
+    key = memo_key(ctx)
+    if key is not None and result.get('status') == 'success' and not ctx.get('cached'):
+        output = {field: value for field, value in result.items() if field not in JOB_RESULT_FIELDS}
+        result_cache.put(key, encode_result(output), ctx['code_bytes'])
+    return ctx
+
+def await_journaled_send(ctx: Dict) -> Optional[str]:
+    """Track a completion sent before a restart; its signature once confirmed, else None"""
+    job = ctx['job']
+    signature, last_valid = ctx.pop('sent')
+    # The transaction may have carried other jobs' instructions; a re-send must carry them all
+    instructions = [
+        build_complete_instruction(
+            ctx['program_id'], address, ctx['worker'].pubkey(), progress['result_cid'], progress['cost']
+        )
+        for address, progress in journal.open_jobs().items()
+        if progress.get('signature') == signature and 'result_cid' in progress
+    ] or [build_complete_instruction(
+        ctx['program_id'], job['account_address'], ctx['worker'].pubkey(), ctx['result_cid'], ctx['cost']
+    )]
     
-    exec_time = result.get('execution_time_ms', 100) / 1000
-    code_size = len(code.encode('utf-8'))
-    result_size = len(json.dumps(result).encode('utf-8'))
+    def resend() -> Tuple[Signature, int]:
+        sig, valid = sign_and_send(instructions, ctx['worker'])
+        journal_sent(instructions, sig, valid)
+        return sig, valid
     
-    cost = calculate_cost(code_size, result_size, exec_time)
+    try:
+        future = confirmations.track(Signature.from_string(signature), last_valid, resend=resend)
+        return str(future.result(timeout=COMPLETION_TIMEOUT))
+    except Exception as e:
+        journal_record(ctx, "rejected", error=str(e))
+        log.warning("✗ Journaled transaction not confirmed, sending again", job=job['title'], error=str(e))
+        return None
+
+def stage_complete(ctx: Dict) -> Optional[Dict]:
+    """Pipeline stage: mark job complete on-chain (batched with other jobs when a batcher is set)"""
+    job = ctx['job']
+    if 'sent' in ctx:
+        signature = await_journaled_send(ctx)
+        if signature is not None:
+            ctx['signature'] = signature
+            journal_record(ctx, "confirmed", signature=signature)
+            return ctx
+    batcher = ctx.get('batcher')
+    if batcher is None:
+        success = complete_job_onchain(
+            ctx['program_id'], job['account_address'], job,
+            ctx['worker'], ctx['result_cid'], ctx['cost']
+        )
+        if success:
+            journal_record(ctx, "confirmed")
+        return ctx if success else None
     
-    success = complete_job_onchain(
-        program_id, job['account_address'], job,
-        worker, result_cid, cost
+    ix = build_complete_instruction(
+        ctx['program_id'], job['account_address'], ctx['worker'].pubkey(),
+        ctx['result_cid'], ctx['cost']
     )
+    try:
+        ctx['signature'] = str(batcher.submit(ix).result(timeout=COMPLETION_TIMEOUT))
+    except Exception as e:
+        log.warning("✗ Transaction error", job=job['title'], error=str(e))
+        return None
+    journal_record(ctx, "confirmed", signature=ctx['signature'])
+    return ctx
+
+PIPELINE_STAGES = [
+    ("fetch", stage_fetch, PIPELINE_FETCH_WORKERS),
+    ("execute", stage_execute, PIPELINE_EXECUTE_WORKERS),
+    ("upload", stage_upload, PIPELINE_UPLOAD_WORKERS),
+    ("complete", stage_complete, PIPELINE_COMPLETE_WORKERS),
+]
+
+def process_job(job: Dict, program_id: str, worker: Keypair) -> bool:
+    """Process a single job"""
+    log.info("Processing", job=job['title'])
+    
+    start = time.time()
+    
+    ctx = {'job': job, 'program_id': program_id, 'worker': worker}
+    ctx.update(resume_context(job))
+    if 'confirmed' in ctx:
+        log.info("✓ Already completed (journal)", job=job['title'])
+        return True
+    for _, stage, _ in PIPELINE_STAGES:
+        ctx = stage(ctx)
+        if ctx is None:
+            break
     
     elapsed = time.time() - start
     
-    if success:
-        print(f"\n✓ Completed in {elapsed:.2f}s")
+    if ctx is not None:
+        log.info("✓ Completed", job=job['title'], seconds=round(elapsed, 2))
         return True
     else:
-        print(f"\n✗ Failed after {elapsed:.2f}s")
+        log.warning("✗ Failed", job=job['title'], seconds=round(elapsed, 2))
         return False
 
+def observe_stage(stage: str, ctx: Dict, wait: float, run: float, ok: bool):
+    """Pipeline hook: per-stage latency, queue wait and error-class metrics"""
+    stage_wait_seconds.observe(wait, stage=stage)
+    stage_seconds.observe(run, stage=stage, outcome="ok" if ok else "failed")
+    if not ok:
+        # ctx['error'] is "ExceptionType: message" when the stage raised
+        error = ctx['error'].split(':', 1)[0] if ctx.get('error') else "dropped"
+        stage_errors.inc(stage=stage, error=error)
+
+def trace_record(key: str, ctx: Dict, ok: bool, stage: str) -> Dict:
+    """One TRACE_FILE line describing a job's trip through the pipeline"""
+    job = ctx['job']
+    result = ctx.get('result') or {}
+    return {
+        "ts": round(time.time(), 3),
+        "job": key,
+        "title": job['title'],
+        "job_type": job['job_type_name'],
+        "ok": ok,
+        "stage": stage,
+        "error": ctx.get('error'),
+        "total_s": round(time.time() - ctx['_submitted_at'], 4),
+        "stages": ctx.get('_timings', {}),
+        "code_bytes": ctx.get('code_bytes'),
+        "resumed": ctx.get('resumed'),
+        "cached": ctx.get('cached', False),
+        "status": result.get('status'),
+        "execution_ms": result.get('execution_time_ms'),
+        "result_cid": ctx.get('result_cid'),
+        "cost": ctx.get('cost'),
+        "signature": ctx.get('signature'),
+    }
+
+def component_stats(*components: Tuple[str, Optional[Dict]]):
+    """(component, stat) samples from the stats dicts components keep"""
+    for name, values in components:
+        for stat, value in (values or {}).items():
+            yield (name, stat), value
+
+def register_metrics(pipeline: JobPipeline, job_index: JobIndex, batcher: CompletionBatcher,
+                     scheduler: JobScheduler, leases: Optional[ShardLeases] = None):
+    """Scrape-time gauges over the pipeline, scheduler, index and component stats"""
+    metrics.collected(
+        "worker_stage_queue_depth", "Jobs waiting in front of each stage", ["stage"],
+        lambda: [((name,), s["queued"]) for name, s in pipeline.stats().items()])
+    metrics.collected(
+        "worker_stage_busy", "Stage threads currently running a job", ["stage"],
+        lambda: [((name,), s["busy"]) for name, s in pipeline.stats().items()])
+    metrics.collected(
+        "worker_scheduler_queued", "Jobs waiting in the scheduler per job type", ["job_type"],
+        lambda: [((name,), s["queued"]) for name, s in scheduler.stats().items()])
+    metrics.collected(
+        "worker_scheduler_stat", "Scheduler counters per job type (offered, dispatched, rejected, owners_capped)",
+        ["job_type", "stat"],
+        lambda: [((name, stat), value) for name, s in scheduler.stats().items()
+                 for stat, value in s.items() if stat != "queued"])
+    metrics.collected(
+        "worker_shards_owned", "Shards this worker currently owns", [],
+        lambda: [((), len(shards.owned))])
+    metrics.collected(
+        "worker_index_jobs", "Pending jobs in the index by run state, plus all accounts", ["state"],
+        lambda: [((state,), count) for state, count in job_index.counts().items()])
+    metrics.collected(
+        "worker_rpc_endpoint_stat", "Per-RPC-endpoint request counters, latency, error rate and rate limit",
+        ["endpoint", "stat"],
+        lambda: [((endpoint, stat), value)
+                 for endpoint, values in client.endpoint_stats().items()
+                 for stat, value in values.items()])
+    metrics.collected(
+        "worker_ipfs_gateway_stat", "Per-gateway request counters and latency", ["gateway", "stat"],
+        lambda: [((gateway, stat), value)
+                 for gateway, values in ipfs_fetcher.stats()["gateways"].items()
+                 for stat, value in values.items()])
+    metrics.collected(
+        "worker_component_stat", "Counters kept by worker components (caches, batchers, executors)",
+        ["component", "stat"],
+        lambda: component_stats(
+            ("ipfs_cache", ipfs_fetcher.stats().get("cache")),
+            ("rpc", client.stats),
+            ("completion", batcher.stats),
+            ("confirmation", confirmations.stats),
+            ("blockhash", blockhashes.stats),
+            ("journal", journal.stats if journal is not None else None),
+            ("shard_leases", leases.stats if leases is not None else None),
+            ("result_cache", result_cache.stats if result_cache is not None else None),
+            ("pinata", pins.stats),
+            ("executor", executor.stats),
+            ("local_pool", executor.local.stats if executor.local is not None else None),
+            ("lambda", executor.remote.stats if executor.remote is not None else None),
+        ))
+
+def deploy_lambda_async() -> Future:
+    """Run create_lambda_function on a background thread; the Future holds its result"""
+    future: Future = Future()
+    
+    def deploy():
+        future.set_result(create_lambda_function())
+    
+    threading.Thread(target=deploy, name="lambda-deploy", daemon=True).start()
+    return future
+
+def start_sharding(worker: Keypair, on_change) -> Tuple[bool, Optional[ShardLeases]]:
+    """Apply the SHARD_* settings to `shards`; returns (ok, leases if leasing)"""
+    if SHARD_COUNT <= 1:
+        return True, None
+    preferred = None
+    if SHARD_INDEX:
+        preferred = int(SHARD_INDEX)
+        if not 0 <= preferred < SHARD_COUNT:
+            print(f"✗ SHARD_INDEX must be between 0 and {SHARD_COUNT - 1}")
+            return False, None
+    if not SHARD_LEASE_PATH:
+        if preferred is None:
+            print("✗ SHARD_COUNT > 1 needs SHARD_INDEX or SHARD_LEASE_PATH")
+            return False, None
+        shards.set(frozenset([preferred]))
+        print(f"Shard: {preferred} of {SHARD_COUNT}\n")
+        return True, None
+    owner = f"{worker.pubkey()}@{socket.gethostname()}:{os.getpid()}"
+    try:
+        leases = ShardLeases(SHARD_LEASE_PATH, owner, shards, ttl=SHARD_LEASE_TTL,
+                             preferred=preferred, on_change=on_change)
+    except ValueError as e:
+        print(f"✗ SHARD_LEASE_PATH: {e}")
+        print("  Leases only coordinate the workers of one host; give workers on other hosts a SHARD_INDEX")
+        return False, None
+    leases.start()
+    print(f"Shards: {sorted(shards.owned)} of {SHARD_COUNT} leased via {SHARD_LEASE_PATH} "
+          f"({SHARD_LEASE_TTL:.0f}s TTL)\n")
+    return True, leases
+
+def build_executor() -> Optional[ExecutorRouter]:
+    """Start the local pool and/or the Lambda deploy check according to EXECUTOR.
+
+    The deploy check runs in the background; Lambda invokes wait for it, so
+    discovery and local jobs start right away.
+    """
+    remote = None
+    if EXECUTOR in ("auto", "lambda"):
+        if AWS_ACCESS_KEY and AWS_SECRET_KEY:
+            if LAMBDA_BATCH_SIZE > 1:
+                remote = LambdaBatchExecutor(
+                    clients, LAMBDA_FUNCTION_NAME,
+                    window=LAMBDA_BATCH_WINDOW_MS / 1000,
+                    max_batch=LAMBDA_BATCH_SIZE,
+                    max_payload_bytes=LAMBDA_BATCH_MAX_KB * 1024,
+                    invokers=PIPELINE_EXECUTE_WORKERS,
+                    compress=LAMBDA_COMPRESS,
+                    output_limit=OUTPUT_LIMIT_KB * 1024,
+                    job_timeout=LAMBDA_JOB_TIMEOUT,
+                )
+            else:
+                remote = LambdaExecutor(
+                    clients, LAMBDA_FUNCTION_NAME,
+                    compress=LAMBDA_COMPRESS, output_limit=OUTPUT_LIMIT_KB * 1024,
+                    job_timeout=LAMBDA_JOB_TIMEOUT
+                )
+            remote.ready = deploy_lambda_async()
+        else:
+            print("✗ AWS credentials not set. Please set:")
+            print("  export AWS_ACCESS_KEY_ID='your_key'")
+            print("  export AWS_SECRET_ACCESS_KEY='your_secret'")
+            print("  or EXECUTOR=local to run every job on this host")
+            return None
+    
+    local = None
+    if EXECUTOR in ("auto", "local"):
+        try:
+            local = LocalPoolExecutor(
+                LAMBDA_CODE,
+                workers=LOCAL_EXECUTOR_WORKERS,
+                timeout=LOCAL_EXECUTOR_TIMEOUT,
+                memory_mb=LOCAL_EXECUTOR_MEMORY_MB,
+                output_limit=OUTPUT_LIMIT_KB * 1024,
+                python=LOCAL_EXECUTOR_PYTHON,
+                user=LOCAL_EXECUTOR_USER,
+            )
+        except Exception as e:
+            print(f"✗ Local executor failed to start: {e}")
+            if remote is not None:
+                remote.close()
+            return None
+    
+    if local is None and remote is None:
+        print(f"✗ Unknown EXECUTOR '{EXECUTOR}' (expected auto, lambda or local)")
+        return None
+    return ExecutorRouter(local, remote, LOCAL_MAX_CODE_BYTES, LOCAL_JOB_TYPES)
+
 def main(program_id: str, keypair_path: str, interval: int = 10):
     """Main processing loop"""
-    global running
+    global running, executor, journal, result_cache
     
-    if AWS_ACCESS_KEY and AWS_SECRET_KEY:
-        if not create_lambda_function():
-            print("Failed to create Lambda function. Exiting.")
-            return
-    else:
-        print("✗ AWS credentials not set. Please set:")
-        print("  export AWS_ACCESS_KEY_ID='your_key'")
-        print("  export AWS_SECRET_ACCESS_KEY='your_secret'")
+    if not PINATA_JWT:
+        # A job only completes once its result is pinned, so without Pinata every job would run in vain
+        print("✗ PINATA_JWT not set. Results cannot be pinned, so no job could complete")
+        print("  export PINATA_JWT='your_jwt'")
         return
     
-    if not PINATA_JWT:
-        print("⚠ Warning: PINATA_JWT not set. Results will use fallback CIDs")
-        print("  export PINATA_JWT='your_jwt'\n")
+    routed = build_executor()
+    if routed is None:
+        return
+    executor = routed
+    
+    if executor.remote is not None and executor.remote.ready is not None:
+        def on_deployed(deployed: Future):
+            global running
+            if deployed.result():
+                return
+            print("Failed to create Lambda function. Exiting.")
+            running = False
+        
+        executor.remote.ready.add_done_callback(on_deployed)
     
     print("="*70)
     print("Solana Job Processor")
     print("="*70)
     print(f"Program: {program_id}")
-    print(f"Lambda: {LAMBDA_FUNCTION_NAME}")
-    print(f"Interval: {interval}s\n")
+    print(f"RPC: {len(RPC_URLS)} endpoint(s)" + (f", sends to {min(RPC_SEND_FANOUT, len(RPC_URLS))}" if len(RPC_URLS) > 1 else ""))
+    if executor.remote is not None:
+        print(f"Lambda: {LAMBDA_FUNCTION_NAME} (batches of up to {max(1, LAMBDA_BATCH_SIZE)})")
+    if executor.local is not None:
+        print(f"Local executor: {LOCAL_EXECUTOR_WORKERS} process(es), "
+              f"{LOCAL_EXECUTOR_TIMEOUT:.0f}s timeout, {LOCAL_EXECUTOR_MEMORY_MB}MB, "
+              f"user {LOCAL_EXECUTOR_USER or 'of the worker'}"
+              + (f", jobs {'/'.join(LOCAL_JOB_TYPES)} up to {LOCAL_MAX_CODE_BYTES} bytes" if executor.remote else ""))
+    print(f"Interval: {interval}s")
+    print(f"Pipeline: fetch={PIPELINE_FETCH_WORKERS} execute={PIPELINE_EXECUTE_WORKERS} "
+          f"upload={PIPELINE_UPLOAD_WORKERS} complete={PIPELINE_COMPLETE_WORKERS} "
+          f"queue={PIPELINE_QUEUE_SIZE}\n")
     
     worker = load_keypair(keypair_path)
     print(f"Worker: {worker.pubkey()}\n")
@@ -609,40 +1500,216 @@ def main(program_id: str, keypair_path: str, interval: int = 10):
         print(f"✓ Connected to Solana! Version: {version.value}\n")
     except Exception as e:
         print(f"✗ Connection failed: {e}")
+        executor.close()
         return
     
-    processed = 0
+    shards_changed = threading.Event()
+    sharded, leases = start_sharding(worker, lambda owned: shards_changed.set())
+    if not sharded:
+        executor.close()
+        return
+    
+    if JOURNAL_PATH:
+        journal = JobJournal(JOURNAL_PATH)
+        print(f"Journal: {JOURNAL_PATH} ({len(journal)} unfinished job(s))\n")
+        recheck_journal()
+    if RESULT_CACHE_TTL > 0:
+        result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES)
+        print(f"Result cache: {RESULT_CACHE_PATH} ({len(result_cache)} result(s), "
+              f"{', '.join(sorted(RESULT_CACHE_JOB_TYPES))} jobs, TTL {RESULT_CACHE_TTL:g}s)\n")
+    
+    stats = {'processed': 0, 'failed': 0}
+    tracer = JobTracer(TRACE_FILE) if TRACE_FILE else None
+    
+    def on_finish(key: str, ctx: Dict, ok: bool, stage: str):
+        elapsed = time.time() - ctx['_submitted_at']
+        outcome = "completed" if ok else "failed"
+        jobs_total.inc(outcome=outcome)
+        job_seconds.observe(elapsed, outcome=outcome)
+        if tracer is not None:
+            tracer.write(trace_record(key, ctx, ok, stage))
+        if ok:
+            stats['processed'] += 1
+            log.info("✓ Completed", job=ctx['job']['title'], seconds=round(elapsed, 2))
+        else:
+            stats['failed'] += 1
+            log.warning("✗ Failed", job=ctx['job']['title'], stage=stage,
+                        seconds=round(elapsed, 2), error=ctx.get('error'))
+    
+    job_index = JobIndex(
+        decode_job, JobStatus.PENDING,
+        retry_delay=JOB_RETRY_DELAY, submitted_timeout=JOB_SUBMITTED_TIMEOUT,
+        max_attempts=JOB_MAX_ATTEMPTS
+    )
+    
+    def release(key: str, ctx: Dict, ok: bool, stage: str):
+        job_index.release(key, ok)
+        scheduler.done(ctx['job']['owner'])
+        on_finish(key, ctx, ok, stage)
+    
+    batcher = CompletionBatcher(
+        lambda instructions: send_complete_transaction(instructions, worker),
+        worker.pubkey(),
+        window=COMPLETION_BATCH_WINDOW_MS / 1000,
+        max_batch=COMPLETION_BATCH_SIZE,
+    )
+    blockhashes.start()
+    batcher.start()
+    confirmations.start()
+    
+    # Stages whose load has_capacity() counts; a job leaving one may admit the next
+    admit_stages = ("fetch", "execute")
+    
+    def stage_done(stage: str, ctx: Dict, wait: float, run: float, ok: bool):
+        observe_stage(stage, ctx, wait, run, ok)
+        if stage in admit_stages:
+            scheduler.wake()
+    
+    pipeline = JobPipeline(
+        PIPELINE_STAGES, queue_size=PIPELINE_QUEUE_SIZE,
+        on_finish=release, on_stage=stage_done
+    )
+    pipeline.start()
+    
+    def submit(key: str, ctx: Dict) -> bool:
+        if pipeline.submit(key, ctx, timeout=5):
+            return True
+        job_index.unclaim(key)
+        return False
+    
+    def has_capacity() -> bool:
+        stages = pipeline.stats()
+        ahead = sum(stages[name]["queued"] + stages[name]["busy"] for name in admit_stages)
+        return ahead < SCHEDULER_ADMIT_AHEAD
+    
+    scheduler = JobScheduler(
+        submit, has_capacity, parse_weights(SCHEDULER_WEIGHTS),
+        owner_cap=SCHEDULER_OWNER_CAP, max_queued=SCHEDULER_MAX_QUEUED,
+        on_dispatch=lambda job_type, wait: scheduler_wait_seconds.observe(wait, job_type=job_type)
+    )
+    scheduler.start()
+    
+    register_metrics(pipeline, job_index, batcher, scheduler, leases)
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(metrics, METRICS_PORT, METRICS_HOST)
+        try:
+            metrics_server.start()
+            print(f"Metrics: http://{METRICS_HOST}:{metrics_server.port}/metrics\n")
+        except OSError as e:
+            log.warning("✗ Metrics endpoint not started", port=METRICS_PORT, error=str(e))
+            metrics_server = None
+    
+    def enqueue(job: Dict) -> bool:
+        """Claim a runnable job and hand it to the scheduler"""
+        key = job['account_address']
+        if not shards.owns(key) or not job_index.claim(key):
+            return False
+        ctx = {'job': job, 'program_id': program_id, 'worker': worker, 'batcher': batcher}
+        ctx.update(resume_context(job))
+        if 'confirmed' in ctx:
+            # Completion landed before a restart; wait for the account to settle
+            job_index.release(key, True)
+            return False
+        if 'resumed' in ctx:
+            log.info("↻ Resuming from journal", job=job['title'], after=ctx['resumed'])
+        if scheduler.offer(key, ctx, job['job_type_name'], job['owner'], job['start_time']):
+            return True
+        job_index.unclaim(key)
+        return False
+    
+    subscriber = None
+    if DISCOVERY_SUBSCRIBE:
+        def on_account(pubkey: str, data: bytes, slot: int):
+            if not shards.owns(pubkey):
+                return
+            diff = IndexDiff()
+            job_index.observe(pubkey, data, slot, diff)
+            for job in diff.new + diff.changed:
+                if enqueue(job):
+                    log.info("⚡ Pushed job", job=job['title'], slot=slot)
+        
+        def on_event(data: bytes, slot: int):
+            job_address = decode_job_created(data)
+            if job_address and job_index.get(job_address) is None:
+                response = client.get_account_info(Pubkey.from_string(job_address), encoding="base64")
+                if response.value is not None:
+                    on_account(job_address, account_data(response.value), response.context.slot)
+        
+        subscriber = JobSubscriber(
+            DISCOVERY_WS_URL, program_id, on_account, on_event,
+            account_filters=job_account_filters()
+        )
+        subscriber.start()
+        print(f"Subscribing: {DISCOVERY_WS_URL} (reconcile every {RECONCILE_INTERVAL}s)\n")
+    
     iteration = 0
     
     while running:
         iteration += 1
-        print(f"\n{'#'*70}")
-        print(f"Check #{iteration} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'#'*70}")
+        log.info(f"Check #{iteration}", time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         
-        jobs = fetch_pending_jobs(program_id)
+        shards_changed.clear()
+        diff = sync_job_index(program_id, job_index)
+        prune_journal(job_index, diff)
+        jobs = job_index.runnable()
         
         if jobs:
-            print(f"\nFound {len(jobs)} pending job(s)")
-            for job in jobs:
-                if not running:
-                    break
-                if process_job(job, program_id, worker):
-                    processed += 1
-                time.sleep(2)
+            # Jobs the scheduler refuses (its queue is full) stay runnable for the next sweep
+            queued = sum(1 for job in jobs if enqueue(job))
+            log.info(f"{diff}: {len(jobs)} runnable job(s), queued {queued}")
         else:
-            print("\nNo pending jobs")
+            log.info(f"{diff}: no runnable jobs")
         
-        print(f"\n📊 Total processed: {processed}")
+        log.info("📊 Totals", processed=stats['processed'], failed=stats['failed'],
+                 scheduled=scheduler.queued(), in_flight=len(pipeline.in_flight()), index=job_index.counts())
+        log.debug("   IPFS", stats=ipfs_fetcher.stats())
+        if executor.local is not None:
+            log.debug("   Executors", routed=executor.stats, local_pool=executor.local.stats)
+        if executor.remote is not None:
+            log.debug("   Lambda", stats=executor.remote.stats)
+        log.debug("   Completions", batcher=batcher.stats, confirmations=confirmations.stats,
+                  blockhash=blockhashes.stats)
+        log.debug("   RPC", stats=client.stats, endpoints=client.endpoint_stats())
         
         if running:
-            print(f"\nWaiting {interval}s...")
-            for _ in range(interval):
+            # Poll at the normal interval only while the subscription is down
+            subscribed = subscriber is not None and subscriber.connected.is_set()
+            wait = RECONCILE_INTERVAL if subscribed else interval
+            log.debug(f"Waiting {wait}s...")
+            for _ in range(wait):
                 if not running:
                     break
-                time.sleep(1)
+                if subscriber is not None and subscribed != subscriber.connected.is_set():
+                    break
+                # New shards are swept right away
+                if shards_changed.wait(1):
+                    break
     
-    print("\nGoodbye!")
+    if subscriber is not None:
+        subscriber.stop()
+    for key, _ in scheduler.stop():
+        job_index.unclaim(key)
+    log.info("Draining pipeline...")
+    pipeline.stop(drain=True, timeout=60)
+    batcher.stop()
+    pins.stop()
+    confirmations.stop()
+    blockhashes.stop()
+    executor.close()
+    if leases is not None:
+        leases.stop()
+    clients.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if tracer is not None:
+        tracer.close()
+    if journal is not None:
+        journal.close()
+    if result_cache is not None:
+        result_cache.close()
+    log.info("Goodbye!")
+    shutdown_logging()
 
 if __name__ == "__main__":
     PROGRAM_ID = "YOUR_PROGRAM_ID"
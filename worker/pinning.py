@@ -0,0 +1,312 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cid import cid_v0, directory_cid_v0
+from log import get_logger
+
+log = get_logger("pinning")
+
+PINNED_MEMORY = 4096  # CIDs remembered as pinned, most recent last
+
+
+class PinError(Exception):
+    """Content could not be pinned within the allowed attempts"""
+
+
+class _Entry:
+    __slots__ = ("cid", "name", "content", "futures", "attempts")
+
+    def __init__(self, cid: str, name: str, content: Optional[bytes]):
+        self.cid = cid
+        self.name = name
+        self.content = content  # None while it waits in the spool
+        self.futures: List[Future] = []
+        self.attempts = 0
+
+
+class PinQueue:
+    """Pins encoded results on Pinata in the background, several per request.
+
+    submit() computes the content's CIDv0 locally and returns a Future that
+    resolves with the CID once Pinata has confirmed the pin. Content is first
+    written to `spool_dir` (kept in memory when it is None) and read back when
+    its request goes out, so a Pinata outage costs disk, not memory, and
+    results still waiting are pinned when the worker starts again.
+
+    A background thread collects submissions for up to `window` seconds or
+    `max_batch` items. One item is pinned as a file; several are uploaded in
+    one pinFileToIPFS request as a directory, whose CID is checked against the
+    one computed locally (the files inside keep their own CIDs). At most
+    `concurrency` requests are in flight. A failed request is retried after an
+    exponential backoff with jitter; a batch whose directory CID does not match
+    is split into single uploads. After `max_attempts` the Futures fail with
+    PinError and the content stays in the spool.
+
+    Identical content is uploaded once: a CID that is already pinned (or on its
+    way) resolves without another request. `on_request(files, bytes, seconds,
+    outcome)` observes each request.
+    """
+
+    def __init__(self, session, api_url: str, spool_dir: Optional[str] = None, timeout: float = 30.0,
+                 concurrency: int = 4, max_batch: int = 16, window: float = 0.1, max_attempts: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0,
+                 on_request: Optional[Callable[[int, int, float, str], None]] = None):
+        self.session = session
+        self.api_url = api_url.rstrip("/")
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_request = on_request
+        self.stats = {"submitted": 0, "pinned": 0, "already_pinned": 0, "requests": 0, "batched": 0,
+                      "retries": 0, "splits": 0, "failed": 0, "cid_mismatch": 0, "recovered": 0, "spooled": 0}
+        self._pending: Dict[str, _Entry] = {}  # cid -> entry queued or being uploaded
+        self._pinned: "OrderedDict[str, None]" = OrderedDict()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._uploaders = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="pin-upload")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+
+    def start(self):
+        if self._thread:
+            return
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="pin-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop after the requests in flight; queued content stays in the spool"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._uploaders.shutdown(wait=True)
+
+    def submit(self, content: bytes, name: str) -> Future:
+        future: Future = Future()
+        cid = cid_v0(content)
+        with self._lock:
+            self.stats["submitted"] += 1
+            if cid in self._pinned:
+                self._pinned.move_to_end(cid)
+                self.stats["already_pinned"] += 1
+                future.set_result(cid)
+                return future
+            entry = self._pending.get(cid)
+            if entry is not None:
+                entry.futures.append(future)
+                return future
+            entry = self._pending[cid] = _Entry(cid, name, content)
+            entry.futures.append(future)
+        if self._spool(cid, content):
+            entry.content = None
+        self._queue.put(entry)
+        return future
+
+    def is_pinned(self, cid: str) -> bool:
+        with self._lock:
+            return cid in self._pinned
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.spool_dir, cid)
+
+    def _spool(self, cid: str, content: bytes) -> bool:
+        if not self.spool_dir:
+            return False
+        path = self._path(cid)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        existed = os.path.exists(path)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("✗ Pin spool write error", error=str(e))
+            return False
+        if not existed:
+            with self._lock:
+                self.stats["spooled"] += 1
+        return True
+
+    def _unspool(self, cid: str):
+        if not self.spool_dir:
+            return
+        try:
+            os.remove(self._path(cid))
+        except OSError:
+            return
+        with self._lock:
+            self.stats["spooled"] -= 1
+
+    def _content(self, entry: _Entry) -> bytes:
+        if entry.content is not None:
+            return entry.content
+        with open(self._path(entry.cid), "rb") as f:
+            return f.read()
+
+    def _recover(self):
+        """Queue the content a previous run spooled but did not get pinned"""
+        if not self.spool_dir:
+            return
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".tmp"):
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+                continue
+            with self._lock:
+                if name in self._pending:
+                    continue
+                entry = self._pending[name] = _Entry(name, f"{name}.json", None)
+                self.stats["recovered"] += 1
+                self.stats["spooled"] += 1
+            self._queue.put(entry)
+        if self.stats["recovered"]:
+            log.info("↻ Pinning spooled results", count=self.stats["recovered"])
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._uploaders.submit(self._upload, batch)
+            except RuntimeError:
+                return  # shutting down; the batch stays spooled
+
+    def _upload(self, batch: List[_Entry]):
+        while True:
+            try:
+                files = self._files(batch)
+                pinned = self._request(batch, files)
+            except Exception as e:
+                if not self._retry(batch, e):
+                    return
+                continue
+            if len(batch) > 1 and pinned != directory_cid_v0(files):
+                # The directory was built differently, so the files' local CIDs are unconfirmed
+                with self._lock:
+                    self.stats["cid_mismatch"] += 1
+                    self.stats["splits"] += 1
+                log.warning("⚠ Pinned directory CID differs from local CID", cid=pinned, files=len(batch))
+                for entry in batch:
+                    self._upload([entry])
+                return
+            if len(batch) == 1 and pinned != batch[0].cid:
+                # Pinata chunked or encoded the file differently; its CID is the one that resolves
+                with self._lock:
+                    self.stats["cid_mismatch"] += 1
+                log.warning("⚠ Pinned CID differs from local CID", cid=pinned, local_cid=batch[0].cid)
+            for entry in batch:
+                self._resolve(entry, pinned if len(batch) == 1 else entry.cid)
+            return
+
+    def _files(self, batch: List[_Entry]) -> List[Tuple[str, bytes]]:
+        """(file name, content) per entry, names made unique within the batch"""
+        names = set()
+        files = []
+        for entry in batch:
+            name = entry.name if entry.name not in names else f"{entry.cid}_{entry.name}"
+            names.add(name)
+            files.append((name, self._content(entry)))
+        return files
+
+    def _request(self, batch: List[_Entry], files: List[Tuple[str, bytes]]) -> str:
+        """One pinFileToIPFS request; returns the CID Pinata pinned"""
+        start = time.perf_counter()
+        size = sum(len(content) for _, content in files)
+        if len(files) == 1:
+            name = files[0][0]
+            parts = [("file", (name, files[0][1], "application/json"))]
+        else:
+            # Files under one folder are pinned as a directory
+            name = f"job_results_{int(time.time())}_{batch[0].cid[-8:]}"
+            parts = [("file", (f"{name}/{file_name}", content, "application/json")) for file_name, content in files]
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["batched"] += len(batch) > 1
+        try:
+            response = self.session.post(
+                f"{self.api_url}/pinning/pinFileToIPFS",
+                files=parts,
+                data={
+                    "pinataMetadata": json.dumps({"name": name}),
+                    "pinataOptions": json.dumps({"cidVersion": 0}),
+                },
+                timeout=self.timeout,
+            )
+            if response.status_code != 200:
+                raise PinError(f"Status {response.status_code}")
+            pinned = response.json()["IpfsHash"]
+        except Exception:
+            self._observe(len(files), size, time.perf_counter() - start, "failed")
+            raise
+        self._observe(len(files), size, time.perf_counter() - start, "pinned")
+        return pinned
+
+    def _retry(self, batch: List[_Entry], error: Exception) -> bool:
+        """Back off before the next attempt; False (and the Futures failed) once attempts run out"""
+        attempts = max(entry.attempts for entry in batch) + 1
+        for entry in batch:
+            entry.attempts = attempts
+        if attempts >= self.max_attempts or self._stop.is_set():
+            with self._lock:
+                self.stats["failed"] += len(batch)
+                for entry in batch:
+                    self._pending.pop(entry.cid, None)
+            log.warning("✗ Pin failed, result stays spooled", files=len(batch), attempts=attempts, error=str(error))
+            for entry in batch:
+                for future in entry.futures:
+                    future.set_exception(PinError(f"not pinned after {attempts} attempt(s): {error}"))
+            return False
+        with self._lock:
+            self.stats["retries"] += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+        log.debug("↻ Pin retry", files=len(batch), attempt=attempts, delay_s=round(delay, 2), error=str(error))
+        self._stop.wait(delay)
+        return True
+
+    def _resolve(self, entry: _Entry, cid: str):
+        with self._lock:
+            self._pending.pop(entry.cid, None)
+            self.stats["pinned"] += 1
+            for known in {entry.cid, cid}:
+                self._pinned[known] = None
+                self._pinned.move_to_end(known)
+            while len(self._pinned) > PINNED_MEMORY:
+                self._pinned.popitem(last=False)
+        self._unspool(entry.cid)
+        for future in entry.futures:
+            future.set_result(cid)
+
+    def _observe(self, files: int, size: int, seconds: float, outcome: str):
+        if self.on_request:
+            try:
+                self.on_request(files, size, seconds, outcome)
+            except Exception as e:
+                log.error("✗ Pin request callback error", error=str(e))
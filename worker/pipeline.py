@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log import get_logger
+
+_STOP = object()
+
+log = get_logger("pipeline")
+
+
+class Stage:
+    """One step of the job pipeline, run by its own pool of threads"""
+
+    def __init__(self, name: str, func: Callable[[Dict], Optional[Dict]],
+                 workers: int = 1, queue_size: int = 16):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self.threads: List[threading.Thread] = []
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+
+
+class JobPipeline:
+    """Runs jobs through a chain of stages connected by bounded queues.
+
+    Every stage function receives the job context dict and returns it (possibly
+    updated) to pass it on, or None to drop the job. An exception in a stage
+    only fails the job that raised it. A full queue blocks the stage feeding it,
+    so backpressure propagates all the way back to submit().
+
+    Each stage's queue wait and run time (seconds) is recorded in
+    ctx["_timings"][stage] and passed to `on_stage(stage, ctx, wait, run, ok)`.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Dict], Optional[Dict]], int]],
+                 queue_size: int = 16,
+                 on_finish: Optional[Callable[[str, Dict, bool, str], None]] = None,
+                 on_stage: Optional[Callable[[str, Dict, float, float, bool], None]] = None):
+        self.stages = [Stage(name, func, workers, queue_size) for name, func, workers in stages]
+        self.on_finish = on_finish
+        self.on_stage = on_stage
+        self._in_flight: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._run_stage, args=(index,),
+                    name=f"{stage.name}-{n}", daemon=True
+                )
+                t.start()
+                stage.threads.append(t)
+
+    def submit(self, key: str, ctx: Dict, timeout: Optional[float] = None) -> bool:
+        """Queue a job for the first stage. Returns False if it is already in
+        flight or the first queue stayed full for `timeout` seconds."""
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight[key] = self.stages[0].name
+        ctx["_key"] = key
+        ctx.setdefault("_submitted_at", time.time())
+        ctx["_queued_at"] = time.time()
+        try:
+            self.stages[0].queue.put(ctx, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            return False
+        return True
+
+    def is_in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._in_flight
+
+    def in_flight(self) -> Dict[str, str]:
+        """Snapshot of job key -> stage it is currently queued for or running in"""
+        with self._lock:
+            return dict(self._in_flight)
+
+    def idle(self) -> bool:
+        with self._lock:
+            return not self._in_flight
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted job has left the pipeline"""
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.idle():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = None):
+        """Stop all stage threads, optionally letting queued jobs finish first"""
+        if not self._started:
+            return
+        if drain:
+            self.join(timeout)
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for t in stage.threads:
+                t.join(timeout=5)
+            stage.threads.clear()
+        self._started = False
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "queued": stage.queue.qsize(),
+                "busy": stage.busy,
+                "processed": stage.processed,
+                "failed": stage.failed,
+            }
+            for stage in self.stages
+        }
+
+    def _run_stage(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            ctx = stage.queue.get()
+            if ctx is _STOP:
+                return
+
+            key = ctx["_key"]
+            started = time.time()
+            wait = started - ctx.get("_queued_at", started)
+            with self._lock:
+                stage.busy += 1
+            try:
+                out = stage.func(ctx)
+            except Exception as e:
+                ctx["error"] = f"{type(e).__name__}: {e}"
+                out = None
+            finally:
+                with self._lock:
+                    stage.busy -= 1
+            run = time.time() - started
+            ctx.setdefault("_timings", {})[stage.name] = {"wait": round(wait, 4), "run": round(run, 4)}
+            if self.on_stage:
+                try:
+                    self.on_stage(stage.name, ctx, wait, run, out is not None)
+                except Exception as e:
+                    log.error("✗ Pipeline stage callback error", error=str(e))
+
+            if out is None:
+                with self._lock:
+                    stage.failed += 1
+                self._finish(key, ctx, False, stage.name)
+                continue
+
+            with self._lock:
+                stage.processed += 1
+            if next_stage is None:
+                self._finish(key, out, True, stage.name)
+                continue
+
+            with self._lock:
+                self._in_flight[key] = next_stage.name
+            out["_queued_at"] = time.time()
+            # Blocks while the next stage is saturated (backpressure)
+            next_stage.queue.put(out)
+
+    def _finish(self, key: str, ctx: Dict, ok: bool, stage_name: str):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if self.on_finish:
+            try:
+                self.on_finish(key, ctx, ok, stage_name)
+            except Exception as e:
+                log.error("✗ Pipeline callback error", error=str(e), exc_info=True)
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from log import get_logger
+
+log = get_logger("result_cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    key TEXT PRIMARY KEY,
+    code_bytes INTEGER NOT NULL,
+    output BLOB NOT NULL,  -- the result as JSON, without the fields of the job that produced it
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outputs_used_at ON outputs (used_at);
+"""
+PURGE_EVERY = 256  # puts between sweeps for expired rows
+
+
+def result_key(code_cid: str, job_type: str, handler_version: str) -> str:
+    return f"{code_cid}|{job_type}|{handler_version}"
+
+
+class ResultCache:
+    """Outputs of deterministic jobs in SQLite, keyed by result_key().
+
+    The same code (a CID names exactly one program) run by the same handler
+    version gives the same output, so a later job with that code can skip
+    downloading and executing it. Only the owner-independent output is kept:
+    the caller strips the fields naming the job that produced it (title,
+    owner, time) before put() and stamps its own job's in after get(), so a
+    result never exposes another user's job. Entries expire `ttl` seconds
+    after they were stored; beyond `max_entries` the least recently used ones
+    are evicted. `saved_ms` adds up the execution time of every hit.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int = 10_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0, "saved_ms": 0, "errors": 0}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._size = self._db.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._size
+
+    def get(self, key: str) -> Optional[Dict]:
+        """{'output', 'code_bytes'} of a live entry, None on a miss"""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT code_bytes, output, stored_at FROM outputs WHERE key = ?", (key,)).fetchone()
+                if row is None or row[2] < now - self.ttl:
+                    self.stats["misses"] += 1
+                    if row is not None:
+                        self._db.execute("DELETE FROM outputs WHERE key = ?", (key,))
+                        self._size -= 1
+                        self.stats["expired"] += 1
+                    return None
+                self._db.execute("UPDATE outputs SET used_at = ? WHERE key = ?", (now, key))
+                output = json.loads(row[1])
+                self.stats["hits"] += 1
+                self.stats["saved_ms"] += int(output.get('execution_time_ms') or 0)
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            log.warning("✗ Result cache read failed", error=str(e))
+            return None
+        return {'output': output, 'code_bytes': row[0]}
+
+    def put(self, key: str, content: bytes, code_bytes: int):
+        """Remember an encoded output that holds nothing specific to the job that produced it"""
+        now = time.time()
+        try:
+            with self._lock:
+                exists = self._db.execute("SELECT 1 FROM outputs WHERE key = ?", (key,)).fetchone() is not None
+                self._db.execute(
+                    "INSERT OR REPLACE INTO outputs (key, code_bytes, output, stored_at, used_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, code_bytes, content, now, now))
+                self._size += 0 if exists else 1
+                self.stats["stores"] += 1
+                self._puts += 1
+                if self._puts % PURGE_EVERY == 0:
+                    expired = self._db.execute("DELETE FROM outputs WHERE stored_at < ?", (now - self.ttl,)).rowcount
+                    self._size -= expired
+                    self.stats["expired"] += expired
+                if self._size > self.max_entries:
+                    evicted = self._db.execute(
+                        "DELETE FROM outputs WHERE key IN (SELECT key FROM outputs ORDER BY used_at LIMIT ?)",
+                        (self._size - self.max_entries,)).rowcount
+                    self._size -= evicted
+                    self.stats["evicted"] += evicted
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            log.warning("✗ Result cache write failed", error=str(e))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,363 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from solana.exceptions import SolanaRpcException
+
+from account_stream import RpcStreamError, stream_program_accounts
+from log import get_logger
+
+log = get_logger("rpc_pool")
+
+# Client methods that change chain state; everything else is a read
+WRITE_METHODS = frozenset({"send_transaction", "send_raw_transaction"})
+LATENCY_WINDOW = 128  # recent latencies kept per endpoint and method for the hedge percentile
+MAX_BACKOFF = 30.0
+
+
+def client_session(client) -> httpx.Client:
+    """The httpx.Client a solana-py Client sends its requests through.
+
+    There is no public accessor for it; requirements.txt caps solana-py at the
+    versions this attribute is known to exist in.
+    """
+    return client._provider.session
+
+
+class RateLimited(Exception):
+    """The endpoint answered 429 Too Many Requests"""
+
+
+class TokenBucket:
+    """Requests per second with bursts of `burst`; rate None means unlimited.
+
+    Additive increase, multiplicative decrease: throttle() halves the rate on
+    each 429 and recover() wins a little of it back per success, up to the
+    configured rate (or without bound for an unlimited bucket).
+    """
+
+    def __init__(self, rate: Optional[float], burst: float = 10.0):
+        self.ceiling = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available; returns the seconds waited"""
+        with self._lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._at) * self.rate)
+            self._at = now
+            self._tokens -= 1
+            wait_s = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_s:
+            time.sleep(wait_s)
+        return wait_s
+
+    def throttle(self, observed_rate: float):
+        """A 429: halve the rate (an unlimited bucket starts from the rate it was sending at)"""
+        with self._lock:
+            current = self.rate if self.rate is not None else max(1.0, observed_rate)
+            self.rate = max(0.5, current / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def recover(self):
+        with self._lock:
+            if self.rate is None:
+                return
+            if self.ceiling is not None and self.rate >= self.ceiling:
+                return
+            self.rate += max(0.05, self.rate * 0.02)
+            if self.ceiling is not None:
+                self.rate = min(self.rate, self.ceiling)
+
+
+class Endpoint:
+    __slots__ = ("url", "client", "bucket", "stats", "latencies", "cooldown_until", "backoff", "_second", "_count")
+
+    def __init__(self, url: str, client, rate_limit: Optional[float], burst: float):
+        self.url = url
+        self.client = client
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "hedges": 0, "wins": 0,
+                      "latency_ms_avg": 0.0, "error_rate": 0.0}
+        self.latencies: Dict[str, deque] = {}
+        self.cooldown_until = 0.0
+        self.backoff = 0.0
+        self._second = 0
+        self._count = 0
+
+    def score(self, now: float) -> float:
+        """Lower is better: recent latency inflated by recent errors; cooling down ranks last"""
+        s = self.stats
+        latency = s["latency_ms_avg"] or 1.0
+        penalty = 1e6 if now < self.cooldown_until else 0.0
+        return penalty + latency * (1 + 10 * s["error_rate"])
+
+
+class RpcPool:
+    """Stands in for solana.rpc.api.Client over several RPC endpoints.
+
+    Reads go to the healthiest endpoint: lowest moving-average latency,
+    inflated by its recent error rate. If no answer has arrived after the
+    `hedge_percentile` latency that endpoint has shown for the same method
+    (clamped to `hedge_min`..`hedge_max`), the read is hedged to the next
+    endpoint and the first answer wins. Transport errors and 429s move the
+    read on to the next endpoint, and a whole round that failed is retried
+    up to `retries` times with exponential backoff. An error the node
+    answered with (RPCException) is returned to the caller as is.
+
+    Each endpoint has a token bucket (`rate_limit` requests/s, None for no
+    limit) that halves on every 429 and slowly recovers. A 429 also cools the
+    endpoint down for its Retry-After (or an exponential backoff), during
+    which it is only used when every other endpoint is cooling down too.
+
+    Writes (send_transaction) go to the `send_fanout` healthiest endpoints at
+    once so a transaction reaches the leader even when one node is slow;
+    the first accepted send wins.
+
+    stream_program_accounts() reads getProgramAccounts from the healthiest
+    endpoint as it arrives instead of as one response; it moves on to the next
+    endpoint only until the first account has been yielded.
+    """
+
+    def __init__(self, clients: Dict[str, Any], rate_limit: Optional[float] = None, burst: float = 20.0,
+                 hedge_percentile: float = 0.9, hedge_min: float = 0.05, hedge_max: float = 2.0,
+                 retries: int = 2, send_fanout: int = 3):
+        self.endpoints = [Endpoint(url, client, rate_limit, burst) for url, client in clients.items()]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.retries = retries
+        self.send_fanout = max(1, send_fanout)
+        self.stats = {"reads": 0, "writes": 0, "hedged": 0, "hedge_wins": 0, "retried": 0, "failed": 0}
+        self._pool = ThreadPoolExecutor(max_workers=max(8, len(self.endpoints) * 8), thread_name_prefix="rpc")
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.endpoints[0].client, name)
+        if not callable(method):
+            return method
+        if name in WRITE_METHODS:
+            return lambda *args, **kwargs: self._write(name, args, kwargs)
+        return lambda *args, **kwargs: self._read(name, args, kwargs)
+
+    def stream_program_accounts(self, program_id: str, filters: Optional[List[Dict]] = None,
+                                data_slice: Optional[Dict] = None) -> Iterator[Tuple[str, bytes]]:
+        """(address, data) of the program's accounts, parsed incrementally (see account_stream)"""
+        with self._lock:
+            self.stats["reads"] += 1
+        error: Optional[Exception] = None
+        for endpoint in self._ranked():
+            endpoint.bucket.acquire()
+            start = time.time()
+            with self._lock:
+                endpoint.stats["requests"] += 1
+            session = client_session(endpoint.client)
+            accounts = stream_program_accounts(
+                session, endpoint.url, program_id, filters, data_slice,
+                commitment=endpoint.client.commitment, timeout=session.timeout)
+            try:
+                first = next(accounts, None)
+            except RpcStreamError:
+                self._succeeded(endpoint, "getProgramAccounts", time.time() - start)
+                raise
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 429:
+                    self._rate_limited(endpoint, e.response.headers.get("Retry-After"))
+                    error = RateLimited(f"{endpoint.url} rate limited")
+                else:
+                    self._failed(endpoint, e)
+                    error = e
+                continue
+            except (httpx.HTTPError, ValueError) as e:
+                self._failed(endpoint, e)
+                error = e
+                continue
+            # Latency to the first account: the rest streams at the pace the caller consumes it
+            self._succeeded(endpoint, "getProgramAccounts", time.time() - start)
+            if first is not None:
+                yield first
+                yield from accounts
+            return
+        with self._lock:
+            self.stats["failed"] += 1
+        raise error
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {e.url: dict(e.stats, rate_limit=round(e.bucket.rate or 0.0, 2)) for e in self.endpoints}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            try:
+                client_session(endpoint.client).close()
+            except Exception:
+                pass
+
+    def _ranked(self) -> List[Endpoint]:
+        now = time.time()
+        with self._lock:
+            return sorted(self.endpoints, key=lambda e: e.score(now))
+
+    def _read(self, method: str, args, kwargs):
+        with self._lock:
+            self.stats["reads"] += 1
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            ranked = self._ranked()
+            if attempt:
+                with self._lock:
+                    self.stats["retried"] += 1
+                # Back off, and past the cooldown if every endpoint is cooling down
+                pause = max(0.25 * 2 ** (attempt - 1), ranked[0].cooldown_until - time.time())
+                time.sleep(min(MAX_BACKOFF, pause))
+            if len(ranked) == 1:
+                try:
+                    return self._call(ranked[0], method, args, kwargs)
+                except (SolanaRpcException, RateLimited) as e:
+                    error = e
+                    continue
+            try:
+                return self._race(ranked, method, args, kwargs)
+            except (SolanaRpcException, RateLimited) as e:
+                error = e
+        with self._lock:
+            self.stats["failed"] += 1
+        raise error
+
+    def _race(self, ranked: List[Endpoint], method: str, args, kwargs):
+        """One round over the endpoints: hedge after the percentile delay, fail over on errors"""
+        pending = {}
+        error: Optional[Exception] = None
+        launched = 0
+
+        def launch(hedge: bool):
+            nonlocal launched
+            endpoint = ranked[launched]
+            launched += 1
+            if hedge:
+                with self._lock:
+                    endpoint.stats["hedges"] += 1
+                    self.stats["hedged"] += 1
+            pending[self._pool.submit(self._call, endpoint, method, args, kwargs)] = (endpoint, hedge)
+
+        launch(False)
+        while pending:
+            timeout = self._hedge_delay(ranked[launched - 1], method) if launched < len(ranked) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch(True)
+                continue
+            for future in done:
+                endpoint, hedged = pending.pop(future)
+                try:
+                    result = future.result()
+                except (SolanaRpcException, RateLimited) as e:
+                    error = e
+                    if launched < len(ranked) and not pending:
+                        launch(False)
+                    continue
+                if hedged:
+                    with self._lock:
+                        self.stats["hedge_wins"] += 1
+                return result
+        raise error
+
+    def _write(self, method: str, args, kwargs):
+        with self._lock:
+            self.stats["writes"] += 1
+        targets = self._ranked()[:self.send_fanout]
+        if len(targets) == 1:
+            return self._call(targets[0], method, args, kwargs)
+        futures = [self._pool.submit(self._call, endpoint, method, args, kwargs) for endpoint in targets]
+        error: Optional[Exception] = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    # The node's own rejection is the more useful error to report
+                    if error is None or not isinstance(e, (SolanaRpcException, RateLimited)):
+                        error = e
+        with self._lock:
+            self.stats["failed"] += 1
+        raise error
+
+    def _call(self, endpoint: Endpoint, method: str, args, kwargs):
+        endpoint.bucket.acquire()
+        start = time.time()
+        with self._lock:
+            endpoint.stats["requests"] += 1
+            second = int(start)
+            if second != endpoint._second:
+                endpoint._second, endpoint._count = second, 0
+            endpoint._count += 1
+        try:
+            result = getattr(endpoint.client, method)(*args, **kwargs)
+        except SolanaRpcException as e:
+            cause = e.__cause__
+            if isinstance(cause, httpx.HTTPStatusError) and cause.response.status_code == 429:
+                self._rate_limited(endpoint, cause.response.headers.get("Retry-After"))
+                raise RateLimited(f"{endpoint.url} rate limited") from e
+            self._failed(endpoint, e)
+            raise
+        except Exception:
+            # The node answered, just not with a result; that says nothing about its health
+            self._succeeded(endpoint, method, time.time() - start)
+            raise
+        self._succeeded(endpoint, method, time.time() - start)
+        return result
+
+    def _succeeded(self, endpoint: Endpoint, method: str, seconds: float):
+        with self._lock:
+            s = endpoint.stats
+            s["wins"] += 1
+            avg = s["latency_ms_avg"]
+            s["latency_ms_avg"] = round(seconds * 1000 if not avg else avg * 0.8 + seconds * 200, 1)
+            s["error_rate"] = round(s["error_rate"] * 0.9, 4)
+            endpoint.latencies.setdefault(method, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+            endpoint.backoff = 0.0
+        endpoint.bucket.recover()
+
+    def _failed(self, endpoint: Endpoint, error: Exception):
+        with self._lock:
+            s = endpoint.stats
+            s["errors"] += 1
+            s["error_rate"] = round(s["error_rate"] * 0.9 + 0.1, 4)
+        log.debug("✗ RPC endpoint error", endpoint=endpoint.url, error=str(error.__cause__ or error))
+
+    def _rate_limited(self, endpoint: Endpoint, retry_after: Optional[str]):
+        with self._lock:
+            endpoint.stats["rate_limited"] += 1
+            endpoint.backoff = min(MAX_BACKOFF, endpoint.backoff * 2 or 0.5)
+            try:
+                pause = float(retry_after) if retry_after else endpoint.backoff
+            except ValueError:
+                pause = endpoint.backoff
+            endpoint.cooldown_until = time.time() + pause
+            observed = endpoint._count
+        endpoint.bucket.throttle(observed)
+        log.info("⚠ RPC endpoint rate limited", endpoint=endpoint.url, pause_s=round(pause, 2),
+                 rate_limit=round(endpoint.bucket.rate, 2))
+
+    def _hedge_delay(self, endpoint: Endpoint, method: str) -> float:
+        with self._lock:
+            window = endpoint.latencies.get(method)
+            if not window or len(window) < 8:
+                return self.hedge_max
+            ordered = sorted(window)
+        delay = ordered[min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))]
+        return min(self.hedge_max, max(self.hedge_min, delay))
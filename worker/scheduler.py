@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log import get_logger
+
+log = get_logger("scheduler")
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """"API=8,MANUAL=2,CRON=1" -> {"API": 8.0, "MANUAL": 2.0, "CRON": 1.0}"""
+    weights = {}
+    for part in text.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            weights[name.strip().upper()] = max(0.001, float(value))
+    return weights
+
+
+class _Class:
+    __slots__ = ("name", "weight", "finish", "owners", "queued", "stats")
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.finish = 0.0  # virtual finish tag of the last job dispatched
+        self.owners: "OrderedDict[str, List]" = OrderedDict()  # owner -> heap of entries, round-robin order
+        self.queued = 0
+        self.stats = {"offered": 0, "dispatched": 0, "rejected": 0}
+
+
+class JobScheduler:
+    """Orders pending jobs between discovery and the pipeline.
+
+    Jobs are queued per class (job type) and, inside a class, per owner.
+    Classes share dispatches by weighted fair queuing: each dispatch advances
+    the class's virtual finish tag by 1/weight and the class with the smallest
+    next tag goes first, so with API=8, CRON=1 a backlogged API class gets
+    eight dispatches for each CRON one while no class is ever starved. Owners
+    of a class take turns, and inside an owner the oldest `start_time` runs
+    first. An owner with `owner_cap` jobs in flight is skipped until one of
+    them is done().
+
+    A background thread hands the next job to `submit(key, item)` only while
+    `has_capacity()` says the downstream stages can take more (admission
+    control); otherwise jobs wait here, where they can still be reordered.
+    The thread sleeps until offer(), done() or wake() signals it, so the
+    caller must call wake() whenever has_capacity() may have turned true.
+    offer() refuses jobs beyond `max_queued` per class; the caller retries
+    them on a later sweep. `on_dispatch(class, wait)` receives each job's
+    time in the queue.
+    """
+
+    def __init__(self, submit: Callable[[str, Any], bool], has_capacity: Callable[[], bool],
+                 weights: Dict[str, float], owner_cap: int = 0, max_queued: int = 10_000,
+                 default_weight: float = 1.0,
+                 on_dispatch: Optional[Callable[[str, float], None]] = None):
+        self.submit = submit
+        self.has_capacity = has_capacity
+        self.owner_cap = owner_cap
+        self.max_queued = max_queued
+        self.default_weight = default_weight
+        self.on_dispatch = on_dispatch
+        self._classes: Dict[str, _Class] = {name: _Class(name, w) for name, w in weights.items()}
+        self._in_flight: Dict[str, int] = {}  # owner -> jobs dispatched and not done
+        self._virtual = 0.0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> List[Tuple[str, Any]]:
+        """Stop dispatching; returns the (key, item) pairs still queued"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._cond:
+            left = [(entry[2], entry[3]) for cls in self._classes.values()
+                    for heap in cls.owners.values() for entry in heap]
+            for cls in self._classes.values():
+                cls.owners.clear()
+                cls.queued = 0
+        return left
+
+    def offer(self, key: str, item: Any, job_class: str, owner: str, start_time: int = 0) -> bool:
+        """Queue a job; False if its class queue is full"""
+        with self._cond:
+            cls = self._classes.get(job_class)
+            if cls is None:
+                cls = self._classes[job_class] = _Class(job_class, self.default_weight)
+            if cls.queued >= self.max_queued:
+                cls.stats["rejected"] += 1
+                return False
+            if cls.queued == 0:
+                # An idle class starts from the current virtual time instead of banking credit
+                cls.finish = max(cls.finish, self._virtual)
+            entry = (start_time, next(self._sequence), key, item, time.time(), owner)
+            heapq.heappush(cls.owners.setdefault(owner, []), entry)
+            cls.queued += 1
+            cls.stats["offered"] += 1
+            self._cond.notify()
+        return True
+
+    def done(self, owner: str):
+        """A dispatched job of `owner` left the pipeline"""
+        with self._cond:
+            count = self._in_flight.get(owner, 0) - 1
+            if count > 0:
+                self._in_flight[owner] = count
+            else:
+                self._in_flight.pop(owner, None)
+            self._cond.notify()
+
+    def wake(self):
+        """Downstream capacity may have freed up: check has_capacity() again"""
+        with self._cond:
+            self._cond.notify()
+
+    def queued(self) -> int:
+        with self._cond:
+            return sum(cls.queued for cls in self._classes.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {name: dict(cls.stats, queued=cls.queued, owners=len(cls.owners),
+                               owners_capped=sum(1 for owner in cls.owners if self._capped(owner)))
+                    for name, cls in self._classes.items()}
+
+    def _next(self) -> Optional[tuple]:
+        """Pop the next dispatchable entry (caller holds the lock)"""
+        best: Optional[Tuple[float, _Class, str]] = None
+        for cls in self._classes.values():
+            if not cls.queued:
+                continue
+            owner = self._eligible_owner(cls)
+            if owner is None:
+                continue
+            tag = cls.finish + 1.0 / cls.weight
+            if best is None or tag < best[0]:
+                best = (tag, cls, owner)
+        if best is None:
+            return None
+        tag, cls, owner = best
+        heap = cls.owners[owner]
+        entry = heapq.heappop(heap)
+        if heap:
+            cls.owners.move_to_end(owner)
+        else:
+            del cls.owners[owner]
+        cls.queued -= 1
+        cls.finish = tag
+        self._virtual = max(self._virtual, tag)
+        cls.stats["dispatched"] += 1
+        self._in_flight[owner] = self._in_flight.get(owner, 0) + 1
+        return entry + (cls.name,)
+
+    def _eligible_owner(self, cls: _Class) -> Optional[str]:
+        for owner in cls.owners:
+            if not self._capped(owner):
+                return owner
+        return None
+
+    def _capped(self, owner: str) -> bool:
+        return bool(self.owner_cap) and self._in_flight.get(owner, 0) >= self.owner_cap
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                entry = None
+                if self.has_capacity():
+                    entry = self._next()
+                if entry is None:
+                    # Nothing to do until offer(), done(), wake() or stop()
+                    self._cond.wait()
+                    continue
+            _, _, key, item, queued_at, owner, job_class = entry
+            if self.on_dispatch:
+                self.on_dispatch(job_class, time.time() - queued_at)
+            try:
+                submitted = self.submit(key, item)
+            except Exception as e:
+                log.error("✗ Scheduler submit failed", job=key, error=str(e))
+                submitted = False
+            if not submitted:
+                self.done(owner)
@@ -0,0 +1,224 @@
+import bisect
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, FrozenSet, List, Optional
+
+from log import get_logger
+
+VNODES = 64  # ring points per shard; more points give a more even split
+HANDOFF_SUFFIX = "~handoff"
+# SQLite's locks and WAL index do not hold across hosts on these, so two hosts could hold one lease
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre",
+                       "gpfs", "fuse.sshfs", "fuse.s3fs", "fuse.gcsfuse", "fuse.juicefs")
+
+log = get_logger("sharding")
+
+
+def _point(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def filesystem_type(path: str, mounts: str = "/proc/self/mounts") -> Optional[str]:
+    """Type of the filesystem `path` is on (Linux), None if unknown"""
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best):
+                    best, fstype = mount_point, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+class ShardRing:
+    """Consistent-hash ring assigning job account addresses to `shards` shards.
+
+    Every worker builds the same ring from the shard count alone, so all of
+    them agree on which shard an account belongs to without talking to each
+    other.
+    """
+
+    def __init__(self, shards: int, vnodes: int = VNODES):
+        self.shards = max(1, shards)
+        points = sorted((_point(f"shard-{shard}-{v}".encode()), shard)
+                        for shard in range(self.shards) for v in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard(self, address: str) -> int:
+        if self.shards == 1:
+            return 0
+        i = bisect.bisect(self._points, _point(address.encode())) % len(self._points)
+        return self._owners[i]
+
+
+class ShardAssignment:
+    """The shards this worker currently owns.
+
+    Static: a fixed set (SHARD_INDEX). Leased: kept current by a ShardLeases.
+    `owns(address)` is what discovery and the pipeline check.
+    """
+
+    def __init__(self, ring: ShardRing, shards: FrozenSet[int] = frozenset()):
+        self.ring = ring
+        self._owned = frozenset(shards)
+
+    @property
+    def owned(self) -> FrozenSet[int]:
+        return self._owned
+
+    def set(self, shards: FrozenSet[int]):
+        self._owned = frozenset(shards)
+
+    def owns(self, address: str) -> bool:
+        return self.ring.shard(address) in self._owned
+
+
+class ShardLeases:
+    """Shard leases in a SQLite file shared by the worker processes of one host.
+
+    Each worker heartbeats itself as a member and holds leases that expire
+    `ttl` seconds after their last renewal. Every `ttl / 3` seconds, in one
+    write transaction, a worker renews its leases, hands back any above its
+    fair share (shards / live members, rounded by member order) so new members
+    get some, and takes free or expired shards up to that share, its
+    `preferred` shard first. A handed-back shard leaves the owned set at once
+    but only becomes free when its lease runs out, so jobs already in flight
+    finish before another worker can pick the shard up. A worker that stops
+    renewing loses its shards to the others after `ttl`.
+    `on_change(owned)` is called whenever the owned set changes.
+
+    The file must be on a local disk. SQLite's locking and WAL index do not
+    work across hosts on NFS, EFS or SMB, where two workers could both win a
+    lease, so a path on a network filesystem is refused with ValueError.
+    Workers on several hosts use static SHARD_INDEX assignments instead.
+    """
+
+    def __init__(self, path: str, owner: str, assignment: ShardAssignment, ttl: float = 30.0,
+                 preferred: Optional[int] = None,
+                 on_change: Optional[Callable[[FrozenSet[int]], None]] = None):
+        self.path = path
+        self.owner = owner
+        self.assignment = assignment
+        self.ttl = ttl
+        self.preferred = preferred
+        self.on_change = on_change
+        self.stats = {"renewals": 0, "acquired": 0, "released": 0, "lost": 0, "errors": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fstype = filesystem_type(directory or ".")
+        if fstype in NETWORK_FILESYSTEMS:
+            raise ValueError(f"{path} is on a {fstype} filesystem; shard leases need a local disk")
+        self._db = sqlite3.connect(path, timeout=ttl / 3, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS members (owner TEXT PRIMARY KEY, seen_at REAL NOT NULL);
+        """)
+        self._renewed_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self.renew()
+        self._thread = threading.Thread(target=self._run, name="shard-leases", daemon=True)
+        self._thread.start()
+
+    def stop(self, release: bool = True):
+        """Stop renewing; with `release`, hand the shards back right away"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.ttl)
+            self._thread = None
+        if release:
+            try:
+                self._db.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+                self._db.execute("DELETE FROM members WHERE owner = ?", (self.owner,))
+            except sqlite3.Error as e:
+                log.warning("✗ Shard lease release failed", error=str(e))
+        self._db.close()
+        self._set(frozenset())
+
+    def renew(self):
+        now = time.time()
+        shards = self.assignment.ring.shards
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                owned = self._renew(now, shards)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            log.warning("✗ Shard lease renewal failed", error=str(e))
+            # Keep working on what we hold only while those leases are surely still ours
+            if now - self._renewed_at > self.ttl * 2 / 3:
+                self._set(frozenset())
+            return
+        self._renewed_at = now
+        self.stats["renewals"] += 1
+        self._set(owned)
+
+    def _renew(self, now: float, shards: int) -> FrozenSet[int]:
+        db = self._db
+        expires = now + self.ttl
+        db.execute("INSERT OR REPLACE INTO members (owner, seen_at) VALUES (?, ?)", (self.owner, now))
+        db.execute("DELETE FROM members WHERE seen_at < ?", (now - self.ttl,))
+        members = [row[0] for row in db.execute("SELECT owner FROM members ORDER BY owner")]
+        # Shares differ by at most one; which members get the extra shard is fixed by ordering
+        rank = members.index(self.owner)
+        fair = shards // len(members) + (1 if rank < shards % len(members) else 0)
+
+        db.execute("UPDATE leases SET expires_at = ? WHERE owner = ?", (expires, self.owner))
+        mine: List[int] = [row[0] for row in db.execute("SELECT shard FROM leases WHERE owner = ?", (self.owner,))]
+        lost = self.assignment.owned - set(mine)
+        if lost:
+            self.stats["lost"] += len(lost)
+
+        if len(mine) > fair:
+            surplus = sorted(mine, key=lambda shard: (shard == self.preferred, shard), reverse=True)[fair:]
+            # Handed-back shards stay blocked for one more TTL so jobs already in flight can finish
+            db.executemany("UPDATE leases SET owner = ? WHERE shard = ? AND owner = ?",
+                           [(self.owner + HANDOFF_SUFFIX, s, self.owner) for s in surplus])
+            self.stats["released"] += len(surplus)
+            mine = [shard for shard in mine if shard not in surplus]
+
+        if len(mine) < fair:
+            taken = {row[0] for row in db.execute("SELECT shard FROM leases WHERE expires_at >= ?", (now,))}
+            free = [shard for shard in range(shards) if shard not in taken]
+            if self.preferred in free:
+                free.remove(self.preferred)
+                free.insert(0, self.preferred)
+            for shard in free[:fair - len(mine)]:
+                db.execute("INSERT OR REPLACE INTO leases (shard, owner, expires_at) VALUES (?, ?, ?)",
+                           (shard, self.owner, expires))
+                mine.append(shard)
+                self.stats["acquired"] += 1
+        return frozenset(mine)
+
+    def _set(self, owned: FrozenSet[int]):
+        if owned == self.assignment.owned:
+            return
+        self.assignment.set(owned)
+        log.info("Shard ownership changed", shards=sorted(owned))
+        if self.on_change:
+            self.on_change(owned)
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            self.renew()
@@ -0,0 +1,201 @@
+import asyncio
+import base64
+import json
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+from log import get_logger
+
+PROGRAM_DATA_PREFIX = "Program data: "
+
+log = get_logger("subscriptions")
+
+
+def ws_url_from_http(url: Optional[str]) -> str:
+    """Derive the RPC websocket URL from its HTTP URL (local validator uses port + 1)"""
+    url = url or "http://localhost:8899"
+    if url.startswith("https://"):
+        return "wss://" + url[len("https://"):]
+    if url.startswith("http://"):
+        url = "ws://" + url[len("http://"):]
+        if url.rstrip("/").endswith(":8899"):
+            url = url.rstrip("/")[:-len("8899")] + "8900"
+        return url
+    return url
+
+
+class JobSubscriber:
+    """Pushes Job account changes and program events from the RPC websocket.
+
+    Subscribes with programSubscribe (account writes) and logsSubscribe (events
+    emitted by the program), and calls:
+      on_account(pubkey, data, slot) for every account notification
+      on_event(data, slot) for every "Program data:" log of a successful transaction
+    Runs its own event loop in a daemon thread and reconnects with backoff.
+    `connected` is set only while both subscriptions are live, so callers can
+    fall back to polling whenever it is clear.
+
+    The callbacks may block (an RPC call, a full queue downstream), so they
+    never run on the socket's thread: notifications are handed to a delivery
+    thread through a queue of at most `max_pending`, and the receive loop
+    keeps reading and answering pings meanwhile. Notifications arriving while
+    that queue is full are dropped (counted in `dropped`); the polling sweep
+    picks those jobs up.
+    """
+
+    def __init__(self, ws_url: str, program_id: str,
+                 on_account: Callable[[str, bytes, int], None],
+                 on_event: Optional[Callable[[bytes, int], None]] = None,
+                 account_filters: Optional[List[Dict]] = None,
+                 commitment: str = "confirmed",
+                 max_backoff: float = 30.0,
+                 max_pending: int = 10_000):
+        self.ws_url = ws_url
+        self.program_id = program_id
+        self.on_account = on_account
+        self.on_event = on_event
+        self.account_filters = account_filters or []
+        self.commitment = commitment
+        self.max_backoff = max_backoff
+        self.connected = threading.Event()
+        self.notifications = 0
+        self.reconnects = 0
+        self.dropped = 0
+        self._pending: "queue.Queue" = queue.Queue(max(1, max_pending))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._delivery: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._delivery = threading.Thread(target=self._deliver_forever, name="job-subscriber-delivery", daemon=True)
+        self._delivery.start()
+        self._thread = threading.Thread(target=self._run, name="job-subscriber", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._loop and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._delivery:
+            self._delivery.join(timeout)
+            self._delivery = None
+        self.connected.clear()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._connect_forever())
+        finally:
+            self._loop.close()
+
+    async def _connect_forever(self):
+        # Imported here so the import runs on this thread, alongside the first polling sweep
+        import websockets
+
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(self.ws_url, ping_interval=20) as ws:
+                    self._ws = ws
+                    await self._subscribe(ws)
+                    self.connected.set()
+                    backoff = 1.0
+                    log.info("✓ Subscribed", url=self.ws_url)
+                    async for message in ws:
+                        self._dispatch(json.loads(message))
+            except Exception as e:
+                if not self._stop.is_set():
+                    log.warning("✗ Subscription dropped", error=str(e))
+            finally:
+                self._ws = None
+                self.connected.clear()
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            await self._sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _sleep(self, seconds: float):
+        end = self._loop.time() + seconds
+        while not self._stop.is_set() and self._loop.time() < end:
+            await asyncio.sleep(0.1)
+
+    async def _subscribe(self, ws):
+        requests = [
+            {
+                "jsonrpc": "2.0", "id": 1, "method": "programSubscribe",
+                "params": [self.program_id, {
+                    "encoding": "base64",
+                    "commitment": self.commitment,
+                    "filters": self.account_filters,
+                }],
+            },
+            {
+                "jsonrpc": "2.0", "id": 2, "method": "logsSubscribe",
+                "params": [{"mentions": [self.program_id]}, {"commitment": self.commitment}],
+            },
+        ]
+        for req in requests:
+            await ws.send(json.dumps(req))
+        pending = {req["id"] for req in requests}
+        while pending:
+            msg = json.loads(await asyncio.wait_for(ws.recv(), timeout=10))
+            if msg.get("id") in pending:
+                if "error" in msg:
+                    raise RuntimeError(f"subscribe failed: {msg['error']}")
+                pending.discard(msg["id"])
+            else:
+                self._dispatch(msg)
+
+    def _dispatch(self, msg: Dict):
+        """Decode a notification and queue its callbacks; runs on the socket's thread, so never blocks"""
+        method = msg.get("method")
+        if method not in ("programNotification", "logsNotification"):
+            return
+        self.notifications += 1
+        result = msg["params"]["result"]
+        slot = result.get("context", {}).get("slot", 0)
+        value = result.get("value", {})
+        try:
+            if method == "programNotification":
+                data = value["account"]["data"]
+                raw = base64.b64decode(data[0] if isinstance(data, list) else data)
+                self._hand_off(self.on_account, value["pubkey"], raw, slot)
+            elif self.on_event and value.get("err") is None:
+                for line in value.get("logs", []):
+                    if line.startswith(PROGRAM_DATA_PREFIX):
+                        self._hand_off(self.on_event, base64.b64decode(line[len(PROGRAM_DATA_PREFIX):]), slot)
+        except Exception as e:
+            log.warning("✗ Notification error", error=str(e))
+
+    def _hand_off(self, callback: Callable, *args):
+        try:
+            self._pending.put_nowait((callback, args))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                log.warning("⚠ Notification queue full, dropping until it drains", dropped=self.dropped)
+
+    def _deliver(self, timeout: Optional[float]) -> bool:
+        """Run the next queued callback; False if none arrived within `timeout`"""
+        try:
+            callback, args = self._pending.get(timeout=timeout) if timeout else self._pending.get_nowait()
+        except queue.Empty:
+            return False
+        try:
+            callback(*args)
+        except Exception as e:
+            log.warning("✗ Notification error", error=str(e))
+        return True
+
+    def _deliver_forever(self):
+        while not self._stop.is_set():
+            self._deliver(0.1)
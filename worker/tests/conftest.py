@@ -0,0 +1,9 @@
+import os
+import sys
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The worker modules import each other as top-level modules (`from cid import ...`),
+# and the service fakes in benchmarks/ are shared with the tests
+sys.path.insert(0, os.path.join(WORKER_DIR, "benchmarks"))
+sys.path.insert(0, WORKER_DIR)
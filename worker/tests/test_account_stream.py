@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from account_stream import CHUNK_SIZE, RpcStreamError, iter_result_items, keyspace_slices
+from cid import b58decode
+
+ACCOUNTS = [
+    {"pubkey": "Job1", "account": {"data": ["AAEC", "base64"], "lamports": 1, "owner": "Prog"}},
+    {"pubkey": "Jöb2 ✓", "account": {"data": ["", "base64"], "lamports": 2, "owner": "Prog"}},
+    {"pubkey": "Job3", "account": {"data": ["/w==", "base64"], "lamports": 3, "owner": "Prog"}},
+]
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def response(result, pretty=False) -> bytes:
+    body = {"jsonrpc": "2.0", "result": result, "id": 1}
+    return json.dumps(body, indent=2 if pretty else None, ensure_ascii=False).encode()
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_items_survive_every_chunk_boundary(pretty):
+    data = response(ACCOUNTS, pretty)
+    for size in range(1, len(data) + 1):
+        assert list(iter_result_items(chunked(data, size))) == ACCOUNTS, size
+
+
+def test_empty_result():
+    for data in (response([]), b'{"jsonrpc":"2.0","result":[ \n ],"id":1}'):
+        for size in range(1, len(data) + 1):
+            assert list(iter_result_items(chunked(data, size))) == []
+
+
+def test_head_fields_in_any_order():
+    data = b'{"id":7, "jsonrpc":"2.0", "result":[1, 2 ,3]}'
+    assert list(iter_result_items(chunked(data, 4))) == [1, 2, 3]
+
+
+def test_element_larger_than_a_chunk():
+    items = [{"data": "x" * (3 * CHUNK_SIZE)}, {"data": "y"}]
+    data = response(items)
+    assert list(iter_result_items(chunked(data, CHUNK_SIZE))) == items
+    assert list(iter_result_items(chunked(data, 1000))) == items
+
+
+def test_items_are_yielded_before_the_response_ends():
+    data = response(ACCOUNTS * 5000)
+    consumed = []
+
+    def chunks():
+        for chunk in chunked(data, 4096):
+            consumed.append(chunk)
+            yield chunk
+
+    items = iter_result_items(chunks())
+    assert next(items) == ACCOUNTS[0]
+    # A partly received element waits for about one CHUNK_SIZE more before it is parsed again
+    assert sum(len(chunk) for chunk in consumed) <= CHUNK_SIZE + 2 * 4096 < len(data)
+    assert sum(1 for _ in items) == len(ACCOUNTS) * 5000 - 1
+
+
+def test_rpc_error_is_raised():
+    data = b'{"jsonrpc":"2.0","error":{"code":-32010,"message":"scan aborted"},"id":1}'
+    with pytest.raises(RpcStreamError) as raised:
+        list(iter_result_items(chunked(data, 5)))
+    assert raised.value.error["code"] == -32010
+
+
+@pytest.mark.parametrize("data", [
+    b'{"jsonrpc":"2.0","result":{"value":[]},"id":1}',
+    b'{"jsonrpc":"2.0","result":[1,2',
+    b'{"jsonrpc":"2.0","result":[1 2]}',
+    b'{"jsonrpc":"2.0","id":1}',
+    b'',
+])
+def test_malformed_responses_raise(data):
+    with pytest.raises(ValueError):
+        list(iter_result_items(chunked(data, 3)))
+
+
+def test_keyspace_slices():
+    assert keyspace_slices(40, 0) == [None]
+    slices = keyspace_slices(40, 1)
+    assert len(slices) == 256
+    assert all(s["memcmp"]["offset"] == 40 for s in slices)
+    assert [b58decode(s["memcmp"]["bytes"]) for s in slices] == [bytes([i]) for i in range(256)]
+    assert len(keyspace_slices(40, 2)) == 65536
@@ -0,0 +1,75 @@
+import pytest
+
+import cid
+from cid import (CHUNK_SIZE, CODEC_DAG_PB, CODEC_RAW, b58decode, b58encode, cid_v0, cid_v1,
+                 directory_cid_v0, parse_cid, verify_cid)
+from ipfs_cache import BlobCache
+
+# Reference CIDs from `ipfs add` (kubo defaults) and `ipfs add --cid-version 1`
+HELLO = b"hello world\n"
+HELLO_V0 = "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"
+HELLO_V1_RAW = "bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4"
+EMPTY_FILE_V0 = "QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH"
+EMPTY_DIR_V0 = "QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn"
+
+
+def test_file_cids_match_ipfs_add():
+    assert cid_v0(HELLO) == HELLO_V0
+    assert cid_v0(b"") == EMPTY_FILE_V0
+    assert cid_v1(HELLO) == HELLO_V1_RAW
+
+
+def test_empty_directory_cid_matches_ipfs():
+    assert directory_cid_v0([]) == EMPTY_DIR_V0
+
+
+def test_directory_cid_ignores_input_order():
+    files = [("b.json", b'{"b":1}'), ("a.json", b'{"a":1}')]
+    assert directory_cid_v0(files) == directory_cid_v0(list(reversed(files)))
+    assert directory_cid_v0(files) != directory_cid_v0([("a.json", b'{"a":1}')])
+
+
+def test_files_over_one_chunk_get_a_tree_root():
+    data = bytes(range(256)) * (CHUNK_SIZE // 256) + b"x"
+    assert cid_v0(data) != cid_v0(data[:CHUNK_SIZE])
+    assert verify_cid(cid_v0(data), data) is True
+    assert verify_cid(cid_v1(data), data) is True
+    assert verify_cid(cid_v1(data, raw_leaves=False), data) is True
+
+
+def test_base58_round_trip_keeps_leading_zeros():
+    for raw in (b"", b"\x00", b"\x00\x00\x01", bytes(range(40))):
+        assert b58decode(b58encode(raw)) == raw
+
+
+def test_parse_cid():
+    version, codec, multihash = parse_cid(HELLO_V0)
+    assert (version, codec, len(multihash)) == (0, CODEC_DAG_PB, 34)
+    version, codec, multihash = parse_cid(HELLO_V1_RAW)
+    assert (version, codec, multihash[:2]) == (1, CODEC_RAW, bytes([0x12, 32]))
+    with pytest.raises(ValueError):
+        parse_cid("zNotACid")
+
+
+def test_verify_cid():
+    assert verify_cid(HELLO_V0, HELLO) is True
+    assert verify_cid(HELLO_V1_RAW, HELLO) is True
+    assert verify_cid(HELLO_V1_RAW, b"hello world") is False
+    assert verify_cid("not-a-cid", HELLO) is None
+
+
+def test_v0_cid_with_another_layout_is_unverified_not_rejected(monkeypatch, tmp_path):
+    data = bytes(range(256)) * 20
+    # As `ipfs add --chunker=size-1024` would build it
+    monkeypatch.setattr(cid, "CHUNK_SIZE", 1024)
+    small_chunks = cid_v0(data)
+    monkeypatch.undo()
+    assert small_chunks != cid_v0(data)
+    assert verify_cid(small_chunks, data) is None
+    assert verify_cid(cid_v0(data), data) is True
+
+    cache = BlobCache(str(tmp_path))
+    assert cache.put(small_chunks, data)
+    assert cache.get(small_chunks) == data
+    assert cache.stats["unverified"] == 1 and cache.stats["rejected"] == 0
+    assert not cache.put(HELLO_V1_RAW, b"hello world")
@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("solders")
+
+from solders.instruction import AccountMeta, Instruction
+from solders.pubkey import Pubkey
+
+from completion import PACKET_DATA_SIZE, CompletionBatcher, transaction_size
+
+PROGRAM = Pubkey.new_unique()
+PAYER = Pubkey.new_unique()
+
+
+def instruction(n: int, data_size: int = 80) -> Instruction:
+    accounts = [AccountMeta(Pubkey.new_unique(), is_signer=False, is_writable=True),
+                AccountMeta(PAYER, is_signer=True, is_writable=True)]
+    return Instruction(PROGRAM, n.to_bytes(2, "little") + bytes(data_size - 2), accounts)
+
+
+class Sender:
+    """Records every transaction sent; `fail(ixs)` decides which ones raise"""
+
+    def __init__(self, fail=lambda ixs: None):
+        self.fail = fail
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, ixs):
+        with self._lock:
+            self.sent.append(list(ixs))
+        error = self.fail(ixs)
+        if error is not None:
+            raise error
+        return f"sig-{len(ixs)}-{ixs[0].data[:2].hex()}"
+
+
+def batcher(send, **options) -> CompletionBatcher:
+    options.setdefault("window", 0.05)
+    batcher = CompletionBatcher(send, PAYER, **options)
+    batcher.start()
+    return batcher
+
+
+def test_pack_stays_under_the_packet_limit():
+    b = CompletionBatcher(lambda ixs: None, PAYER)
+    ixs = [instruction(i) for i in range(20)]
+    batches = b.pack(ixs)
+    assert len(batches) > 1
+    assert [ix for batch in batches for ix in batch] == ixs
+    for batch in batches:
+        assert transaction_size(batch, PAYER) <= PACKET_DATA_SIZE
+    # Greedy: each batch is full, adding the next instruction would go over
+    for batch, following in zip(batches, batches[1:]):
+        assert transaction_size(batch + following[:1], PAYER) > PACKET_DATA_SIZE
+    b.stop()
+
+
+def test_oversized_instruction_gets_a_transaction_of_its_own():
+    b = CompletionBatcher(lambda ixs: None, PAYER)
+    big = instruction(99, data_size=PACKET_DATA_SIZE)
+    small = [instruction(0), instruction(1)]
+    assert b.pack([small[0], big, small[1]]) == [[small[0]], [big], [small[1]]]
+    b.stop()
+
+
+def test_instructions_are_batched_into_few_transactions():
+    send = Sender()
+    b = batcher(send, max_batch=4)
+    futures = [b.submit(instruction(i, data_size=8)) for i in range(4)]
+    results = [f.result(timeout=5) for f in futures]
+    b.stop()
+    assert len(send.sent) == 1 and len(send.sent[0]) == 4
+    assert len(set(results)) == 1
+    assert b.stats == {"instructions": 4, "transactions": 1, "splits": 0, "failed": 0}
+
+
+def test_failed_transaction_is_split_until_the_bad_instruction_is_alone():
+    bad = instruction(3, data_size=8)
+    send = Sender(fail=lambda ixs: RuntimeError("custom program error") if bad in ixs else None)
+    b = batcher(send, max_batch=8)
+    futures = [b.submit(instruction(i, data_size=8) if i != 3 else bad) for i in range(8)]
+    outcomes = [f.exception(timeout=5) for f in futures]
+    b.stop()
+
+    assert isinstance(outcomes[3], RuntimeError)
+    assert all(error is None for i, error in enumerate(outcomes) if i != 3)
+    assert all(futures[i].result().startswith("sig-") for i in range(8) if i != 3)
+    # 8 -> 4+4 -> 2+2 -> 1+1: three splits on the way down to the bad one
+    assert b.stats["splits"] == 3 and b.stats["failed"] == 1
+    assert [bad] in send.sent
+
+
+def test_transaction_rejected_as_too_large_is_split():
+    # The node counts bytes the estimate does not (e.g. an extra signer)
+    send = Sender(fail=lambda ixs: ValueError("transaction too large") if len(ixs) > 2 else None)
+    b = batcher(send, max_batch=6)
+    futures = [b.submit(instruction(i, data_size=8)) for i in range(6)]
+    results = [f.result(timeout=5) for f in futures]
+    b.stop()
+    # 6 -> 3+3 -> 1+2 and 1+2
+    assert sorted(len(ixs) for ixs in send.sent) == [1, 1, 2, 2, 3, 3, 6]
+    assert all(result.startswith(("sig-1-", "sig-2-")) for result in results)
+    assert b.stats["failed"] == 0 and b.stats["splits"] == 3
+
+
+def test_failed_confirmation_future_splits_the_batch():
+    bad = instruction(1, data_size=8)
+
+    def send(ixs):
+        confirmation = Future()
+        if bad in ixs:
+            confirmation.set_exception(TimeoutError("blockhash expired"))
+        else:
+            confirmation.set_result("confirmed")
+        return confirmation
+
+    b = batcher(send, max_batch=4)
+    futures = [b.submit(instruction(i, data_size=8) if i != 1 else bad) for i in range(4)]
+    outcomes = [f.exception(timeout=5) for f in futures]
+    b.stop()
+    assert isinstance(outcomes[1], TimeoutError)
+    assert [futures[i].result() for i in (0, 2, 3)] == ["confirmed"] * 3
+    assert b.stats["failed"] == 1
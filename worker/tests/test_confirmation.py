@@ -0,0 +1,176 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("solders")
+
+from solders.signature import Signature
+from solders.transaction_status import (TransactionConfirmationStatus, TransactionErrorFieldless,
+                                        TransactionStatus)
+
+from confirmation import STATUS_BATCH_SIZE, ConfirmationTracker, TransactionExpired, TransactionFailed
+
+
+def status(level=TransactionConfirmationStatus.Confirmed, err=None) -> TransactionStatus:
+    return TransactionStatus(1, None, None, err, level)
+
+
+class FakeClient:
+    """Node stand-in: statuses by signature and a block height the test moves"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.block_height = 100
+        self.status_batches = []
+        self._lock = threading.Lock()
+
+    def get_signature_statuses(self, signatures):
+        with self._lock:
+            self.status_batches.append(len(signatures))
+            return SimpleNamespace(value=[self.statuses.get(sig) for sig in signatures])
+
+    def get_block_height(self):
+        return SimpleNamespace(value=self.block_height)
+
+
+class Resender:
+    def __init__(self, client, last_valid=200, error=None):
+        self.client = client
+        self.last_valid = last_valid
+        self.error = error
+        self.sent = []
+
+    def __call__(self):
+        if self.error is not None:
+            raise self.error
+        signature = Signature.new_unique()
+        self.sent.append(signature)
+        return signature, self.last_valid
+
+
+def poll(tracker):
+    with tracker._lock:
+        pending = list(tracker._pending.values())
+    return tracker._poll(pending)
+
+
+def test_statuses_are_fetched_in_batches():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client)
+    signatures = [Signature.new_unique() for _ in range(STATUS_BATCH_SIZE + 44)]
+    futures = [tracker.track(sig, 150) for sig in signatures]
+    client.statuses[signatures[0]] = status()
+    client.statuses[signatures[1]] = status(TransactionConfirmationStatus.Processed)
+    client.statuses[signatures[2]] = status(err=TransactionErrorFieldless.AccountInUse)
+    client.statuses[signatures[-1]] = status(TransactionConfirmationStatus.Finalized)
+
+    assert poll(tracker) == 3
+    assert client.status_batches == [STATUS_BATCH_SIZE, 44]
+    assert futures[0].result(0) == signatures[0] and futures[-1].result(0) == signatures[-1]
+    assert not futures[1].done()  # below the commitment
+    assert isinstance(futures[2].exception(0), TransactionFailed)
+    assert tracker.outstanding() == len(signatures) - 3
+    assert tracker.stats["confirmed"] == 2 and tracker.stats["failed"] == 1 and tracker.stats["polls"] == 2
+
+
+def test_check_reports_without_tracking():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client, commitment="finalized")
+    sigs = [Signature.new_unique() for _ in range(4)]
+    client.statuses[sigs[0]] = status(TransactionConfirmationStatus.Finalized)
+    client.statuses[sigs[1]] = status(TransactionConfirmationStatus.Confirmed)
+    client.statuses[sigs[2]] = status(err=TransactionErrorFieldless.AccountInUse)
+    assert tracker.check(sigs) == ["confirmed", "pending", "failed", None]
+    assert tracker.outstanding() == 0
+
+
+def test_expired_blockhash_is_resent_and_the_new_signature_confirmed():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client)
+    resend = Resender(client)
+    old = Signature.new_unique()
+    future = tracker.track(old, 150, resend=resend)
+
+    assert poll(tracker) == 0 and resend.sent == []  # unknown but still valid
+    client.block_height = 151
+    assert poll(tracker) == 0
+    assert len(resend.sent) == 1 and tracker.stats["resent"] == 1
+    assert not future.done() and tracker.outstanding() == 1
+
+    client.statuses[resend.sent[0]] = status()
+    assert poll(tracker) == 1
+    assert future.result(0) == resend.sent[0]
+
+
+def test_expiry_without_resends_left_fails_the_future():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client, max_resends=1)
+    resend = Resender(client, last_valid=160)
+    future = tracker.track(Signature.new_unique(), 150, resend=resend)
+    no_resend = tracker.track(Signature.new_unique(), 150)
+
+    client.block_height = 151
+    poll(tracker)
+    assert isinstance(no_resend.exception(0), TransactionExpired)
+    assert len(resend.sent) == 1 and not future.done()
+    client.block_height = 161
+    poll(tracker)
+    assert isinstance(future.exception(0), TransactionExpired)
+    assert len(resend.sent) == 1
+    assert tracker.stats["expired"] == 2 and tracker.outstanding() == 0
+
+
+def test_failing_resend_fails_the_future():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client)
+    future = tracker.track(Signature.new_unique(), 150, resend=Resender(client, error=RuntimeError("rpc down")))
+    client.block_height = 151
+    assert poll(tracker) == 1
+    assert str(future.exception(0)) == "rpc down"
+    assert tracker.stats["failed"] == 1
+
+
+def test_tracking_a_replaced_signature_follows_the_resend():
+    client = FakeClient()
+    tracker = ConfirmationTracker(client, keep_replaced=60)
+    first, second = Resender(client), Resender(client)
+    old = Signature.new_unique()
+    future = tracker.track(old, 150, resend=first)
+    client.block_height = 151
+    poll(tracker)
+    assert len(first.sent) == 1
+
+    # Another job resumed with the same (now replaced) transaction
+    assert tracker.track(old, 150, resend=second) is future
+    assert tracker.track(first.sent[0], 200) is future
+    poll(tracker)
+    assert second.sent == [] and len(first.sent) == 1 and tracker.outstanding() == 1
+
+    client.statuses[first.sent[0]] = status()
+    poll(tracker)
+    assert future.result(0) == first.sent[0]
+    # Still answered from the resolved transaction for a while
+    assert tracker.track(old, 150, resend=second) is future
+    assert tracker.outstanding() == 0
+
+    tracker._replaced[old].resolved_at -= 61
+    tracker._forget_replaced()
+    assert tracker._replaced == {}
+    assert tracker.track(old, 150, resend=second) is not future
+
+
+def test_background_thread_resolves_futures():
+    client = FakeClient()
+    outcomes = []
+    tracker = ConfirmationTracker(client, min_interval=0.01, max_interval=0.05,
+                                  on_resolved=lambda outcome, seconds: outcomes.append(outcome))
+    tracker.start()
+    try:
+        sig = Signature.new_unique()
+        future = tracker.track(sig, 150)
+        client.statuses[sig] = status()
+        assert future.result(timeout=5) == sig
+    finally:
+        tracker.stop()
+    assert outcomes == ["confirmed"]
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+
+import pytest
+
+from executors import ExecutorRouter, LocalPoolExecutor, SANDBOX_ENV
+
+
+def job(job_type="API", title="job"):
+    return {"title": title, "job_type_name": job_type, "owner": "Owner"}
+
+
+class Recording:
+    def __init__(self, name):
+        self.name = name
+        self.jobs = []
+        self.closed = False
+
+    def execute(self, code, job):
+        self.jobs.append(job["title"])
+        return {"status": "success", "backend": self.name}
+
+    def close(self):
+        self.closed = True
+
+
+def test_router_sends_small_jobs_of_local_types_to_the_pool():
+    local, remote = Recording("local"), Recording("remote")
+    router = ExecutorRouter(local, remote, local_max_code_bytes=100, local_job_types=("API",))
+    assert router.execute("x = 1", job("API", "small"))["backend"] == "local"
+    assert router.execute("x" * 101, job("API", "large"))["backend"] == "remote"
+    # The limit counts UTF-8 bytes, not characters
+    assert router.execute("é" * 51, job("API", "wide"))["backend"] == "remote"
+    assert router.execute("x = 1", job("CRON", "cron"))["backend"] == "remote"
+    assert local.jobs == ["small"] and remote.jobs == ["large", "wide", "cron"]
+    assert router.stats == {"local": 1, "remote": 3}
+    router.close()
+    assert local.closed and remote.closed
+
+
+def test_router_falls_back_to_the_only_backend():
+    local = Recording("local")
+    router = ExecutorRouter(local, None, local_max_code_bytes=1, local_job_types=())
+    assert router.execute("x" * 1000, job("CRON"))["backend"] == "local"
+    assert router.stats == {"local": 1, "remote": 0}
+
+    remote = Recording("remote")
+    router = ExecutorRouter(None, remote)
+    assert router.execute("x = 1", job("API"))["backend"] == "remote"
+    router.close()
+
+    with pytest.raises(ValueError):
+        ExecutorRouter(None, None)
+
+
+# The local pool runs the real handler in sandboxed processes
+
+@pytest.fixture(scope="module")
+def handler_source():
+    pytest.importorskip("solders")
+    return pytest.importorskip("main").LAMBDA_CODE
+
+
+def pool(handler_source, **options):
+    return LocalPoolExecutor(handler_source, **dict({"workers": 1, "timeout": 5.0}, **options))
+
+
+def test_job_sees_only_the_sandbox_environment(handler_source, monkeypatch):
+    monkeypatch.setenv("PINATA_JWT", "secret-jwt")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret-key")
+    executor = pool(handler_source)
+    try:
+        result = executor.execute(
+            "import os, json\nprint(json.dumps({'env': dict(os.environ), 'cwd': os.getcwd()}))", job())
+    finally:
+        executor.close()
+    assert result["status"] == "success", result
+    seen = json.loads(result["stdout"])
+    home = seen["env"].pop("HOME")
+    assert seen["env"] == dict(SANDBOX_ENV, TMPDIR=home)
+    assert seen["cwd"] == home and os.path.basename(home).startswith("cloudmesh-job-")
+    # The throwaway home goes with the process
+    assert not os.path.exists(home)
+
+
+def test_job_runs_under_resource_limits(handler_source):
+    executor = pool(handler_source, memory_mb=256, max_file_mb=1)
+    code = ("import resource\n"
+            "print('RLIMIT_AS', resource.getrlimit(resource.RLIMIT_AS)[0])\n"
+            "print('RLIMIT_FSIZE', resource.getrlimit(resource.RLIMIT_FSIZE)[0])\n"
+            "print('RLIMIT_CORE', resource.getrlimit(resource.RLIMIT_CORE)[0])\n")
+    try:
+        limits = dict(line.split() for line in executor.execute(code, job())["stdout"].splitlines())
+        assert limits == {"RLIMIT_AS": str(256 * 1024 * 1024), "RLIMIT_FSIZE": str(1024 * 1024),
+                          "RLIMIT_CORE": "0"}
+
+        # Going past them fails the job, not the process
+        result = executor.execute("data = b'x' * (512 * 1024 * 1024)", job())
+        assert result["status"] == "error" and result["error_type"] == "MemoryError"
+        result = executor.execute("import io\nio.open('big', 'wb').write(b'x' * (2 * 1024 * 1024))", job())
+        assert result["status"] == "error" and result["error_type"] == "OSError"
+        assert executor.stats["crashes"] == 0 and executor.stats["timeouts"] == 0
+        assert executor.execute("print('still here')", job())["stdout"] == "still here\n"
+    finally:
+        executor.close()
+
+
+def test_runaway_job_is_killed_and_the_pool_keeps_serving(handler_source):
+    executor = pool(handler_source, timeout=0.5)
+    try:
+        first = executor._idle.queue[0].proc
+        # The pool does not hand the handler a timeout: only killing the process stops this
+        result = executor.execute("while True:\n    pass", job())
+        assert result["status"] == "error" and result["error_type"] == "Timeout"
+        assert result["error"] == "Task timed out after 0.50 seconds"
+        assert first.poll() is not None
+        assert executor.stats["timeouts"] == 1
+
+        # A fresh process takes its place, and this process is unaffected
+        assert executor.execute("print('next')", job())["stdout"] == "next\n"
+        assert executor._idle.queue[0].proc is not first
+        assert threading.main_thread().is_alive()
+    finally:
+        executor.close()
+
+
+def test_crashed_process_is_replaced(handler_source):
+    executor = pool(handler_source)
+    try:
+        result = executor.execute("import os\nos._exit(3)", job())
+        assert result["status"] == "error" and result["error_type"] == "ProcessExit"
+        assert executor.stats["crashes"] == 1
+        assert executor.execute("print('next')", job())["stdout"] == "next\n"
+    finally:
+        executor.close()
+
+
+def test_processes_are_recycled_after_max_jobs(handler_source):
+    executor = pool(handler_source, max_jobs_per_worker=2)
+    try:
+        pids = []
+        for _ in range(4):
+            pids.append(int(executor.execute("import os\nprint(os.getpid())", job())["stdout"]))
+        assert pids[0] == pids[1] != pids[2] == pids[3]
+        assert executor.stats["recycled"] == 2
+    finally:
+        executor.close()
+
+
+@pytest.mark.skipif(os.name != "posix" or os.geteuid() != 0, reason="switching users needs root")
+def test_job_runs_as_the_sandbox_user(handler_source, tmp_path):
+    import pwd
+
+    nobody = pwd.getpwnam("nobody")
+    secret = tmp_path / "keypair.json"
+    secret.write_text("[1, 2, 3]")
+    secret.chmod(0o600)
+    # The worker's interpreter may sit under a directory the sandbox user cannot enter
+    python = "/usr/bin/python3" if os.path.exists("/usr/bin/python3") else None
+    executor = pool(handler_source, user="nobody", python=python)
+    try:
+        result = executor.execute(f"import os\nprint(os.getuid())\nimport io\nio.open({str(secret)!r}).read()", job())
+    finally:
+        executor.close()
+    assert result["stdout"] == f"{nobody.pw_uid}\n"
+    assert result["status"] == "error" and result["error_type"] == "PermissionError"
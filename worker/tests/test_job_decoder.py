@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("solders")
+main = pytest.importorskip("main")
+
+from fixtures import make_accounts, make_job_account
+from job_decoder import JOB_ACCOUNT_SIZE, JobStatus, JobType, decode_job, iter_jobs, pending_jobs
+
+# Strings as the program stores them: multi-byte UTF-8, CIDv0/v1, empty and a max-length (100) title
+ACCOUNTS = [
+    make_job_account(title="résumé ✓ 数据", code_cid="QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o",
+                     start_time=1_700_000_000, job_type=JobType.API),
+    make_job_account(title="t" * 100, code_cid="bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4",
+                     result_cid="QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH",
+                     status=JobStatus.COMPLETED, job_type=JobType.CRON, start_time=-1, end_time=2**63 - 1, cost=2**64 - 1, cost_paid=True, bump=0),
+    make_job_account(title="", code_cid="", status=JobStatus.CANCELLED, job_type=JobType.MANUAL),
+    make_job_account(status=3, job_type=9),  # enum tags from a newer program version
+] + [data for _, data in make_accounts(50, pending_ratio=0.5)]
+
+
+def lazy(data):
+    job = decode_job(data)
+    return None if job is None else job.to_dict()
+
+
+def test_lazy_decoder_matches_deserialize_job():
+    for data in ACCOUNTS:
+        expected = main.deserialize_job(data)
+        assert expected is not None
+        assert lazy(data) == expected
+        job = decode_job(data)
+        assert {key: job[key] for key in expected} == expected
+
+
+def test_status_enum_names_match():
+    names = {(job["status"], job["status_name"], job["job_type"], job["job_type_name"])
+             for job in map(lazy, ACCOUNTS[:4])}
+    assert names == {(0, "PENDING", 1, "API"), (1, "COMPLETED", 0, "CRON"),
+                     (2, "CANCELLED", 2, "MANUAL"), (3, "UNKNOWN(3)", 9, "UNKNOWN(9)")}
+
+
+def test_truncated_accounts_decode_the_same():
+    for data in ACCOUNTS[:3]:
+        for size in range(len(data) + 1):
+            assert lazy(data[:size]) == main.deserialize_job(data[:size]), size
+
+
+def test_invalid_utf8_is_rejected_by_both():
+    data = bytearray(ACCOUNTS[0])
+    # First byte of the title, then the middle of a multi-byte character in the code CID
+    for offset in (44, 44 + len("résumé ✓ 数据".encode()) + 4 + 3):
+        corrupt = bytearray(data)
+        corrupt[offset] = 0xff
+        assert main.deserialize_job(bytes(corrupt)) is None
+        assert decode_job(bytes(corrupt)) is None
+    # A string length past the account ends up the same way
+    corrupt = bytearray(data)
+    corrupt[40:44] = (500).to_bytes(4, "little")
+    assert main.deserialize_job(bytes(corrupt)) is None and decode_job(bytes(corrupt)) is None
+
+
+def test_batch_buffer_matches_per_account_decoding():
+    assert all(len(data) == JOB_ACCOUNT_SIZE for data in ACCOUNTS)
+    buffer = b"".join(ACCOUNTS)
+    expected = [main.deserialize_job(data) for data in ACCOUNTS]
+    assert [job.to_dict() for job in iter_jobs(buffer)] == expected
+    assert [job.to_dict() for job in pending_jobs(buffer)] == [
+        job for job in expected if job["status"] == JobStatus.PENDING]
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+import job_index
+from job_index import IndexDiff, JobIndex, RunState
+
+PENDING, COMPLETED, CANCELLED = 0, 1, 2
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_index, "time", clock)
+    return clock
+
+
+def account(title, status=PENDING) -> bytes:
+    return json.dumps({"title": title, "status": status}).encode()
+
+
+def decode(data: bytes):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def index(**options) -> JobIndex:
+    return JobIndex(decode, pending=PENDING, retry_delay=10.0, submitted_timeout=60.0, **options)
+
+
+def test_diff_reports_new_changed_settled_and_removed():
+    idx = index()
+    diff = IndexDiff()
+    assert idx.observe("A", account("a"), 5, diff) == "new"
+    assert idx.observe("B", account("b"), 5, diff) == "new"
+    assert [job["account_address"] for job in diff.new] == ["A", "B"] and not diff.changed
+
+    diff = IndexDiff()
+    assert idx.observe("A", account("a"), 6, diff) is None  # same data at a later slot
+    assert idx.observe("A", account("a2"), 4, diff) is None  # older than what we have
+    assert not diff
+    assert idx.observe("A", account("a2"), 7, diff) == "changed"
+    assert idx.observe("B", account("b", COMPLETED), 7, diff) == "changed"
+    assert [job["title"] for job in diff.changed] == ["a2", "b"]
+    assert diff.settled == ["B"]
+    assert idx.decoded == 4
+
+    assert idx.observe("C", b"not json", 8) is None and idx.get("C") is None
+    assert idx.retain(["A"]) == ["B"]
+    assert len(idx) == 1 and idx.get("B") is None
+
+
+def test_probe_skips_unchanged_and_settled_accounts():
+    idx = index()
+    diff = IndexDiff()
+    assert idx.probe_changed("A", b"probe1", PENDING, diff)
+    assert idx.observe("A", account("a"), 5) == "new"
+    assert not idx.probe_changed("A", b"probe1", PENDING, diff)
+    assert idx.probe_changed("A", b"probe2", PENDING, diff)
+    assert not idx.probe_changed("A", b"probe3", CANCELLED, diff)
+    assert diff.settled == ["A"] and idx.runnable() == []
+    # Not seen before and already settled: never fetched
+    assert not idx.probe_changed("B", b"probe1", COMPLETED, diff)
+    assert diff.settled == ["A"]
+
+
+def test_claim_release_and_submitted_timeout(clock):
+    idx = index()
+    idx.observe("A", account("a"), 5)
+    assert [job["title"] for job in idx.runnable()] == ["a"]
+    assert idx.claim("A") and not idx.claim("A")
+    assert idx.get("A").state == RunState.IN_FLIGHT and idx.runnable() == []
+    assert idx.counts() == {RunState.IDLE: 0, RunState.IN_FLIGHT: 1, RunState.SUBMITTED: 0,
+                            RunState.FAILED: 0, "accounts": 1}
+
+    # An in-flight job is kept through a sweep that misses it
+    assert idx.retain([]) == [] and len(idx) == 1
+
+    idx.release("A", completed=True)
+    assert idx.get("A").state == RunState.SUBMITTED
+    assert not idx.claim("A")
+    clock.now += 59
+    assert idx.runnable() == []
+    # The completion never landed: the job may run again
+    clock.now += 2
+    assert idx.claim("A") and idx.get("A").attempts == 2
+
+
+def test_completion_landing_settles_the_submitted_job(clock):
+    idx = index()
+    idx.observe("A", account("a"), 5)
+    assert idx.claim("A")
+    idx.release("A", completed=True)
+    diff = IndexDiff()
+    idx.observe("A", account("a", COMPLETED), 6, diff)
+    assert diff.settled == ["A"]
+    entry = idx.get("A")
+    assert entry.state == RunState.IDLE and entry.attempts == 0
+    clock.now += 3600
+    assert idx.runnable() == [] and not idx.claim("A")
+
+
+def test_failed_job_reenters_after_a_growing_delay(clock):
+    idx = index(max_attempts=3)
+    idx.observe("A", account("a"), 5)
+
+    assert idx.claim("A")
+    idx.release("A", completed=False)
+    assert idx.get("A").state == RunState.FAILED
+    clock.now += 9
+    assert not idx.claim("A")
+    clock.now += 1
+    assert [job["title"] for job in idx.runnable()] == ["a"]
+    assert idx.claim("A")
+
+    idx.release("A", completed=False)
+    clock.now += 19
+    assert not idx.claim("A")
+    clock.now += 1
+    assert idx.claim("A")
+
+    # Out of attempts: not retried again
+    idx.release("A", completed=False)
+    clock.now += 3600
+    assert idx.runnable() == [] and not idx.claim("A")
+    assert idx.counts()[RunState.FAILED] == 1
+
+
+def test_unclaim_and_release_of_unclaimed_jobs():
+    idx = index()
+    idx.observe("A", account("a"), 5)
+    assert idx.claim("A")
+    idx.unclaim("A")
+    entry = idx.get("A")
+    assert entry.state == RunState.IDLE and entry.attempts == 0
+    # Releasing something that is not in flight changes nothing
+    idx.release("A", completed=True)
+    idx.release("missing", completed=False)
+    assert idx.get("A").state == RunState.IDLE
+    assert idx.claim("A")
+
+
+def test_settling_while_in_flight_keeps_the_claim_until_release():
+    idx = index()
+    idx.observe("A", account("a"), 5)
+    assert idx.claim("A")
+    idx.observe("A", account("a", CANCELLED), 6)
+    assert idx.get("A").state == RunState.IN_FLIGHT
+    idx.release("A", completed=False)
+    assert idx.get("A").state == RunState.FAILED
+    assert idx.runnable() == [] and not idx.claim("A")
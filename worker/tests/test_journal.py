@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from journal import JobJournal
+
+CODE_CID = "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o"
+RESULT = b'{"output":"42","status":"success"}'
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.db")
+
+
+def run_to_upload(journal, address, result_cid="QmResult"):
+    journal.record(address, "executed", body=RESULT, code_cid=CODE_CID, code_bytes=120)
+    journal.record(address, "uploaded", result_cid=result_cid, cost=1_000_500)
+
+
+def test_events_fold_into_progress(path):
+    journal = JobJournal(path)
+    run_to_upload(journal, "A")
+    assert journal.progress("A") == {"stage": "uploaded", "at": pytest.approx(time.time(), abs=5),
+                                     "result_id": 1, "code_cid": CODE_CID, "code_bytes": 120,
+                                     "result_cid": "QmResult", "cost": 1_000_500}
+    journal.record("A", "sent", signature="sig1", last_valid_block_height=150)
+    journal.record("A", "rejected", error="expired")
+    progress = journal.progress("A")
+    assert progress["stage"] == "rejected" and "signature" not in progress
+    assert "last_valid_block_height" not in progress and progress["result_cid"] == "QmResult"
+
+    journal.record("A", "sent", signature="sig2", last_valid_block_height=300)
+    journal.record("A", "confirmed", signature="sig2")
+    progress = journal.progress("A")
+    assert progress["signature"] == "sig2" and progress["confirmed_at"] == progress["at"]
+    assert journal.result("A") == RESULT
+
+    # Executed again (e.g. the job changed): the old progress is dropped
+    journal.record("A", "executed", body=b'{"status":"error"}', code_cid="QmOther", code_bytes=9)
+    assert set(journal.progress("A")) == {"stage", "at", "result_id", "code_cid", "code_bytes"}
+    assert journal.result("A") == b'{"status":"error"}'
+    assert journal.stats["events"] == 7
+    journal.close()
+
+
+def test_progress_survives_a_restart(path):
+    journal = JobJournal(path)
+    run_to_upload(journal, "A")
+    journal.record("A", "sent", signature="sig1", last_valid_block_height=150)
+    run_to_upload(journal, "B")
+    journal.record("C", "executed", body=RESULT, code_cid=CODE_CID, code_bytes=120)
+    before = journal.open_jobs()
+    journal.forget(["C", "unknown"])
+    journal.close()
+
+    journal = JobJournal(path)
+    assert journal.open_jobs() == {address: before[address] for address in ("A", "B")}
+    assert journal.result("A") == journal.result("B") == RESULT
+    assert journal.progress("C") is None and journal.result("C") is None
+    assert len(journal) == 2
+    journal.close()
+
+
+def test_rows_from_the_text_layout_read_back_as_bytes(path):
+    journal = JobJournal(path)
+    journal._db.execute("INSERT INTO events (address, stage, at, fields, result) VALUES (?, ?, ?, ?, ?)",
+                        ("A", "executed", 1.0, json.dumps({"code_cid": CODE_CID, "code_bytes": 1}), '{"x": 1}'))
+    journal.close()
+    journal = JobJournal(path)
+    assert journal.result("A") == b'{"x": 1}'
+    journal.close()
+
+
+# Resuming inside the worker: resume_context, recheck_journal and the complete stage
+
+class FakeClient:
+    def __init__(self):
+        self.statuses = {}
+        self.block_height = 100
+
+    def get_signature_statuses(self, signatures):
+        return SimpleNamespace(value=[self.statuses.get(str(sig)) for sig in signatures])
+
+    def get_block_height(self):
+        return SimpleNamespace(value=self.block_height)
+
+
+@pytest.fixture
+def worker(monkeypatch, path):
+    pytest.importorskip("solders")
+    main = pytest.importorskip("main")
+    from solders.keypair import Keypair
+    from solders.pubkey import Pubkey
+    from solders.transaction_status import (TransactionConfirmationStatus, TransactionErrorFieldless,
+                                            TransactionStatus)
+
+    from confirmation import ConfirmationTracker
+
+    client = FakeClient()
+    tracker = ConfirmationTracker(client, min_interval=0.01, max_interval=0.05)
+    monkeypatch.setattr(main, "journal", JobJournal(path))
+    monkeypatch.setattr(main, "client", client)
+    monkeypatch.setattr(main, "confirmations", tracker)
+    monkeypatch.setattr(main, "COMPLETION_TIMEOUT", 5.0)
+    sent = []
+
+    def sign_and_send(instructions, keypair):
+        signature = Keypair().sign_message(b"resend-%d" % len(sent))
+        sent.append((signature, [str(ix.accounts[0].pubkey) for ix in instructions]))
+        return signature, client.block_height + 150
+
+    monkeypatch.setattr(main, "sign_and_send", sign_and_send)
+
+    def confirm(signature, err=None):
+        client.statuses[str(signature)] = TransactionStatus(1, None, None, err,
+                                                            TransactionConfirmationStatus.Confirmed)
+
+    def fail(signature):
+        confirm(signature, TransactionErrorFieldless.AccountInUse)
+
+    def restart():
+        main.journal.close()
+        main.journal = JobJournal(path)
+
+    def ctx(address):
+        job = {"account_address": address, "title": address[:8], "code_cid": CODE_CID}
+        return dict(main.resume_context(job), job=job, program_id=str(program_id), worker=keypair)
+
+    program_id, keypair = Pubkey.new_unique(), Keypair()
+    yield SimpleNamespace(main=main, client=client, confirm=confirm, fail=fail, restart=restart, ctx=ctx,
+                          sent=sent, address=lambda: str(Pubkey.new_unique()),
+                          signature=lambda: str(Keypair().sign_message(b"x")))
+    tracker.stop()
+    main.journal.close()
+
+
+def test_resume_context_continues_from_the_last_stage(worker):
+    main, journal = worker.main, worker.main.journal
+    fresh, executed, uploaded, sent, confirmed = (worker.address() for _ in range(5))
+    journal.record(executed, "executed", body=RESULT, code_cid=CODE_CID, code_bytes=120)
+    for address in (uploaded, sent, confirmed):
+        run_to_upload(journal, address)
+    journal.record(sent, "sent", signature="sig1", last_valid_block_height=150)
+    journal.record(confirmed, "confirmed", signature="sig2")
+    worker.restart()
+
+    assert main.resume_context({"account_address": fresh, "code_cid": CODE_CID}) == {}
+    assert main.resume_context({"account_address": executed, "code_cid": "QmChanged"}) == {}
+    assert main.resume_context({"account_address": executed, "code_cid": CODE_CID}) == {
+        "result": json.loads(RESULT), "content": RESULT, "code_bytes": 120, "resumed": "executed"}
+    ctx = main.resume_context({"account_address": uploaded, "code_cid": CODE_CID})
+    assert ctx["result_cid"] == "QmResult" and ctx["cost"] == 1_000_500 and "sent" not in ctx
+    assert main.resume_context({"account_address": sent, "code_cid": CODE_CID})["sent"] == ("sig1", 150)
+    assert main.resume_context({"account_address": confirmed, "code_cid": CODE_CID}) == {"confirmed": "sig2"}
+
+
+def test_recheck_resolves_sends_from_before_the_restart(worker):
+    main, journal = worker.main, worker.main.journal
+    landed, failed, expired, in_flight = (worker.address() for _ in range(4))
+    signatures = {}
+    for address in (landed, failed, expired, in_flight):
+        run_to_upload(journal, address)
+        signatures[address] = worker.signature()
+        journal.record(address, "sent", signature=signatures[address],
+                       last_valid_block_height=90 if address == expired else 150)
+    worker.restart()
+    worker.confirm(signatures[landed])
+    worker.fail(signatures[failed])
+
+    main.recheck_journal()
+    assert main.journal.progress(landed)["stage"] == "confirmed"
+    assert main.journal.progress(failed)["stage"] == "rejected"
+    assert main.journal.progress(expired)["stage"] == "rejected"
+    assert main.journal.progress(in_flight)["stage"] == "sent"
+    assert worker.ctx(landed)["confirmed"] == signatures[landed]
+    assert "sent" not in worker.ctx(failed) and worker.ctx(failed)["result_cid"] == "QmResult"
+    assert worker.ctx(in_flight)["sent"] == (signatures[in_flight], 150)
+
+
+def test_journaled_send_is_confirmed_by_the_complete_stage(worker):
+    main = worker.main
+    address = worker.address()
+    run_to_upload(main.journal, address)
+    signature = worker.signature()
+    main.journal.record(address, "sent", signature=signature, last_valid_block_height=150)
+    worker.restart()
+    main.confirmations.start()
+
+    ctx = worker.ctx(address)
+    threading.Timer(0.1, worker.confirm, (signature,)).start()
+    assert main.stage_complete(ctx) is ctx
+    assert ctx["signature"] == signature and worker.sent == []
+    progress = main.journal.progress(address)
+    assert progress["stage"] == "confirmed" and progress["signature"] == signature
+
+
+def test_expired_journaled_send_is_resent_once_for_every_job_in_it(worker):
+    main = worker.main
+    first, second = worker.address(), worker.address()
+    signature = worker.signature()
+    for address in (first, second):
+        run_to_upload(main.journal, address)
+        main.journal.record(address, "sent", signature=signature, last_valid_block_height=150)
+    worker.restart()
+    contexts = [worker.ctx(first), worker.ctx(second)]
+    worker.client.block_height = 151
+    main.confirmations.start()
+
+    results = []
+    threads = [threading.Thread(target=lambda c=c: results.append(main.stage_complete(c))) for c in contexts]
+    threads[0].start()
+    assert wait_until(lambda: worker.sent)
+    threads[1].start()
+    worker.confirm(worker.sent[0][0])
+    for thread in threads:
+        thread.join(10)
+
+    # One re-send, carrying both jobs, and both follow it
+    assert len(worker.sent) == 1 and sorted(worker.sent[0][1]) == sorted([first, second])
+    assert len(results) == 2 and all(ctx["signature"] == str(worker.sent[0][0]) for ctx in results)
+    for address in (first, second):
+        assert main.journal.progress(address)["stage"] == "confirmed"
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
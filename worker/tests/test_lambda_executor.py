@@ -0,0 +1,141 @@
+import io
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("solders")
+main = pytest.importorskip("main")
+
+from executors import LambdaBatchExecutor, LambdaExecutor, decode_body
+from fakes import FakeLambda
+
+
+def job(title):
+    return {"title": title, "job_type_name": "API", "owner": "Owner"}
+
+
+class LambdaClient:
+    """FakeLambda that records the jobs of every invoke and which of them the handler ran"""
+
+    def __init__(self, timeout=30.0, reject_over=None, function_error=False):
+        self.fake = FakeLambda(main.LAMBDA_CODE, timeout=timeout)
+        self.reject_over = reject_over
+        self.function_error = function_error
+        self.invokes = []
+        self.ran = []
+        self._lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType="RequestResponse", Payload="{}"):
+        event = json.loads(Payload)
+        events = event.get("jobs", [event])
+        with self._lock:
+            self.invokes.append([e["job_title"] for e in events])
+        assert all(e["timeout_ms"] == 2000 for e in events)  # batch_executor's job_timeout
+        if self.reject_over and len(events) > self.reject_over:
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "RequestEntityTooLargeException", "Message": "too large"}}, "Invoke")
+
+        response = self.fake.invoke(FunctionName, InvocationType, Payload)
+        payload = json.loads(response["Payload"].read())
+        body = decode_body(payload["body"])[0]
+        results = body["results"] if "jobs" in event else [body]
+        with self._lock:
+            self.ran += [e["job_title"] for e, r in zip(events, results) if r["status"] != "deferred"]
+        if self.function_error:
+            # The jobs ran, then the invoke itself failed (e.g. the container ran out of time)
+            return {"FunctionError": "Unhandled", "Payload": io.BytesIO(json.dumps(
+                {"errorType": "Runtime.ExitError", "errorMessage": "exited"}).encode())}
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(payload).encode())}
+
+
+def batch_executor(client, size):
+    return LambdaBatchExecutor(SimpleNamespace(lambda_client=client), "fn", window=1.0, max_batch=size,
+                               job_timeout=2.0)
+
+
+def run_together(executor, titles):
+    """execute() one job per title from parallel callers; a result or exception per title"""
+    results = {}
+
+    def run(title):
+        try:
+            results[title] = executor.execute(f"print({title!r})", job(title))
+        except Exception as e:
+            results[title] = e
+
+    threads = [threading.Thread(target=run, args=(title,)) for title in titles]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return results
+
+
+def test_concurrent_jobs_share_one_invoke():
+    client = LambdaClient()
+    executor = batch_executor(client, 3)
+    try:
+        results = run_together(executor, ["a", "b", "c"])
+    finally:
+        executor.close()
+    assert len(client.invokes) == 1 and sorted(client.invokes[0]) == ["a", "b", "c"]
+    assert all(results[t]["status"] == "success" and results[t]["stdout"] == f"{t}\n" for t in "abc")
+    assert executor.stats["invokes"] == 1 and executor.stats["batched"] == 1 and executor.stats["jobs"] == 3
+
+
+def test_deferred_jobs_are_sent_again_alone():
+    # 6s left in the invoke cannot give a later job its 2s timeout plus the reserve
+    client = LambdaClient(timeout=6.0)
+    executor = batch_executor(client, 3)
+    try:
+        results = run_together(executor, ["a", "b", "c"])
+    finally:
+        executor.close()
+    first, *rest = client.invokes
+    assert len(first) == 3 and sorted(rest) == [[t] for t in sorted(first[1:])]
+    assert sorted(client.ran) == ["a", "b", "c"]  # every job ran exactly once
+    assert all(results[t]["status"] == "success" for t in "abc")
+    assert executor.stats["deferred"] == 2 and executor.stats["jobs"] == 3
+
+
+def test_rejected_batch_is_split_and_every_job_runs_once():
+    pytest.importorskip("botocore")
+    client = LambdaClient(reject_over=1)
+    executor = batch_executor(client, 4)
+    try:
+        results = run_together(executor, ["a", "b", "c", "d"])
+    finally:
+        executor.close()
+    assert sorted(len(titles) for titles in client.invokes) == [1, 1, 1, 1, 2, 2, 4]
+    assert sorted(client.ran) == ["a", "b", "c", "d"]
+    assert all(results[t]["status"] == "success" for t in "abcd")
+    assert executor.stats["splits"] == 3 and executor.stats["rejected"] == 3 and executor.stats["failed"] == 0
+
+
+def test_batch_that_reached_the_handler_is_not_sent_again():
+    client = LambdaClient(function_error=True)
+    executor = batch_executor(client, 3)
+    try:
+        results = run_together(executor, ["a", "b", "c"])
+    finally:
+        executor.close()
+    # The jobs may have run, so they fail instead of running a second time
+    assert len(client.invokes) == 1 and sorted(client.ran) == ["a", "b", "c"]
+    assert all(isinstance(results[t], RuntimeError) and "Runtime.ExitError" in str(results[t]) for t in "abc")
+    assert executor.stats["failed"] == 3 and executor.stats["splits"] == 0
+
+
+def test_each_job_in_a_batch_gets_its_own_timeout():
+    # The handler arms its timer on the main thread, where Lambda calls it
+    client = LambdaClient()
+    executor = LambdaExecutor(SimpleNamespace(lambda_client=client), "fn", compress=False, job_timeout=0.2)
+    events = [executor.encode_event("while True:\n    pass", job("slow")),
+              executor.encode_event("print('fast')", job("fast"))]
+    assert [event["timeout_ms"] for event in events] == [200, 200]
+    response = client.fake.handler({"jobs": events}, None)
+    slow, fast = response["body"]["results"]
+    assert slow["status"] == "error" and slow["error_type"] == "Timeout"
+    assert slow["error"] == "Task timed out after 0.20 seconds" and slow["execution_time_ms"] < 1000
+    assert fast["status"] == "success" and fast["stdout"] == "fast\n"
@@ -0,0 +1,124 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("solders")
+main = pytest.importorskip("main")
+
+from executors import LambdaExecutor, decode_body
+from fakes import FakeLambda
+
+
+@pytest.fixture(scope="module")
+def handler():
+    """LAMBDA_CODE's module namespace, loaded the way Lambda loads it"""
+    namespace = {"__name__": "lambda_function"}
+    exec(compile(main.LAMBDA_CODE, "lambda_function.py", "exec"), namespace)
+    return SimpleNamespace(**namespace)
+
+
+def captured(handler, limit, writes):
+    capture = handler.BoundedCapture(limit)
+    for text in writes:
+        assert capture.write(text) == len(text)
+    return capture
+
+
+def test_output_under_the_limit_is_kept_whole(handler):
+    capture = captured(handler, 10, ["abc", "", "defghij"])
+    assert capture.getvalue() == "abcdefghij" and capture.dropped == 0
+
+
+def test_output_over_the_limit_keeps_head_and_tail(handler):
+    text = "".join(chr(ord("a") + i % 26) for i in range(1000))
+    expected = text[:50] + "\n... [900 characters truncated] ...\n" + text[-50:]
+    # One large write, many small ones and uneven chunks all end up the same
+    for writes in ([text], list(text), [text[i:i + 37] for i in range(0, 1000, 37)]):
+        capture = captured(handler, 100, writes)
+        assert capture.getvalue() == expected and capture.dropped == 900
+        assert capture.head_size == 50 and capture.tail_size == 50
+
+    # An odd limit gives the extra character to the tail
+    assert captured(handler, 5, ["0123456789"]).getvalue() == "01\n... [5 characters truncated] ...\n789"
+
+
+def test_truncation_is_reported_with_the_job(handler):
+    code = "import sys\nprint('x' * 5000)\nsys.stderr.write('warning')"
+    status, body = handler.run_job({"code": code, "job_title": "loud", "output_limit": 1000})
+    assert status == 200 and body["status"] == "success"
+    assert body["stdout_truncated"] == 5001 - 1000 and "stderr_truncated" not in body
+    assert body["stdout"].startswith("x" * 500) and "[4001 characters truncated]" in body["stdout"]
+    assert body["stderr"] == "warning"
+
+
+def test_small_or_uncompressed_bodies_stay_objects(handler):
+    body = {"status": "success", "stdout": "hi"}
+    assert handler.encode_body(body, False) is body
+    assert handler.encode_body(body, True) is body
+    large = {"status": "success", "stdout": "x" * 5000}
+    assert handler.encode_body(large, False) is large
+    assert decode_body(body) == (body, 0)
+
+
+def test_compressed_body_round_trips(handler):
+    body = {"status": "success", "stdout": "résumé ✓ 数据\n" * 500, "nested": {"values": list(range(100))}}
+    encoded = handler.encode_body(body, True)
+    assert isinstance(encoded, str)
+    wire = json.loads(encoded)
+    assert wire["encoding"] == "zlib+base64" and wire["size"] == len(json.dumps(body))
+    assert len(encoded) < wire["size"]
+    assert decode_body(encoded) == (body, len(json.dumps(body)))
+
+    # A plain body that arrives as a JSON string is parsed and sized as sent
+    plain = json.dumps({"status": "success"})
+    assert decode_body(plain) == ({"status": "success"}, len(plain))
+
+
+class RecordingClient:
+    def __init__(self):
+        self.fake = FakeLambda(main.LAMBDA_CODE)
+        self.payloads = []
+
+    def invoke(self, FunctionName, InvocationType="RequestResponse", Payload="{}"):
+        self.payloads.append(json.loads(Payload))  # the request must be valid JSON
+        return self.fake.invoke(FunctionName, InvocationType, Payload)
+
+
+def test_compress_flag_is_part_of_a_valid_request():
+    # The flag used to be spliced into the encoded payload, which broke on an empty event
+    client = RecordingClient()
+    executor = LambdaExecutor(SimpleNamespace(lambda_client=client), "fn", compress=True)
+    body = executor.invoke({})
+    assert client.payloads == [{"compress": True}]
+    assert body["status"] == "error" and body["error"] == "No code provided"
+
+
+def test_large_code_and_output_are_compressed_both_ways():
+    client = RecordingClient()
+    executor = LambdaExecutor(SimpleNamespace(lambda_client=client), "fn", compress=True,
+                              compress_min_bytes=1024)
+    code = "# padding\n" * 200 + "print('数据 ' * 2000)"
+    job = {"title": "big", "job_type_name": "API", "owner": "Owner"}
+    body = executor.execute(code, job)
+    assert body["status"] == "success" and body["stdout"] == "数据 " * 2000 + "\n"
+    assert "code_z" in client.payloads[0] and "code" not in client.payloads[0]
+
+    stats = executor.stats
+    assert stats["code_bytes"] == len(code.encode()) and stats["code_sent_bytes"] < stats["code_bytes"]
+    assert stats["response_received_bytes"] < stats["response_bytes"]
+
+    # Small code goes as is, and its small response comes back uncompressed
+    assert executor.execute("print(1)", job)["stdout"] == "1\n"
+    assert client.payloads[1]["code"] == "print(1)" and client.payloads[1]["compress"] is True
+
+
+def test_uncompressed_response_is_read_as_an_object():
+    client = RecordingClient()
+    executor = LambdaExecutor(SimpleNamespace(lambda_client=client), "fn", compress=False)
+    body = executor.execute("print('x' * 5000)", {"title": "t", "job_type_name": "API", "owner": "O"})
+    assert body["stdout"] == "x" * 5000 + "\n"
+    assert "compress" not in client.payloads[0]
+    response = client.fake.invoke("fn", Payload=json.dumps(client.payloads[0]))
+    assert isinstance(json.load(io.TextIOWrapper(response["Payload"]))["body"], dict)
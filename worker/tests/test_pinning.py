@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cid import cid_v0, directory_cid_v0
+from pinning import PinError, PinQueue
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakePinata:
+    """pinFileToIPFS stand-in that pins like Pinata, fails the first `fail_first` requests
+    and, with `bad_directories`, answers directory uploads with a CID of its own"""
+
+    def __init__(self, fail_first=0, bad_directories=False):
+        self.fail_first = fail_first
+        self.bad_directories = bad_directories
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def post(self, url, files, data, timeout):
+        with self._lock:
+            self.requests.append([name for _, (name, _, _) in files])
+            if len(self.requests) <= self.fail_first:
+                return _Response(500)
+        if len(files) == 1:
+            return _Response(200, {"IpfsHash": cid_v0(files[0][1][1])})
+        if self.bad_directories:
+            return _Response(200, {"IpfsHash": cid_v0(b"some other layout")})
+        entries = [(name.split("/", 1)[1], content) for _, (name, content, _) in files]
+        return _Response(200, {"IpfsHash": directory_cid_v0(entries)})
+
+
+def pin_queue(session, spool_dir=None, **options):
+    options = dict(dict(window=0.2, base_delay=0.01, max_delay=0.05), **options)
+    queue = PinQueue(session, "https://pinata.test", spool_dir=spool_dir, **options)
+    queue.start()
+    return queue
+
+
+def contents(n):
+    return [(f'{{"job":{i}}}'.encode(), f"job_{i}.json") for i in range(n)]
+
+
+def test_submissions_within_the_window_share_one_request(tmp_path):
+    pinata = FakePinata()
+    queue = pin_queue(pinata, str(tmp_path))
+    try:
+        futures = [queue.submit(content, name) for content, name in contents(3)]
+        assert [f.result(5) for f in futures] == [cid_v0(content) for content, _ in contents(3)]
+    finally:
+        queue.stop()
+    assert len(pinata.requests) == 1 and len(pinata.requests[0]) == 3
+    assert queue.stats["batched"] == 1 and queue.stats["pinned"] == 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_directory_cid_mismatch_splits_into_single_uploads():
+    pinata = FakePinata(bad_directories=True)
+    queue = pin_queue(pinata)
+    try:
+        futures = [queue.submit(content, name) for content, name in contents(3)]
+        assert [f.result(5) for f in futures] == [cid_v0(content) for content, _ in contents(3)]
+    finally:
+        queue.stop()
+    assert [len(names) for names in pinata.requests] == [3, 1, 1, 1]
+    assert queue.stats["splits"] == 1 and queue.stats["cid_mismatch"] == 1
+
+
+def test_failed_requests_are_retried():
+    pinata = FakePinata(fail_first=2)
+    queue = pin_queue(pinata)
+    try:
+        content, name = contents(1)[0]
+        assert queue.submit(content, name).result(5) == cid_v0(content)
+    finally:
+        queue.stop()
+    assert len(pinata.requests) == 3
+    assert queue.stats["retries"] == 2 and queue.stats["failed"] == 0
+
+
+def test_content_stays_spooled_after_the_last_attempt(tmp_path):
+    pinata = FakePinata(fail_first=100)
+    queue = pin_queue(pinata, str(tmp_path), max_attempts=3)
+    try:
+        content, name = contents(1)[0]
+        future = queue.submit(content, name)
+        with pytest.raises(PinError):
+            future.result(5)
+    finally:
+        queue.stop()
+    assert len(pinata.requests) == 3
+    assert queue.stats["failed"] == 1
+    assert os.listdir(tmp_path) == [cid_v0(content)]
+
+
+def test_spooled_content_is_pinned_on_start(tmp_path):
+    content, _ = contents(1)[0]
+    cid = cid_v0(content)
+    (tmp_path / cid).write_bytes(content)
+    (tmp_path / f"{cid}.123.tmp").write_bytes(content[:3])
+    pinata = FakePinata()
+    queue = pin_queue(pinata, str(tmp_path))
+    try:
+        for _ in range(100):
+            if queue.is_pinned(cid):
+                break
+            time.sleep(0.05)
+    finally:
+        queue.stop()
+    assert queue.is_pinned(cid) and queue.stats["recovered"] == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_identical_content_is_uploaded_once():
+    pinata = FakePinata()
+    queue = pin_queue(pinata)
+    try:
+        content, name = contents(1)[0]
+        first, second = queue.submit(content, name), queue.submit(content, "copy.json")
+        assert first.result(5) == second.result(5) == cid_v0(content)
+        assert queue.submit(content, name).result(0) == cid_v0(content)
+    finally:
+        queue.stop()
+    assert len(pinata.requests) == 1 and queue.stats["already_pinned"] == 1
@@ -0,0 +1,157 @@
+import threading
+import time
+
+from pipeline import JobPipeline
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def recorder():
+    finished, lock = [], threading.Lock()
+
+    def on_finish(key, ctx, ok, stage):
+        with lock:
+            finished.append((key, ok, stage, ctx.get("error")))
+    return finished, on_finish
+
+
+def test_full_queues_push_back_to_submit():
+    gate = threading.Event()
+
+    def blocked(ctx):
+        gate.wait(10)
+        return ctx
+
+    pipeline = JobPipeline([("fetch", lambda ctx: ctx, 1), ("run", blocked, 1)], queue_size=1)
+    pipeline.start()
+    try:
+        # One job runs, one waits in run's queue, one is held by fetch and one in fetch's queue
+        assert all(pipeline.submit(f"job{i}", {}, timeout=1) for i in range(4))
+        assert wait_until(lambda: pipeline.stats()["fetch"]["queued"] == 1)
+        started = time.time()
+        assert not pipeline.submit("job4", {}, timeout=0.2)
+        assert time.time() - started >= 0.2
+        assert not pipeline.is_in_flight("job4")
+        assert pipeline.stats()["run"] == {"workers": 1, "queued": 1, "busy": 1, "processed": 0, "failed": 0}
+
+        gate.set()
+        assert pipeline.join(5)
+        assert pipeline.submit("job4", {}, timeout=1) and pipeline.join(5)
+        assert pipeline.stats()["run"]["processed"] == 5
+    finally:
+        gate.set()
+        pipeline.stop()
+
+
+def test_a_failing_stage_only_fails_its_own_job():
+    finished, on_finish = recorder()
+    stages_seen = []
+
+    def run(ctx):
+        if ctx["_key"] == "bad":
+            raise RuntimeError("boom")
+        return ctx
+
+    def skip(ctx):
+        return None if ctx["_key"] == "skipped" else ctx
+
+    pipeline = JobPipeline([("run", run, 2), ("filter", skip, 1), ("upload", lambda ctx: ctx, 1)],
+                           on_finish=on_finish,
+                           on_stage=lambda stage, ctx, wait, run, ok: stages_seen.append((ctx["_key"], stage, ok)))
+    pipeline.start()
+    try:
+        for key in ("good1", "bad", "skipped", "good2"):
+            assert pipeline.submit(key, {}, timeout=1)
+        assert pipeline.join(5)
+    finally:
+        pipeline.stop()
+
+    results = {key: (ok, stage, error) for key, ok, stage, error in finished}
+    assert results == {
+        "good1": (True, "upload", None),
+        "good2": (True, "upload", None),
+        "bad": (False, "run", "RuntimeError: boom"),
+        "skipped": (False, "filter", None),
+    }
+    assert ("bad", "run", False) in stages_seen
+    assert not any(key == "bad" and stage != "run" for key, stage, _ in stages_seen)
+    assert pipeline.stats()["run"]["failed"] == 1 and pipeline.stats()["filter"]["failed"] == 1
+    assert pipeline.stats()["upload"]["processed"] == 2
+
+
+def test_stuck_job_does_not_hold_up_others_in_a_wider_stage():
+    gate = threading.Event()
+    finished, on_finish = recorder()
+
+    def run(ctx):
+        if ctx["_key"] == "slow":
+            gate.wait(10)
+        return ctx
+
+    pipeline = JobPipeline([("run", run, 2), ("upload", lambda ctx: ctx, 1)], on_finish=on_finish)
+    pipeline.start()
+    try:
+        assert pipeline.submit("slow", {}, timeout=1)
+        for i in range(3):
+            assert pipeline.submit(f"job{i}", {}, timeout=1)
+        assert wait_until(lambda: len(finished) == 3)
+        assert pipeline.in_flight() == {"slow": "run"}
+        gate.set()
+        assert pipeline.join(5)
+    finally:
+        gate.set()
+        pipeline.stop()
+    assert [key for key, _, _, _ in finished][-1] == "slow"
+
+
+def test_each_job_passes_the_stages_in_order():
+    visits, lock = {}, threading.Lock()
+
+    def stage(name):
+        def func(ctx):
+            with lock:
+                visits.setdefault(ctx["_key"], []).append(name)
+            time.sleep(0.001 * (hash(ctx["_key"]) % 3))
+            ctx.setdefault("trail", []).append(name)
+            return ctx
+        return func
+
+    finished = []
+    names = ["fetch", "run", "upload", "complete"]
+    pipeline = JobPipeline([(name, stage(name), 3) for name in names], queue_size=2,
+                           on_finish=lambda key, ctx, ok, stage: finished.append((ok, stage, ctx)))
+    pipeline.start()
+    try:
+        for i in range(30):
+            assert pipeline.submit(f"job{i}", {}, timeout=5)
+        assert pipeline.join(10)
+    finally:
+        pipeline.stop()
+
+    assert len(visits) == 30
+    assert all(trail == names for trail in visits.values())
+    assert len(finished) == 30 and all(ok and stage == "complete" for ok, stage, _ in finished)
+    assert all(ctx["trail"] == names and list(ctx["_timings"]) == names for _, _, ctx in finished)
+
+
+def test_a_job_is_not_submitted_twice_while_in_flight():
+    gate = threading.Event()
+    pipeline = JobPipeline([("run", lambda ctx: gate.wait(10) and ctx, 1)])
+    pipeline.start()
+    try:
+        assert pipeline.submit("job", {}, timeout=1)
+        assert not pipeline.submit("job", {}, timeout=1)
+        gate.set()
+        assert pipeline.join(5)
+        assert pipeline.submit("job", {}, timeout=1)
+        assert pipeline.join(5)
+    finally:
+        gate.set()
+        pipeline.stop()
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+import result_cache
+from result_cache import PURGE_EVERY, ResultCache, result_key
+
+OUTPUT = {"output": "42", "status": "success", "execution_time_ms": 120}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(result_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "results.db")
+
+
+def encoded(output) -> bytes:
+    return json.dumps(output, sort_keys=True).encode()
+
+
+def test_hit_miss_and_saved_time(clock, path):
+    cache = ResultCache(path, ttl=60)
+    key = result_key("QmCode", "API", "v1")
+    assert cache.get(key) is None
+    cache.put(key, encoded(OUTPUT), code_bytes=300)
+    assert cache.get(key) == {"output": OUTPUT, "code_bytes": 300}
+    assert cache.get(key)["output"] == OUTPUT
+    assert cache.stats["hits"] == 2 and cache.stats["misses"] == 1 and cache.stats["saved_ms"] == 240
+    cache.close()
+    # Survives a restart
+    cache = ResultCache(path, ttl=60)
+    assert len(cache) == 1 and cache.get(key)["code_bytes"] == 300
+    cache.close()
+
+
+def test_entries_expire_after_the_ttl(clock, path):
+    cache = ResultCache(path, ttl=60)
+    cache.put("a", encoded(OUTPUT), 1)
+    clock.now += 59
+    assert cache.get("a") is not None
+    # Expiry counts from when it was stored, not from the last hit
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats["expired"] == 1 and len(cache) == 0
+    cache.close()
+
+
+def test_expired_entries_are_swept_on_put(clock, path):
+    cache = ResultCache(path, ttl=60)
+    for i in range(10):
+        cache.put(f"old{i}", encoded(OUTPUT), 1)
+    clock.now += 61
+    for i in range(PURGE_EVERY - 10):
+        cache.put(f"new{i}", encoded(OUTPUT), 1)
+    assert cache.stats["expired"] == 10 and len(cache) == PURGE_EVERY - 10
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(clock, path):
+    cache = ResultCache(path, ttl=3600, max_entries=3)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.put(key, encoded(OUTPUT), 1)
+    clock.now += 1
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    clock.now += 1
+    cache.put("d", encoded(OUTPUT), 1)
+    assert len(cache) == 3 and cache.stats["evicted"] == 1
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+
+    # Replacing an entry does not count as a new one
+    cache.put("d", encoded(dict(OUTPUT, output="43")), 1)
+    assert len(cache) == 3 and cache.stats["evicted"] == 1
+    assert cache.get("d")["output"]["output"] == "43"
+    cache.close()
+
+
+def test_key_names_the_code_and_handler_not_the_job():
+    assert result_key("QmCode", "API", "v1") == result_key("QmCode", "API", "v1")
+    assert len({result_key("QmCode", "API", "v1"), result_key("QmCode", "MANUAL", "v1"),
+                result_key("QmOther", "API", "v1"), result_key("QmCode", "API", "v2")}) == 4
+
+
+def test_a_hit_is_stamped_with_the_current_job_not_the_first(monkeypatch, path):
+    pytest.importorskip("solders")
+    main = pytest.importorskip("main")
+    cache = ResultCache(path, ttl=3600)
+    monkeypatch.setattr(main, "result_cache", cache)
+    monkeypatch.setattr(main, "journal", None)
+    monkeypatch.setattr(main, "upload_to_pinata", lambda content, name=None: "QmPinned")
+
+    def job(title, owner):
+        return {"account_address": "Job" + title, "title": title, "owner": owner, "code_cid": "QmCode",
+                "job_type_name": "API"}
+
+    first = {"job": job("alice's job", "Alice"), "code_bytes": 300}
+    result = dict(OUTPUT, job_title="alice's job", job_type="API", owner="Alice", timestamp=1)
+    first.update(result=result, content=main.encode_result(result))
+    main.stage_upload(first)
+
+    key = main.memo_key(first)
+    assert key == main.memo_key({"job": job("bob's job", "Bob")})
+    stored = cache.get(key)["output"]
+    assert not set(main.JOB_RESULT_FIELDS) & set(stored)
+    assert stored == OUTPUT
+
+    second = {"job": job("bob's job", "Bob")}
+    assert main.stage_fetch(second) is second and second["cached"]
+    assert second["result"]["owner"] == "Bob" and second["result"]["job_title"] == "bob's job"
+    assert "Alice" not in second["content"].decode() and json.loads(second["content"]) == second["result"]
+    cache.close()
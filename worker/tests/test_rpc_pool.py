@@ -0,0 +1,151 @@
+import time
+
+import pytest
+
+pytest.importorskip("solders")
+pytest.importorskip("solana")
+
+import httpx
+from solders.pubkey import Pubkey
+
+from clients import pooled_rpc_client
+from fakes import FakeSolanaRPC, Faults, RPCNode
+from fixtures import make_accounts
+from rpc_pool import RateLimited, RpcPool, TokenBucket, client_session
+
+PROGRAM = Pubkey.new_unique()
+
+
+@pytest.fixture
+def chain():
+    chain = FakeSolanaRPC(PROGRAM, make_accounts(20, seed=3)).start()
+    yield chain
+    for node in chain.nodes:
+        node.stop()
+    chain.stop()
+
+
+def node(chain, **options) -> RPCNode:
+    return RPCNode(chain, **options).start()
+
+
+def pool(*urls, **options) -> RpcPool:
+    return RpcPool({url: pooled_rpc_client(url, 4, 5.0) for url in urls}, **options)
+
+
+def use_up(node: RPCNode):
+    """Spend a rate-limited node's budget for the current second from another client"""
+    time.sleep(1.01 - time.time() % 1)
+    for _ in range(int(node.limit.rate)):
+        httpx.post(node.url, json={"jsonrpc": "2.0", "id": 1, "method": "getSlot"}).raise_for_status()
+
+
+def test_pooled_client_session_is_the_tuned_one():
+    # Fails loudly if a solana-py release moves the provider's session
+    rpc = pooled_rpc_client("http://127.0.0.1:1", 4, 5.0)
+    session = client_session(rpc)
+    assert isinstance(session, httpx.Client)
+    assert session.timeout == httpx.Timeout(5.0) and not session.is_closed
+    assert rpc.commitment == "finalized"
+    session.close()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=20.0, burst=2)
+    assert bucket.acquire() == 0.0 and bucket.acquire() == 0.0
+    started = time.monotonic()
+    waited = bucket.acquire()
+    assert 0.03 < waited <= 0.06 and time.monotonic() - started >= 0.03
+
+    bucket.throttle(observed_rate=100)
+    assert bucket.rate == 10.0
+    bucket.throttle(observed_rate=100)
+    assert bucket.rate == 5.0
+    for _ in range(1000):
+        bucket.recover()
+    assert bucket.rate == 20.0  # back up to the configured rate, not past it
+
+    unlimited = TokenBucket(rate=None)
+    assert all(unlimited.acquire() == 0.0 for _ in range(100))
+    unlimited.throttle(observed_rate=40)
+    assert unlimited.rate == 20.0
+    unlimited.recover()
+    assert unlimited.rate > 20.0
+
+
+def test_slow_endpoint_is_hedged_to_the_next(chain):
+    slow, fast = node(chain, faults=Faults(latency=0.5)), node(chain)
+    rpc = pool(slow.url, fast.url, hedge_max=0.05)
+    try:
+        started = time.time()
+        assert rpc.get_slot().value >= 1000
+        assert time.time() - started < 0.4
+        assert rpc.stats["hedged"] == 1 and rpc.stats["hedge_wins"] == 1
+        stats = rpc.endpoint_stats()
+        assert stats[fast.url]["hedges"] == 1 and stats[fast.url]["wins"] == 1
+
+        # The fast node now ranks first and answers before its own hedge delay
+        time.sleep(0.6)
+        for _ in range(3):
+            rpc.get_slot()
+        assert rpc.stats["hedged"] == 1
+        assert rpc.endpoint_stats()[fast.url]["wins"] == 4
+    finally:
+        rpc.close()
+
+
+def test_rate_limited_endpoint_backs_off_and_the_read_moves_on(chain):
+    limited = node(chain, rate_limit=1)
+    rpc = pool(limited.url, chain.url)
+    try:
+        use_up(limited)
+        assert rpc.get_slot().value >= 1000  # 429 from the first node, answered by the second
+        stats = rpc.endpoint_stats()
+        assert stats[limited.url]["rate_limited"] == 1 and limited.limit.rejected == 1
+        assert stats[chain.url]["wins"] == 1
+        assert rpc.stats["failed"] == 0
+
+        # Cooling down for Retry-After: reads skip it without another 429
+        for _ in range(3):
+            rpc.get_slot()
+        assert limited.limit.rejected == 1
+        assert rpc.endpoint_stats()[chain.url]["wins"] == 4
+        assert rpc.endpoints[0].bucket.rate == 0.5
+    finally:
+        rpc.close()
+
+
+def test_single_rate_limited_endpoint_retries_after_the_cooldown(chain):
+    limited = node(chain, rate_limit=1)
+    rpc = pool(limited.url, retries=1)
+    try:
+        use_up(limited)
+        started = time.time()
+        assert rpc.get_slot().value >= 1000
+        # Waited out Retry-After: 1 before the retry
+        assert time.time() - started >= 0.9
+        assert rpc.stats["retried"] == 1 and limited.limit.rejected == 1
+    finally:
+        rpc.close()
+
+    # Out of retries: RateLimited reaches the caller
+    rpc = pool(limited.url, retries=0)
+    try:
+        use_up(limited)
+        with pytest.raises(RateLimited):
+            rpc.get_slot()
+        assert rpc.stats["failed"] == 1 and limited.limit.rejected == 2
+    finally:
+        rpc.close()
+
+
+def test_stream_program_accounts_fails_over(chain):
+    limited = node(chain, rate_limit=1)
+    rpc = pool(limited.url, chain.url)
+    try:
+        use_up(limited)
+        accounts = dict(rpc.stream_program_accounts(str(PROGRAM)))
+        assert set(accounts) == set(chain.accounts)
+        assert rpc.endpoint_stats()[limited.url]["rate_limited"] == 1
+    finally:
+        rpc.close()
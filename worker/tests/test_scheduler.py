@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import JobScheduler, parse_weights
+
+
+class Pipeline:
+    """submit()/has_capacity() pair that takes `capacity` jobs, more with allow()"""
+
+    def __init__(self, capacity=0, accept=True):
+        self.capacity = capacity
+        self.accept = accept
+        self.submitted = []
+        self.wake = lambda: None
+        self._lock = threading.Lock()
+
+    def submit(self, key, item):
+        with self._lock:
+            self.submitted.append(key)
+        return self.accept
+
+    def has_capacity(self):
+        with self._lock:
+            return len(self.submitted) < self.capacity
+
+    def allow(self, n):
+        with self._lock:
+            self.capacity += n
+        self.wake()
+
+    def wait_for(self, n, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if len(self.submitted) >= n:
+                    return list(self.submitted)
+            time.sleep(0.005)
+        raise AssertionError(f"{len(self.submitted)} of {n} jobs dispatched")
+
+
+@pytest.fixture
+def run():
+    started = []
+
+    def run(pipeline, weights, **options):
+        scheduler = JobScheduler(pipeline.submit, pipeline.has_capacity, weights, **options)
+        pipeline.wake = scheduler.wake
+        started.append(scheduler)
+        return scheduler
+
+    yield run
+    for scheduler in started:
+        scheduler.stop()
+
+
+def test_parse_weights():
+    assert parse_weights("api=8, MANUAL=2,CRON=0,bad") == {"API": 8.0, "MANUAL": 2.0, "CRON": 0.001}
+
+
+def test_classes_share_dispatches_by_weight(run):
+    pipeline = Pipeline()
+    scheduler = run(pipeline, {"API": 8, "CRON": 1})
+    for i in range(90):
+        scheduler.offer(f"api-{i}", None, "API", f"owner-{i}")
+        scheduler.offer(f"cron-{i}", None, "CRON", f"owner-{i}")
+    scheduler.start()
+    pipeline.allow(45)
+    first = pipeline.wait_for(45)
+    assert sum(key.startswith("cron") for key in first) == 5
+    # CRON is never starved: it gets one of every nine dispatches
+    for start in range(0, 45, 9):
+        assert sum(key.startswith("cron") for key in first[start:start + 9]) == 1
+
+
+def test_idle_class_does_not_bank_credit(run):
+    pipeline = Pipeline()
+    scheduler = run(pipeline, {"API": 1, "CRON": 1})
+    scheduler.start()
+    for i in range(50):
+        scheduler.offer(f"api-{i}", None, "API", "a")
+    pipeline.allow(40)
+    pipeline.wait_for(40)
+    for i in range(10):
+        scheduler.offer(f"cron-{i}", None, "CRON", "c")
+    pipeline.allow(10)
+    later = pipeline.wait_for(50)[40:]
+    assert sum(key.startswith("cron") for key in later) in (5, 6)
+
+
+def test_owners_take_turns_and_oldest_runs_first(run):
+    pipeline = Pipeline()
+    scheduler = run(pipeline, {"API": 1})
+    for start_time in (30, 10, 20):
+        scheduler.offer(f"busy-{start_time}", None, "API", "busy", start_time)
+    scheduler.offer("quiet-1", None, "API", "quiet", 99)
+    scheduler.start()
+    pipeline.allow(4)
+    assert pipeline.wait_for(4) == ["busy-10", "quiet-1", "busy-20", "busy-30"]
+
+
+def test_owner_cap_holds_back_an_owner_until_done(run):
+    pipeline = Pipeline(capacity=10)
+    scheduler = run(pipeline, {"API": 1}, owner_cap=1)
+    for i in range(3):
+        scheduler.offer(f"busy-{i}", None, "API", "busy", i)
+    scheduler.offer("quiet", None, "API", "quiet")
+    scheduler.start()
+    assert pipeline.wait_for(2) == ["busy-0", "quiet"]
+    time.sleep(0.1)
+    assert len(pipeline.submitted) == 2
+    assert scheduler.stats()["API"]["owners_capped"] == 1
+    scheduler.done("busy")
+    assert pipeline.wait_for(3)[-1] == "busy-1"
+
+
+def test_rejected_submit_frees_the_owner_slot(run):
+    pipeline = Pipeline(capacity=2, accept=False)
+    scheduler = run(pipeline, {"API": 1}, owner_cap=1)
+    scheduler.offer("a-0", None, "API", "a", 0)
+    scheduler.offer("a-1", None, "API", "a", 1)
+    scheduler.start()
+    assert pipeline.wait_for(2) == ["a-0", "a-1"]
+
+
+def test_full_class_queue_refuses_offers(run):
+    scheduler = run(Pipeline(), {"API": 1}, max_queued=2)
+    assert scheduler.offer("a", None, "API", "o")
+    assert scheduler.offer("b", None, "API", "o")
+    assert not scheduler.offer("c", None, "API", "o")
+    assert scheduler.offer("d", None, "OTHER", "o")  # unknown classes get the default weight
+    assert scheduler.queued() == 3
+    assert scheduler.stats()["API"]["rejected"] == 1
+    assert sorted(key for key, _ in scheduler.stop()) == ["a", "b", "d"]
+
+
+def test_idle_scheduler_sleeps_until_signalled(run):
+    pipeline = Pipeline()
+    checks = []
+
+    def has_capacity():
+        checks.append(time.time())
+        return pipeline.has_capacity()
+
+    scheduler = run(pipeline, {"API": 1})
+    scheduler.has_capacity = has_capacity
+    scheduler.offer("a", None, "API", "o")
+    scheduler.start()
+    time.sleep(0.3)
+    # No capacity: checked once, then asleep instead of polling
+    assert len(checks) == 1 and pipeline.submitted == []
+    pipeline.allow(1)
+    assert pipeline.wait_for(1) == ["a"]
+    time.sleep(0.3)
+    assert len(checks) == 3  # on wake(), then once more after the dispatch
+
+    # stop() still gets the thread out of its wait
+    started = time.time()
+    scheduler.stop()
+    assert time.time() - started < 1.0 and scheduler._thread is None
@@ -0,0 +1,149 @@
+import pytest
+
+import sharding
+from sharding import ShardAssignment, ShardLeases, ShardRing
+
+SHARDS = 4
+TTL = 30.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sharding, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def workers(tmp_path):
+    created = []
+
+    def worker(owner, **options):
+        leases = ShardLeases(str(tmp_path / "leases.db"), owner, ShardAssignment(ShardRing(SHARDS)),
+                             ttl=TTL, **options)
+        created.append(leases)
+        return leases
+
+    yield worker
+    for leases in created:
+        leases._db.close()
+
+
+def settle(clock, *workers, rounds=6):
+    """Renew every worker each TTL / 3, as their threads would"""
+    for _ in range(rounds):
+        clock.now += TTL / 3
+        for leases in workers:
+            leases.renew()
+
+
+def test_ring_is_stable_and_covers_every_shard():
+    ring = ShardRing(SHARDS)
+    addresses = [f"account-{i}" for i in range(2000)]
+    shards = [ring.shard(address) for address in addresses]
+    assert shards == [ShardRing(SHARDS).shard(address) for address in addresses]
+    assert set(shards) == set(range(SHARDS))
+    assert all(shards.count(shard) > 2000 / SHARDS / 2 for shard in range(SHARDS))
+    assert ShardRing(1).shard("anything") == 0
+
+
+def test_single_worker_leases_every_shard(clock, workers):
+    a = workers("a")
+    a.renew()
+    assert a.assignment.owned == frozenset(range(SHARDS))
+
+
+def test_preferred_shard_is_kept_and_taken_first(clock, workers):
+    a = workers("a", preferred=3)
+    b = workers("b", preferred=0)
+    a.renew()
+    settle(clock, a, b)
+    assert 3 in a.assignment.owned and 0 in b.assignment.owned
+
+
+def test_new_member_gets_its_share_after_the_handoff_expires(clock, workers):
+    changes = []
+    a = workers("a", on_change=changes.append)
+    b = workers("b")
+    a.renew()
+    b.renew()
+    assert b.assignment.owned == frozenset()  # everything is still leased to a
+
+    a.renew()  # a sees two members and hands back its surplus
+    assert len(a.assignment.owned) == SHARDS // 2
+    released = frozenset(range(SHARDS)) - a.assignment.owned
+    b.renew()
+    assert b.assignment.owned == frozenset()  # handed-back shards stay blocked for a TTL
+
+    clock.now += TTL / 2
+    a.renew()
+    b.renew()
+    clock.now += TTL / 2 + 1
+    a.renew()
+    b.renew()
+    assert b.assignment.owned == released
+    assert a.assignment.owned.isdisjoint(b.assignment.owned)
+    assert changes == [frozenset(range(SHARDS)), a.assignment.owned]
+    assert a.stats["released"] == SHARDS // 2 and b.stats["acquired"] == SHARDS // 2
+
+
+def test_survivor_takes_over_the_shards_of_a_stopped_worker(clock, workers):
+    a = workers("a")
+    b = workers("b")
+    a.renew()
+    settle(clock, a, b)
+    assert len(a.assignment.owned) == len(b.assignment.owned) == SHARDS // 2
+
+    a.stop(release=False)  # crashed: its leases stay until they expire
+    b.renew()
+    assert len(b.assignment.owned) == SHARDS // 2
+    clock.now += TTL + 1
+    b.renew()
+    assert b.assignment.owned == frozenset(range(SHARDS))
+
+
+def test_released_shards_are_free_at_once(clock, workers):
+    a = workers("a")
+    b = workers("b")
+    a.renew()
+    a.stop(release=True)
+    assert a.assignment.owned == frozenset()
+    b.renew()
+    assert b.assignment.owned == frozenset(range(SHARDS))
+
+
+def test_lost_lease_leaves_the_owned_set(clock, workers):
+    a = workers("a")
+    b = workers("b")
+    a.renew()
+    clock.now += TTL + 1  # a missed its renewals and b took over
+    b.renew()
+    assert b.assignment.owned == frozenset(range(SHARDS))
+    a.renew()
+    assert a.assignment.owned.isdisjoint(b.assignment.owned)
+    assert a.stats["lost"] == SHARDS
+
+
+def test_filesystem_type_uses_the_longest_mount_point(tmp_path):
+    mounts = tmp_path / "mounts"
+    mounts.write_text("/dev/root / ext4 rw 0 0\n"
+                      "server:/export /mnt/shared nfs4 rw 0 0\n"
+                      "server:/other /mnt/shared\\040two nfs rw 0 0\n")
+    assert sharding.filesystem_type("/mnt/shared/leases.db", str(mounts)) == "nfs4"
+    assert sharding.filesystem_type("/mnt/shared two/leases.db", str(mounts)) == "nfs"
+    assert sharding.filesystem_type("/mnt/sharedfoo/leases.db", str(mounts)) == "ext4"
+    assert sharding.filesystem_type("/var/lib/leases.db", str(tmp_path / "missing")) is None
+
+
+def test_lease_file_on_a_network_filesystem_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "filesystem_type", lambda path: "nfs4")
+    with pytest.raises(ValueError, match="local disk"):
+        ShardLeases(str(tmp_path / "leases.db"), "a", ShardAssignment(ShardRing(SHARDS)))
@@ -0,0 +1,136 @@
+import base64
+import threading
+import time
+
+import pytest
+
+from subscriptions import JobSubscriber, ws_url_from_http
+
+
+def subscriber():
+    accounts, events = [], []
+    sub = JobSubscriber("ws://localhost:8900", "Prog",
+                        on_account=lambda pubkey, data, slot: accounts.append((pubkey, data, slot)),
+                        on_event=lambda data, slot: events.append((data, slot)))
+    return sub, accounts, events
+
+
+def deliver(sub):
+    while sub._deliver(None):
+        pass
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def notification(method, value, slot=7):
+    return {"jsonrpc": "2.0", "method": method,
+            "params": {"result": {"context": {"slot": slot}, "value": value}, "subscription": 1}}
+
+
+def test_ws_url_from_http():
+    assert ws_url_from_http(None) == "ws://localhost:8900"
+    assert ws_url_from_http("http://127.0.0.1:8899/") == "ws://127.0.0.1:8900"
+    assert ws_url_from_http("http://rpc.internal:9000") == "ws://rpc.internal:9000"
+    assert ws_url_from_http("https://api.devnet.solana.com") == "wss://api.devnet.solana.com"
+    assert ws_url_from_http("wss://custom") == "wss://custom"
+
+
+def test_account_notifications_reach_on_account():
+    sub, accounts, _ = subscriber()
+    data = base64.b64encode(b"\x01\x02").decode()
+    sub._dispatch(notification("programNotification", {"pubkey": "Job1", "account": {"data": [data, "base64"]}}))
+    sub._dispatch(notification("programNotification", {"pubkey": "Job2", "account": {"data": data}}, slot=8))
+    assert accounts == []  # callbacks run on the delivery thread, not the socket's
+    deliver(sub)
+    assert accounts == [("Job1", b"\x01\x02", 7), ("Job2", b"\x01\x02", 8)]
+    assert sub.notifications == 2
+
+
+def test_program_data_logs_of_successful_transactions_reach_on_event():
+    sub, _, events = subscriber()
+    event = base64.b64encode(b"event").decode()
+    logs = ["Program Prog invoke [1]", f"Program data: {event}", "Program Prog success"]
+    sub._dispatch(notification("logsNotification", {"signature": "s1", "err": None, "logs": logs}))
+    sub._dispatch(notification("logsNotification", {"signature": "s2", "err": {"Custom": 1}, "logs": logs}))
+    deliver(sub)
+    assert events == [(b"event", 7)]
+
+
+def test_other_and_malformed_messages_are_ignored():
+    sub, accounts, events = subscriber()
+    sub._dispatch({"jsonrpc": "2.0", "result": 5, "id": 1})
+    sub._dispatch(notification("programNotification", {"pubkey": "Job1"}))
+    deliver(sub)
+    assert accounts == [] and events == []
+    assert sub.notifications == 1
+
+
+def test_full_notification_queue_drops_instead_of_blocking():
+    sub = JobSubscriber("ws://localhost:8900", "Prog", on_account=lambda *args: None, max_pending=2)
+    data = base64.b64encode(b"x").decode()
+    for i in range(5):
+        sub._dispatch(notification("programNotification", {"pubkey": f"Job{i}", "account": {"data": data}}))
+    assert sub.notifications == 5 and sub.dropped == 3
+
+
+@pytest.fixture
+def node():
+    pytest.importorskip("solders")
+    pytest.importorskip("websockets")
+    from fakes import FakeSolanaWS
+
+    node = FakeSolanaWS().start()
+    yield node
+    node.stop()
+
+
+def test_slow_callbacks_do_not_stall_the_socket(node):
+    release = threading.Event()
+    accounts, events = [], []
+
+    def on_account(pubkey, data, slot):
+        accounts.append((pubkey, data, slot))
+        release.wait(10)  # a slow RPC call or a full pipeline
+
+    sub = JobSubscriber(node.url, "Prog", on_account, lambda data, slot: events.append((data, slot)))
+    sub.start()
+    try:
+        assert sub.connected.wait(5) and wait_until(lambda: node.subscribed() == 1)
+        assert [r["method"] for r in node.requests] == ["programSubscribe", "logsSubscribe"]
+        node.push_account("Job0", b"\x00", slot=10)
+        assert wait_until(lambda: len(accounts) == 1)
+        for i in range(1, 4):
+            node.push_account(f"Job{i}", bytes([i]), slot=10 + i)
+        node.push_logs(["Program data: " + base64.b64encode(b"created").decode()], slot=20)
+        # The receive loop keeps reading while the first callback is still blocked
+        assert wait_until(lambda: sub.notifications == 5)
+        assert len(accounts) == 1 and sub.connected.is_set()
+        release.set()
+        assert wait_until(lambda: len(accounts) == 4 and len(events) == 1)
+    finally:
+        release.set()
+        sub.stop()
+    assert [pubkey for pubkey, _, _ in accounts] == ["Job0", "Job1", "Job2", "Job3"]
+    assert accounts[3] == ("Job3", b"\x03", 13) and events == [(b"created", 20)]
+
+
+def test_subscriber_reconnects_after_the_node_drops_it(node):
+    accounts = []
+    sub = JobSubscriber(node.url, "Prog", lambda pubkey, data, slot: accounts.append(pubkey))
+    sub.start()
+    try:
+        assert wait_until(lambda: node.subscribed() == 1)
+        node.drop()
+        assert wait_until(lambda: node.connections == 2 and node.subscribed() == 1)
+        assert sub.connected.wait(5) and sub.reconnects == 1
+        node.push_account("Job1", b"\x01")
+        assert wait_until(lambda: accounts == ["Job1"])
+    finally:
+        sub.stop()